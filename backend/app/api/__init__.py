@@ -24,6 +24,7 @@ from .auth import router as auth_router
 from .backup import router as backup_router
 from .notification import router as notification_router
 from .terminal import router as terminal_router
+from .jobs import router as jobs_router
 from app.modules.image_builder import router as image_builder_router
 
 router = APIRouter()
@@ -53,6 +54,7 @@ router.include_router(navigation_router, prefix="/navigation", tags=["Navigation
 router.include_router(bookmarks_router, prefix="/bookmarks", tags=["Bookmarks"])
 router.include_router(image_builder_router, prefix="/image-builder", tags=["ImageBuilder"])
 router.include_router(ai_lab_router, prefix="/ai", tags=["AILab"])
+router.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
 
 @router.get("/status")
 async def get_status():
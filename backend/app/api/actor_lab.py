@@ -3,7 +3,7 @@ from typing import Dict, Any, List, Optional
 import re
 import time
 from app.core.config_manager import get_config
-from app.utils.http_client import get_async_client
+from app.services.tmdb_client import tmdb_client
 from app.utils.logger import logger, audit_log
 
 router = APIRouter()
@@ -84,74 +84,65 @@ async def analyze_actor(
     if include_translations:
         append_items.append("translations")
         
-    url = f"https://api.themoviedb.org/3/person/{person_id}"
-    params = {
-        "api_key": tmdb_key,
-        "append_to_response": ",".join(append_items)
-    }
-    if language:
-        params["language"] = language
+    params = {"append_to_response": ",".join(append_items)}
 
     try:
-        async with get_async_client(use_proxy=True) as client:
-            resp = await client.get(url, params=params)
-            if resp.status_code != 200:
-                raise HTTPException(status_code=resp.status_code, detail="TMDB API 请求失败")
-            
-            data = resp.json()
-            
-            # 1. 提取姓名
-            main_name = data.get('name', '未知')
-            origin_name = get_origin_name_smart(data)
-            
-            # 2. 提取中文名
-            chinese_name = main_name
-            for t in data.get('translations', {}).get('translations', []):
-                if t.get('iso_639_1') in ['zh', 'cn']:
-                    name = t.get('data', {}).get('name')
-                    if name:
-                        chinese_name = name
-                        break
-            
-            # 3. 整理姓名池
-            name_pool = {main_name, origin_name, chinese_name}
-            for aka in data.get('also_known_as', []):
-                name_pool.add(aka)
-            
-            # 4. 整理代表作
-            credits = data.get('combined_credits', {}).get('cast', [])
-            credits.sort(key=lambda x: x.get('vote_count', 0), reverse=True)
-            top_works = []
-            for w in credits[:12]:
-                top_works.append({
-                    "id": w.get('id'),
-                    "title": w.get('title') or w.get('name'),
-                    "original_title": w.get('original_title') or w.get('original_name'),
-                    "release_date": w.get('release_date') or w.get('first_air_date'),
-                    "media_type": w.get('media_type'),
-                    "poster_path": w.get('poster_path'),
-                    "vote_average": w.get('vote_average')
-                })
+        status_code, data = await tmdb_client.request(f"/person/{person_id}", params, language=language, api_key=tmdb_key)
+        if status_code != 200:
+            raise HTTPException(status_code=status_code or 502, detail="TMDB API 请求失败")
+        
+        # 1. 提取姓名
+        main_name = data.get('name', '未知')
+        origin_name = get_origin_name_smart(data)
+        
+        # 2. 提取中文名
+        chinese_name = main_name
+        for t in data.get('translations', {}).get('translations', []):
+            if t.get('iso_639_1') in ['zh', 'cn']:
+                name = t.get('data', {}).get('name')
+                if name:
+                    chinese_name = name
+                    break
+        
+        # 3. 整理姓名池
+        name_pool = {main_name, origin_name, chinese_name}
+        for aka in data.get('also_known_as', []):
+            name_pool.add(aka)
+        
+        # 4. 整理代表作
+        credits = data.get('combined_credits', {}).get('cast', [])
+        credits.sort(key=lambda x: x.get('vote_count', 0), reverse=True)
+        top_works = []
+        for w in credits[:12]:
+            top_works.append({
+                "id": w.get('id'),
+                "title": w.get('title') or w.get('name'),
+                "original_title": w.get('original_title') or w.get('original_name'),
+                "release_date": w.get('release_date') or w.get('first_air_date'),
+                "media_type": w.get('media_type'),
+                "poster_path": w.get('poster_path'),
+                "vote_average": w.get('vote_average')
+            })
 
-            result = {
-                "id": data.get('id'),
-                "main_name": main_name,
-                "origin_name": origin_name,
-                "chinese_name": chinese_name,
-                "place_of_birth": data.get('place_of_birth'),
-                "birthday": data.get('birthday'),
-                "deathday": data.get('deathday'),
-                "biography": data.get('biography'),
-                "profile_path": data.get('profile_path'),
-                "imdb_id": data.get('external_ids', {}).get('imdb_id'),
-                "name_pool": sorted(list(name_pool)),
-                "top_works": top_works,
-                "raw": data
-            }
-            
-            audit_log("演员深度分析完成", (time.time() - start_time) * 1000, [f"ID: {person_id}", f"原名: {origin_name}"])
-            return result
-            
+        result = {
+            "id": data.get('id'),
+            "main_name": main_name,
+            "origin_name": origin_name,
+            "chinese_name": chinese_name,
+            "place_of_birth": data.get('place_of_birth'),
+            "birthday": data.get('birthday'),
+            "deathday": data.get('deathday'),
+            "biography": data.get('biography'),
+            "profile_path": data.get('profile_path'),
+            "imdb_id": data.get('external_ids', {}).get('imdb_id'),
+            "name_pool": sorted(list(name_pool)),
+            "top_works": top_works,
+            "raw": data
+        }
+        
+        audit_log("演员深度分析完成", (time.time() - start_time) * 1000, [f"ID: {person_id}", f"原名: {origin_name}"])
+        return result
+        
     except Exception as e:
         logger.error(f"❌ 演员分析异常: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -7,7 +7,7 @@ from app.db.session import get_db
 from app.core.config_manager import get_config
 from app.services.emby import EmbyService, get_emby_service
 from app.utils.logger import logger, audit_log
-from app.utils.http_client import get_async_client
+from app.services.tmdb_client import tmdb_client
 
 router = APIRouter()
 
@@ -23,13 +23,9 @@ async def get_emby_context():
 async def fetch_tmdb_data(tmdb_key: str, path: str, params: Dict = None):
     if not tmdb_key:
         raise HTTPException(status_code=400, detail="未配置 TMDB API Key")
-    url = f"https://api.themoviedb.org/3{path}"
-    base_params = {"api_key": tmdb_key, "language": "zh-CN"}
-    if params:
-        base_params.update(params)
-    async with get_async_client(timeout=20.0) as client:
-        resp = await client.get(url, params=base_params)
-        return resp.json() if resp.status_code == 200 else None
+    query = dict(params or {})
+    language = query.pop("language", "zh-CN")
+    return await tmdb_client.get_json(path, query, language=language, api_key=tmdb_key)
 
 # --- 演员管理 API 实装 ---
 
@@ -0,0 +1,200 @@
+import time
+import asyncio
+from typing import List, Dict, Any, Optional, Set
+from app.core.tagger import Tagger
+from app.services.tmdb_client import tmdb_client
+from app.services.autotag_fingerprint import AutotagFingerprintStore
+from app.utils.logger import logger
+from .autotag_helper import AutotagEmbyHelper
+
+DEFAULT_STAGE_CONCURRENCY = {"tmdb": 8, "emby_write": 4}
+
+def build_tag_props(details: Dict[str, Any], item_type: str) -> Dict[str, Any]:
+    """TMDB 详情 -> Tagger 匹配属性 (国家使用 ISO 代码，流派使用 ID)"""
+    genre_ids = [str(g["id"]) for g in details.get("genres", [])]
+    countries = [c.upper() for c in details.get("origin_country", [])]
+    year_str = details.get("release_date") or details.get("first_air_date") or "0000"
+    year = int(year_str[:4]) if year_str[:4].isdigit() else 0
+    return {"countries": countries, "genre_names": genre_ids, "year": year, "type": item_type}
+
+def resolve_final_tags(original: List[str], target: List[str], mode: str) -> List[str]:
+    if mode == 'merge':
+        return sorted(set(original) | set(target))
+    return sorted(set(target))
+
+class AutotagProgress:
+    """自动标签任务进度 (供 /autotags/progress 轮询)"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self, total: int = 0, running: bool = False):
+        self.running = running
+        self.phase = "idle"
+        self.total = total
+        self.processed = 0
+        self.skipped = 0
+        self.fingerprint_hits = 0
+        self.unchanged = 0
+        self.to_write = 0
+        self.updated = 0
+        self.failed = 0
+        self.started_at = time.time() if running else None
+        self.finished_at = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.processed, 0)
+        return {
+            "running": self.running,
+            "phase": self.phase,
+            "total": self.total,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "fingerprint_hits": self.fingerprint_hits,
+            "unchanged": self.unchanged,
+            "to_write": self.to_write,
+            "updated": self.updated,
+            "failed": self.failed,
+            "percent": round(self.processed / self.total * 100, 1) if self.total else 0.0,
+            "elapsed_seconds": round(elapsed, 1),
+            "items_per_sec": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if self.running and rate > 0 else None
+        }
+
+autotag_progress = AutotagProgress()
+
+class AutotagPipeline:
+    """
+    流水线式自动标签执行器:
+    列表 (一次请求，带 Tags) -> TMDB 详情 + 规则计算 (并发 tmdb 个 worker)
+    -> 仅对标签集合实际变化的项目写回 Emby (并发 emby_write 个 worker)。
+    Emby 没有批量更新条目的接口，写回阶段以有界并发代替逐条串行；
+    写回前 helper 会再读取一次完整详情，防止列表数据过时导致误写。
+    传入 fingerprints 时，TMDB ID 与规则均未变化且指纹未超龄的项目直接复用上次的规则产出，不再请求 TMDB。
+    """
+    def __init__(self, helper: AutotagEmbyHelper, tagger: Tagger, tmdb_key: str, mode: str = 'merge',
+                 custom_tags: Optional[List[str]] = None, concurrency: Optional[Dict[str, int]] = None,
+                 progress: AutotagProgress = autotag_progress,
+                 fingerprints: Optional[AutotagFingerprintStore] = None, force_full: bool = False,
+                 cancel_event: Optional[asyncio.Event] = None):
+        self.helper = helper
+        self.tagger = tagger
+        self.tmdb_key = tmdb_key
+        self.mode = mode
+        self.custom_tags = custom_tags
+        cfg = {**DEFAULT_STAGE_CONCURRENCY, **(concurrency or {})}
+        self.tmdb_workers = max(1, int(cfg["tmdb"]))
+        self.write_workers = max(1, int(cfg["emby_write"]))
+        self.progress = progress
+        # 自定义标签不依赖 TMDB，指纹没有意义
+        self.fingerprints = None if custom_tags else fingerprints
+        self.force_full = force_full
+        # 取消令牌：置位后不再评估新项目，已入队的写入照常完成
+        self.cancel_event = cancel_event
+
+    @property
+    def cancelled(self) -> bool:
+        return bool(self.cancel_event and self.cancel_event.is_set())
+
+    async def _target_tags(self, item: Dict[str, Any]) -> Optional[List[str]]:
+        if self.custom_tags:
+            # 自定义标签与 TMDB 元数据无关，无需请求详情
+            return list(self.custom_tags)
+        tmdb_id = item.get("ProviderIds", {}).get("Tmdb")
+        if self.fingerprints and not self.force_full:
+            cached = self.fingerprints.lookup(item["Id"], tmdb_id)
+            if cached is not None:
+                self.progress.fingerprint_hits += 1
+                return cached
+        m_type = "movie" if item.get("Type") == "Movie" else "tv"
+        details = await tmdb_client.get_json(f"/{m_type}/{tmdb_id}", language="zh-CN", api_key=self.tmdb_key)
+        if not details:
+            return None
+        props = build_tag_props(details, item.get("Type"))
+        tags = self.tagger.generate_tags(props)
+        if self.fingerprints:
+            await self.fingerprints.record(item["Id"], tmdb_id, tags)
+        return tags
+
+    async def _evaluate(self, item: Dict[str, Any], write_queue: asyncio.Queue):
+        p = self.progress
+        item_name = item.get("Name", "Unknown")
+        try:
+            if not item.get("ProviderIds", {}).get("Tmdb"):
+                p.skipped += 1
+                return
+            target_tags = await self._target_tags(item)
+            if target_tags is None:
+                logger.warning(f"┃  ┃  ⚠️ 跳过: 无法获取 TMDB 详情 [{item_name}]")
+                p.skipped += 1
+                return
+            if not target_tags:
+                p.skipped += 1
+                return
+            original = self.helper._extract_tags(item)
+            if resolve_final_tags(original, target_tags, self.mode) == sorted(set(original)):
+                p.unchanged += 1
+                return
+            p.to_write += 1
+            await write_queue.put((item, target_tags))
+        except Exception as e:
+            p.failed += 1
+            logger.error(f"┃  ┃  ❌ 处理出错 [{item_name}]: {str(e)}")
+        finally:
+            p.processed += 1
+            if p.processed % 50 == 0 or p.processed == p.total:
+                snap = p.snapshot()
+                logger.info(f"┃  🕒 自动标签进度: {p.processed}/{p.total} (待写入 {p.to_write}, 已写入 {p.updated}, ETA {snap['eta_seconds']}s)")
+
+    async def _write(self, item: Dict[str, Any], target_tags: List[str]):
+        p = self.progress
+        item_name = item.get("Name", "Unknown")
+        try:
+            logger.info(f"┃  ┃  🎯 [匹配] {item_name} 目标标签: {target_tags}")
+            if await self.helper.update_item_metadata(item["Id"], target_tags, self.mode):
+                p.updated += 1
+            else:
+                p.failed += 1
+        except Exception as e:
+            p.failed += 1
+            logger.error(f"┃  ┃  ❌ 写入出错 [{item_name}]: {str(e)}")
+
+    async def run(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        p = self.progress
+        p.reset(total=len(items), running=True)
+        p.phase = "processing"
+        pending = iter(items)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.write_workers * 4)
+
+        async def evaluator():
+            for item in pending:
+                if self.cancelled: return
+                await self._evaluate(item, write_queue)
+
+        async def writer():
+            while True:
+                job = await write_queue.get()
+                try:
+                    if job is None: return
+                    await self._write(*job)
+                finally:
+                    write_queue.task_done()
+
+        writers = [asyncio.create_task(writer()) for _ in range(self.write_workers)]
+        try:
+            await asyncio.gather(*[evaluator() for _ in range(min(self.tmdb_workers, max(len(items), 1)))])
+            p.phase = "writing"
+            for _ in writers:
+                await write_queue.put(None)
+            await asyncio.gather(*writers)
+        except BaseException:
+            for w in writers: w.cancel()
+            raise
+        finally:
+            if self.fingerprints:
+                await self.fingerprints.flush()
+            p.running = False
+            p.phase = "cancelled" if self.cancelled else "done"
+            p.finished_at = time.time()
+        return p.snapshot()
@@ -2,14 +2,16 @@ import httpx
 import json
 from typing import List, Dict, Any, Optional, Literal
 from app.utils.logger import logger
-from app.utils.http_client import get_async_client
+from app.utils.http_client import get_shared_client
+from app.utils.concurrency import get_emby_limiter
 from app.core.config_manager import get_config
 
 class AutotagEmbyHelper:
-    def __init__(self, url: str, api_key: str, user_id: str = None):
+    def __init__(self, url: str, api_key: str, user_id: str = None, server_id: str = None):
         self.url = url.strip().rstrip('/')
         if self.url.endswith('/emby'):
             self.url = self.url[:-5]
+        self.server_id = server_id or self.url
             
         self.api_key = api_key.strip() if api_key else ""
         self.user_id = user_id.strip() if user_id else None
@@ -29,13 +31,15 @@ class AutotagEmbyHelper:
         proxy_cfg = config.get("proxy", {})
         use_proxy = not proxy_cfg.get("exclude_emby", True)
         
-        async with get_async_client(timeout=30.0, headers=self.headers, use_proxy=use_proxy) as client:
-            try:
-                resp = await client.request(method, url, params=query_params, json=json_data)
-                return resp
-            except Exception as e:
-                logger.error(f"┃  ┃  ❌ 通讯异常 ({type(e).__name__}): {str(e)}")
-                return None
+        client = get_shared_client(f"emby:{self.server_id}", use_proxy=use_proxy, timeout=30.0)
+        try:
+            async with get_emby_limiter(self.server_id).slot() as slot:
+                resp = await client.request(method, url, params=query_params, json=json_data, headers=self.headers)
+                slot.observe(resp.status_code)
+            return resp
+        except Exception as e:
+            logger.error(f"┃  ┃  ❌ 通讯异常 ({type(e).__name__}): {str(e)}")
+            return None
 
     def _extract_tags(self, item_data: Dict) -> List[str]:
         """统一 1:1 标签提取逻辑"""
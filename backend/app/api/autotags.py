@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Query
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional, Literal
 from app.core.config_manager import get_config, save_config
 from app.core.tagger import Tagger
 from app.utils.logger import logger, audit_log
 from .autotag_helper import AutotagEmbyHelper
-from app.utils.http_client import get_async_client
+from .autotag_engine import AutotagPipeline, autotag_progress, build_tag_props
+from app.services.autotag_fingerprint import AutotagFingerprintStore
+from app.utils.hashing import stable_hash
+from app.services.webhook_queue import WebhookJobQueue, webhook_emby_server_id
+from app.services.library_cache import LibraryCache
 from app.services.notification_service import NotificationService
+from app.services.job_manager import JobManager, Job
+from app.services.tmdb_client import tmdb_client
 import httpx
 import time
 import uuid
@@ -17,9 +23,6 @@ from app.services.emby import EmbyService, get_emby_service
 
 router = APIRouter()
 
-# --- Webhook 队列与后台处理 ---
-webhook_queue = asyncio.Queue()
-
 # --- 国家/语言映射表 ---
 LANG_TO_COUNTRY = {
     "en": "美国", "zh": "中国大陆", "ja": "日本", "ko": "韩国", "fr": "法国", "de": "德国",
@@ -47,33 +50,23 @@ class TagActionRequest(BaseModel):
     mode: Literal['merge', 'overwrite'] = 'merge'
     library_type: Literal['all', 'favorite'] = 'all'
     custom_tags: Optional[List[str]] = None
+    # 忽略指纹，强制重新评估全部项目
+    force_full: bool = False
 
 async def get_helper(server_id: str = None, emby_id: str = None):
     service = get_emby_service(server_id, emby_id)
     if not service: raise HTTPException(status_code=400, detail="未配置 Emby 服务器")
     config = get_config()
-    return AutotagEmbyHelper(service.url, service.api_key, service.user_id), config
+    return AutotagEmbyHelper(service.url, service.api_key, service.user_id, service.server_id), config
 
 async def fetch_tmdb_details(tmdb_key: str, tmdb_id: str, media_type: str):
-    url = f"https://api.themoviedb.org/3/{media_type}/{tmdb_id}"
-    params = {"api_key": tmdb_key, "language": "zh-CN"}
-    async with get_async_client(timeout=15.0) as client:
-        try:
-            logger.info(f"┃  ┃  🌐 [TMDB] 发起请求: {url}")
-            resp = await client.get(url, params=params)
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                logger.warning(f"┃  ┃  ⚠️ TMDB API 响应异常: {resp.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"┃  ┃  ❌ TMDB 请求失败: {str(e)}")
-            return None
+    """经共享 TMDB 客户端获取详情 (带持久化缓存与限速)"""
+    return await tmdb_client.get_json(f"/{media_type}/{tmdb_id}", language="zh-CN", api_key=tmdb_key)
 
 # --- Webhook 处理核心逻辑 ---
 
 async def process_webhook_item(payload: Dict):
-    """处理来自 Webhook 的单个项目"""
+    """处理来自 Webhook 的单个项目 (由持久化队列在 not_before 到期后调用，抛出异常将按退避策略重试)"""
     config = get_config()
     wh_cfg = config.get("webhook", {})
     if not wh_cfg.get("automation_enabled"): 
@@ -112,8 +105,7 @@ async def process_webhook_item(payload: Dict):
                 item_name = item.get("Name")
                 item_type = item.get("Type")
             else:
-                logger.error(f"┃  ❌ 无法获取所属剧集系列详情: {series_id}")
-                return
+                raise RuntimeError(f"无法获取所属剧集系列详情: {series_id}")
 
     tmdb_id = item.get("ProviderIds", {}).get("Tmdb")
     
@@ -124,12 +116,7 @@ async def process_webhook_item(payload: Dict):
     if item_type not in ["Movie", "Series"]: 
         return
     
-    # 延迟执行，等待 Emby 元数据同步完成
-    delay = wh_cfg.get("delay_seconds", 10)
-    logger.info(f"⏳ [Webhook] 任务启动，等待 {delay}s 以确保 Emby 元数据就绪: {item_name}")
-    await asyncio.sleep(delay)
-    
-    # 2. 执行打标签逻辑
+    # 2. 执行打标签逻辑 (delay_seconds 的等待已由队列的 not_before 完成)
     helper, _ = await get_helper(emby_id=emby_server_id)
     tagger = Tagger(config.get("autotag_rules", []))
     tmdb_key = config.get("tmdb_api_key")
@@ -138,18 +125,12 @@ async def process_webhook_item(payload: Dict):
     logger.info(f"┃  ┣ 🌐 [Webhook TMDB] 正在获取详情: {item_name} (TMDB ID: {tmdb_id})")
     details = await fetch_tmdb_details(tmdb_key, tmdb_id, m_type)
     if not details: 
-        logger.error(f"┃  ┃  ❌ [Webhook TMDB] 获取详情失败: {item_name}")
-        return
+        raise RuntimeError(f"[Webhook TMDB] 获取详情失败: {item_name}")
     
     # 元数据解析
-    genre_ids = [str(g["id"]) for g in details.get("genres", [])]
     genre_names = [g["name"] for g in details.get("genres", [])]
-    countries = [c.upper() for c in details.get("origin_country", [])]
-    
-    year_str = details.get("release_date") or details.get("first_air_date") or "0000"
-    year = int(year_str[:4]) if year_str else 0
-    
-    props = {"countries": countries, "genre_names": genre_ids, "year": year, "type": item_type}
+    props = build_tag_props(details, item_type)
+    countries, genre_ids, year = props["countries"], props["genre_names"], props["year"]
     
     log_countries = [COUNTRY_CODE_TO_NAME.get(c, c) for c in countries]
     logger.info(f"┃  ┃  📋 [Webhook 元数据] 国家: {log_countries} ({countries}) | 类型: {genre_names} ({genre_ids}) | 年份: {year}")
@@ -164,94 +145,68 @@ async def process_webhook_item(payload: Dict):
                 title="[Webhook 自动化] 标签匹配成功",
                 message=f"项目: {item_name}\n类型: {item_type}\n匹配标签: {', '.join(target_tags)}"
             )
+        else:
+            raise RuntimeError(f"写入 Emby 标签失败: {item_name}")
     else:
         logger.info(f"┃  ┃  🟡 [Webhook 跳过] 无规则匹配: {item_name}")
 
-async def webhook_worker():
-    """无限循环的后台 Webhook 消费者"""
-    logger.info("📡 [Webhook] 自动标签后台监听已启动")
-    while True:
-        payload = await webhook_queue.get()
-        try:
-            await process_webhook_item(payload)
-        except Exception as e:
-            logger.error(f"❌ [Webhook] 处理失败: {e}")
-        finally:
-            webhook_queue.task_done()
+async def start_webhook_workers():
+    """启动持久化 Webhook 队列的 worker 池 (应用启动时调用)"""
+    await WebhookJobQueue.start(process_webhook_item)
 
 # --- 任务执行流 ---
 
-async def run_autotag_task_isolated(request: TagActionRequest):
+async def run_autotag_task_isolated(request: TagActionRequest, job: Optional[Job] = None):
+    start_time = time.time()
     helper, config = await get_helper()
     tagger = Tagger(config.get("autotag_rules", []))
     tmdb_key = config.get("tmdb_api_key")
     logger.info(f"🚀 [自动标签] 任务启动...")
+    autotag_progress.reset(running=True)
+    autotag_progress.phase = "listing"
+    if job:
+        job.bind_progress(lambda: {**autotag_progress.snapshot(), "done": autotag_progress.processed})
     
-    all_items = await helper.get_all_items()
-    if request.library_type == 'favorite': 
-        all_items = [i for i in all_items if i.get("UserData", {}).get("IsFavorite")]
-        logger.info(f"┃  ⭐ 已过滤仅限收藏项目，待处理数量: {len(all_items)}")
-    else:
-        logger.info(f"┃  📦 待处理总数: {len(all_items)}")
+    try:
+        all_items = await helper.get_all_items()
+        if request.library_type == 'favorite': 
+            all_items = [i for i in all_items if i.get("UserData", {}).get("IsFavorite")]
+            logger.info(f"┃  ⭐ 已过滤仅限收藏项目，待处理数量: {len(all_items)}")
+        else:
+            logger.info(f"┃  📦 待处理总数: {len(all_items)}")
 
-    updated = 0
-    for i, item in enumerate(all_items):
-        item_name = item.get("Name", "Unknown")
-        item_id = item.get("Id")
-        try:
-            tmdb_id = item.get("ProviderIds", {}).get("Tmdb")
-            if not tmdb_id:
-                logger.info(f"┃  🕒 [{i+1}/{len(all_items)}] 跳过 (无 TMDB ID): {item_name}")
-                continue
-            
-            logger.info(f"┃  🕒 [{i+1}/{len(all_items)}] 正在处理: {item_name}")
-            
-            m_type = "movie" if item.get("Type") == "Movie" else "tv"
-            details = await fetch_tmdb_details(tmdb_key, tmdb_id, m_type)
-            if not details:
-                logger.warning(f"┃  ┃  ⚠️ 跳过: 无法获取 TMDB 详情")
-                continue
-
-            # --- 元数据解析 ---
-            genre_ids = [str(g["id"]) for g in details.get("genres", [])]
-            genre_names = [g["name"] for g in details.get("genres", [])]
-            
-            # 国家：直接使用 ISO 代码进行匹配
-            countries = [c.upper() for c in details.get("origin_country", [])]
-            
-            # 如果没有国家代码，尝试从原始语言映射（作为兜底）
-            if not countries:
-                lang = details.get("original_language")
-                # 这里依然可以用映射，但存入 props 的应该是代码
-                # 为了简化，我们直接用 details 里的原始数据
-                pass
-
-            year_str = details.get("release_date") or details.get("first_air_date") or "0000"
-            year = int(year_str[:4]) if year_str else 0
-            
-            # props 现在存储 ID 和 CODE
-            props = {"countries": countries, "genre_names": genre_ids, "year": year, "type": item.get("Type")}
-            
-            # 日志输出：转换回中文方便人类阅读
-            log_countries = [COUNTRY_CODE_TO_NAME.get(c, c) for c in countries]
-            logger.info(f"┃  ┃  📋 [元数据] 国家: {log_countries} ({countries}) | 类型: {genre_names} ({genre_ids}) | 年份: {year}")
-            
-            target_tags = request.custom_tags if request.custom_tags else tagger.generate_tags(props)
-            
-            if target_tags:
-                logger.info(f"┃  ┃  🎯 [匹配] 目标标签: {target_tags}")
-                if await helper.update_item_metadata(item_id, target_tags, request.mode): 
-                    updated += 1
-            else:
-                logger.info(f"┃  ┃  🟡 [跳过] 无规则匹配")
-
-        except Exception as e:
-            logger.error(f"┃  ┃  ❌ 处理出错 [{item_name}]: {str(e)}")
-        
-        # 强制小休，避免请求过快
-        if i % 5 == 0: await asyncio.sleep(0.1)
-        
-    logger.info(f"✅ [自动标签] 完成，更新: {updated}")
+        fingerprints = AutotagFingerprintStore(
+            helper.server_id, stable_hash(config.get("autotag_rules", [])),
+            config.get("autotag_fingerprint_max_age_hours", 168)
+        )
+        if not request.custom_tags and not request.force_full:
+            logger.info(f"┃  🧬 已载入自动标签指纹: {await fingerprints.load()} 条")
+        pipeline = AutotagPipeline(
+            helper, tagger, tmdb_key, mode=request.mode, custom_tags=request.custom_tags,
+            concurrency=config.get("autotag_concurrency"),
+            fingerprints=fingerprints, force_full=request.force_full,
+            cancel_event=job.cancel_event if job else None
+        )
+        result = await pipeline.run(all_items)
+    except Exception as e:
+        autotag_progress.running = False
+        autotag_progress.phase = "failed"
+        logger.error(f"❌ [自动标签] 任务失败: {str(e)}")
+        if job: raise
+        return
+    if pipeline.cancelled:
+        logger.warning(f"⏹️ [自动标签] 任务已取消，已处理 {result['processed']}/{result['total']}，已写入 {result['updated']}")
+        return result
+    
+    updated = result["updated"]
+    audit_log("自动标签任务完成", (time.time() - start_time) * 1000, [
+        f"扫描总数: {result['total']}",
+        f"标签无变动: {result['unchanged']}",
+        f"跳过: {result['skipped']}",
+        f"指纹命中: {result['fingerprint_hits']}{' (强制全量)' if request.force_full else ''}",
+        f"更新项目: {updated}",
+        f"失败: {result['failed']}"
+    ])
     
     # 发送任务完成通知
     await NotificationService.emit(
@@ -259,15 +214,20 @@ async def run_autotag_task_isolated(request: TagActionRequest):
         title="自动标签任务完成",
         message=f"范围: {'仅收藏' if request.library_type == 'favorite' else '全库'}\n扫描总数: {len(all_items)}\n更新项目: {updated}"
     )
+    return result
 
-async def run_clear_task_isolated(tags_to_remove: Optional[List[str]] = None):
+async def run_clear_task_isolated(tags_to_remove: Optional[List[str]] = None, job: Optional[Job] = None):
     helper, _ = await get_helper()
     logger.warning(f"🔥 [标签清理] 启动")
     all_items = await helper.get_all_items()
     logger.info(f"┃  📦 扫描完成，待处理项目数: {len(all_items)}")
+    if job: job.update(total=len(all_items), phase="clearing")
     
     cleared = 0
     for i, item in enumerate(all_items):
+        if job and job.cancel_requested:
+            logger.warning(f"⏹️ [标签清理] 任务已取消，已处理 {i}/{len(all_items)}，影响项目数: {cleared}")
+            return {"total": len(all_items), "processed": i, "cleared": cleared}
         item_name = item.get("Name", "Unknown")
         try:
             if tags_to_remove is None:
@@ -281,6 +241,7 @@ async def run_clear_task_isolated(tags_to_remove: Optional[List[str]] = None):
         except Exception as e:
             logger.error(f"┃  ┃  ❌ 清理出错 [{item_name}]: {str(e)}")
             
+        if job: job.update(done=i + 1, cleared=cleared)
         if i > 0 and i % 50 == 0:
             logger.info(f"┃  🕒 清理进度: {i}/{len(all_items)}...")
             
@@ -292,6 +253,7 @@ async def run_clear_task_isolated(tags_to_remove: Optional[List[str]] = None):
         title="标签清理任务完成",
         message=f"清理范围: {'全量' if tags_to_remove is None else ', '.join(tags_to_remove)}\n影响项目: {cleared}"
     )
+    return {"total": len(all_items), "processed": len(all_items), "cleared": cleared}
 
 # --- 路由接口 ---
 
@@ -317,12 +279,17 @@ async def receive_webhook(token: str, payload: Dict = Body(...)):
         logger.error(f"┃  ❌ 提供的 Token ({token}) 与配置不匹配")
         raise HTTPException(status_code=401, detail="Invalid token")
     
+    LibraryCache.invalidate_for_event(event, webhook_emby_server_id(payload))
+    
     # 扩大匹配范围，记录下具体被忽略的原因
     target_events = ["item.added", "ItemAdded", "LibraryChanged", "library.new"]
     if event in target_events:
-        logger.info(f"┃  ✅ 命中目标事件，已入队等待处理...")
-        await webhook_queue.put(payload)
-        return {"status": "queued"}
+        result = await WebhookJobQueue.enqueue(payload, event)
+        if result["deduplicated"]:
+            logger.info(f"┃  🔁 同一实体已有待处理任务 (#{result['job_id']})，已合并 (累计 {result['event_count']} 个事件)")
+        else:
+            logger.info(f"┃  ✅ 命中目标事件，已入队等待处理 (#{result['job_id']})...")
+        return {"status": "queued", **result}
     
     logger.info(f"┃  🟡 忽略非自动化目标事件: {event}")
     return {"status": "ignored", "event": event}
@@ -337,25 +304,54 @@ async def save_rules(rules: List[AutoTagRule]):
     save_config(config)
     return {"message": "ok"}
 
+@router.get("/rules/benchmark", summary="规则匹配微基准 (预编译索引 vs 逐条匹配)")
+async def benchmark_rules(samples: int = Query(20000, ge=100, le=200000)):
+    tagger = Tagger(get_config().get("autotag_rules", []))
+    # 纯 CPU 计算，放到线程中避免阻塞事件循环
+    return await asyncio.to_thread(tagger.benchmark, samples)
+
 @router.post("/test-write")
 async def test_tag_write(item_id: str = Body(..., embed=True), tag: str = Body(..., embed=True)):
     helper, _ = await get_helper()
     return {"success": await helper.update_item_metadata(item_id, [tag], mode='merge')}
 
 @router.post("/execute")
-async def execute_task(request: TagActionRequest, background_tasks: BackgroundTasks):
-    background_tasks.add_task(run_autotag_task_isolated, request)
-    return {"message": "ok"}
+async def execute_task(request: TagActionRequest):
+    """单飞执行：已有任务在运行时直接返回该任务 (deduplicated=true)"""
+    job, created = JobManager.submit(
+        "autotag", lambda job: run_autotag_task_isolated(request, job),
+        title="自动标签", params=request.dict()
+    )
+    if created:
+        autotag_progress.reset(running=True)
+    return {"message": "ok", "job_id": job.id, "deduplicated": not created}
+
+@router.get("/progress", summary="自动标签任务进度 (含 ETA)")
+async def get_progress():
+    return autotag_progress.snapshot()
+
+def _submit_clear(tags: Optional[List[str]]):
+    job, created = JobManager.submit(
+        "autotag_clear", lambda job: run_clear_task_isolated(tags, job),
+        title="标签清理", params={"tags": tags}
+    )
+    return {"message": "ok", "job_id": job.id, "deduplicated": not created}
 
 @router.post("/clear-all")
-async def clear_all(background_tasks: BackgroundTasks):
-    background_tasks.add_task(run_clear_task_isolated, None)
-    return {"message": "ok"}
+async def clear_all():
+    return _submit_clear(None)
 
 @router.post("/clear-specific")
-async def clear_specific(tags: List[str] = Body(..., embed=True), background_tasks: BackgroundTasks = None):
-    background_tasks.add_task(run_clear_task_isolated, tags)
-    return {"message": "ok"}
+async def clear_specific(tags: List[str] = Body(..., embed=True)):
+    return _submit_clear(tags)
+
+@router.get("/webhook-queue", summary="Webhook 任务队列状态 (深度/积压时延)")
+async def get_webhook_queue_status():
+    return await WebhookJobQueue.status()
+
+@router.delete("/webhook-queue/failed", summary="清空已放弃的 Webhook 任务")
+async def clear_failed_webhook_jobs():
+    return {"deleted": await WebhookJobQueue.clear_failed()}
 
 @router.get("/webhook-config")
 async def get_wh_config():
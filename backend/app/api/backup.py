@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Dict, Any, Optional
 from app.core.config_manager import get_config, save_config
 from app.services.backup_service import BackupService
@@ -66,16 +66,16 @@ async def delete_task(task_id: str):
     return {"message": "Task deleted"}
 
 @router.post("/tasks/{task_id}/run")
-async def run_task(task_id: str, background_tasks: BackgroundTasks):
+async def run_task(task_id: str):
     # 手动触发执行
-    background_tasks.add_task(BackupService.run_backup_task, task_id)
-    return {"message": "Backup task started in background"}
+    job = BackupService.enqueue_backup(task_id)
+    return {"message": "Backup task started in background", "job_id": job.id}
 
 @router.post("/history/{history_id}/restore")
-async def restore_backup(history_id: int, background_tasks: BackgroundTasks, clear_dst: bool = False):
+async def restore_backup(history_id: int, clear_dst: bool = False):
     # 改为后台执行，立即返回
-    background_tasks.add_task(BackupService.run_restore_task, history_id, clear_dst)
-    return {"message": "还原任务已在后台启动"}
+    job = BackupService.enqueue_restore(history_id, clear_dst)
+    return {"message": "还原任务已在后台启动", "job_id": job.id}
 
 @router.get("/history", response_model=List[BackupHistorySchema])
 async def get_history(task_id: Optional[str] = None, limit: int = 50, db: AsyncSession = Depends(get_db)):
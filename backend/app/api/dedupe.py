@@ -1,18 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, delete, or_
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from app.db.session import get_db
-from app.models.media import MediaItem
+from typing import List, Dict, Any, Optional, Literal
+from app.db.session import get_db, AsyncSessionLocal
+from app.models.media import MediaItem, MediaSyncState
 from app.services.emby import EmbyService, get_emby_service
-from app.core.scorer import Scorer
+from app.services.media_sync import MediaSyncService
+from app.services.job_manager import JobManager, Job
+from app.services.smart_select import SmartSelectService
+from app.services.bulk_delete import bulk_delete_items, DEFAULT_DELETE_CONCURRENCY
+from app.services.duplicate_groups import DuplicateGroupService, LEAN_COLUMNS
+from app.services.media_query import (
+    MAX_PAGE_SIZE, FTS_COLUMNS, ROWID, parse_fields, keyset_after, keyset_order, encode_cursor,
+    cached_count, invalidate_item_counts, fts_usable, fts_phrase, fts_matches
+)
 from app.core.config_manager import get_config, save_config
 from app.utils.logger import logger, audit_log
 import time
 import re
 import asyncio
-from collections import defaultdict
 
 router = APIRouter()
 
@@ -36,243 +43,176 @@ class BulkDeleteRequest(BaseModel):
 # --- 接口实现 ---
 
 @router.post("/sync")
-async def sync_media(db: AsyncSession = Depends(get_db)):
-    """同步 Emby 媒体数据，支持 10 并发并行拉取，支持多服务器隔离"""
-    start_time = time.time()
+async def sync_media(mode: Literal["auto", "incremental", "full"] = "auto", strategy: Optional[Literal["flat", "per_series"]] = None):
+    """同步 Emby 媒体数据，支持增量 (DateLastSaved 水位线) 与全量重建，支持多服务器隔离"""
     service = get_emby_service()
     if not service:
         raise HTTPException(status_code=400, detail="未配置 Emby 服务器")
     
     config = get_config()
     active_server_id = config.get("active_server_id")
-    
-    logger.info(f"🚀 [同步] 启动隔离同步引擎 (Server: {active_server_id}, Concurrency: 10)...")
-    
-    unique_items = {} 
-    item_to_series_tmdb = {}
-
-    async def fetch_paged(types, p_id=None):
-        fetched = []
-        limit = 300
-        start = 0
-        while True:
-            params = {
-                "IncludeItemTypes": ",".join(types), "Recursive": "true",
-                "Fields": "Path,ProductionYear,ProviderIds,MediaStreams,DisplayTitle,SortName,ParentId,SeriesId,SeasonId,IndexNumber,ParentIndexNumber",
-                "StartIndex": start, "Limit": limit
-            }
-            if p_id: params["ParentId"] = p_id
-            resp = await service._request("GET", "/Items", params=params)
-            if not resp or resp.status_code != 200: break
-            batch = resp.json().get("Items", [])
-            if not batch: break
-            fetched.extend(batch)
-            if len(batch) < limit: break
-            start += limit
-        return fetched
-
-    # 1. 抓取 Movie 和 Series
-    top_items = await fetch_paged(["Movie", "Series"])
-    for i in top_items:
-        unique_items[i["Id"]] = i
-        if i.get("Type") == "Series":
-            tmdb = i.get("ProviderIds", {}).get("Tmdb")
-            if tmdb: item_to_series_tmdb[i["Id"]] = tmdb
-    
-    # 2. 并行处理剧集子项
-    series_items = [i for i in top_items if i.get("Type") == "Series"]
-    total_series = len(series_items)
-    logger.info(f"┣ 📂 准备并发解析 {total_series} 个剧集的子层级...")
-
-    sem = asyncio.Semaphore(10)
-    processed_count = 0
-
-    async def process_single_series(s_item):
-        nonlocal processed_count
-        async with sem:
-            s_tmdb = item_to_series_tmdb.get(s_item["Id"])
-            children = await fetch_paged(["Season", "Episode"], p_id=s_item["Id"])
-            for child in children:
-                if s_tmdb and not child.get("ProviderIds", {}).get("Tmdb"):
-                    if "ProviderIds" not in child: child["ProviderIds"] = {}
-                    child["ProviderIds"]["Tmdb"] = s_tmdb
-                unique_items[child["Id"]] = child
-            
-            processed_count += 1
-            if processed_count % 20 == 0 or processed_count == total_series:
-                logger.info(f"┃  🕒 同步进度: {processed_count}/{total_series}...")
+    strategy = strategy or config.get("sync_strategy", "flat")
+
+    async def run_sync(job: Job):
+        job.update(phase=mode)
+        # 任务独立于请求生命周期，使用自己的会话
+        try:
+            async with AsyncSessionLocal() as session:
+                return await MediaSyncService(service, active_server_id, strategy, cancel_event=job.cancel_event).run(session, mode)
+        finally:
+            SmartSelectService.invalidate(active_server_id)
+
+    # 同一服务器单飞：重复请求 (无论 mode) 挂到执行中的同步任务上，共享其结果
+    job, created = JobManager.submit(
+        "media_sync", run_sync, key=active_server_id, title="媒体同步",
+        params={"mode": mode, "strategy": strategy}
+    )
+    await JobManager.wait(job)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error or "同步失败")
+    # 同步在提交前检查取消令牌；有结果说明取消请求到达时同步已完整提交
+    if job.status == "cancelled" and job.result is None:
+        raise HTTPException(status_code=409, detail="同步任务已取消，未执行清理与水位推进")
+    return {"message": "ok", **job.result, "job_id": job.id, "shared": not created}
+
+@router.post("/sync/benchmark")
+async def benchmark_sync_strategies():
+    """对比平铺扫描与逐剧集拉取两种策略 (只拉取不写库)"""
+    service = get_emby_service()
+    if not service:
+        raise HTTPException(status_code=400, detail="未配置 Emby 服务器")
+    return {"results": await MediaSyncService.benchmark(service, get_config().get("active_server_id"))}
 
-    await asyncio.gather(*[process_single_series(s) for s in series_items])
-    
-    # 3. 隔离式入库操作
-    logger.info(f"┣ 💾 正在将 {len(unique_items)} 条数据持久化至本地库 (Server: {active_server_id})...")
-    await db.execute(delete(MediaItem).where(MediaItem.server_id == active_server_id))
-    
-    for item_id, item in unique_items.items():
-        v = next((s for s in item.get("MediaStreams", []) if s.get("Type") == "Video"), {})
-        a = next((s for s in item.get("MediaStreams", []) if s.get("Type") == "Audio"), {})
-        
-        s_num = item.get("ParentIndexNumber") if item.get("Type") == "Episode" else item.get("IndexNumber") if item.get("Type") == "Season" else None
-        e_num = item.get("IndexNumber") if item.get("Type") == "Episode" else None
-        p_id = item.get("SeasonId") or item.get("SeriesId") or item.get("ParentId")
-        
-        db.add(MediaItem(
-            id=item["Id"], server_id=active_server_id, name=item.get("Name"), item_type=item.get("Type"),
-            tmdb_id=item.get("ProviderIds", {}).get("Tmdb"), path=item.get("Path"),
-            year=item.get("ProductionYear"), parent_id=p_id,
-            season_num=s_num, episode_num=e_num,
-            display_title=v.get("DisplayTitle", "N/A"), video_codec=v.get("Codec", "N/A"),
-            video_range=v.get("VideoRange", "N/A"), audio_codec=a.get("Codec", "N/A"),
-            raw_data=item
-        ))
-    
-    await db.commit()
-    process_time = (time.time() - start_time) * 1000
-    audit_log("媒体库隔离同步成功", process_time, [
-        f"服务器: {active_server_id}",
-        f"同步条目数: {len(unique_items)}"
-    ])
-    logger.info(f"✅ [同步] 完成，总耗时: {int(process_time/1000)}s")
-    return {"message": "ok"}
+@router.get("/sync/state")
+async def get_sync_state(db: AsyncSession = Depends(get_db)):
+    """获取当前服务器的同步水位线"""
+    active_server_id = get_config().get("active_server_id")
+    res = await db.execute(select(MediaSyncState).where(MediaSyncState.server_id == active_server_id))
+    return res.scalars().first() or {"server_id": active_server_id, "high_water_mark": None}
 
 @router.get("/items")
-async def get_all_items(query_text: Optional[str] = None, item_type: Optional[str] = None, parent_id: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+async def get_all_items(
+    query_text: Optional[str] = None, item_type: Optional[str] = None, parent_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None,
+    fields: Optional[str] = None, with_total: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    媒体列表。未传 limit 时保持原行为 (返回完整数组)；
+    传入 limit 后按 (name, id) 游标分页，返回 {items, next_cursor, total}，fields 指定返回列。
+    """
     active_server_id = get_config().get("active_server_id")
-    query = select(MediaItem).where(MediaItem.server_id == active_server_id)
-    
+    try:
+        field_names = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    columns = [getattr(MediaItem, f) for f in field_names] if field_names else None
+    query = select(*columns) if columns else select(MediaItem)
+    query = query.where(MediaItem.server_id == active_server_id)
+    
+    # 名称/路径检索优先走 FTS5 trigram 全文索引 (按相关度排序)，过短的词或索引不可用时回退 ILIKE
+    fts = None
     if query_text:
+        fts_terms, exact_id = [], None
         if ":" in query_text:
             for f, v in parse_advanced_search(query_text).items():
                 if f == "year":
                     try: query = query.where(MediaItem.year == int(v))
                     except: pass
+                elif f in FTS_COLUMNS and fts_usable(v): fts_terms.append(fts_phrase(v, f))
                 else: query = query.where(getattr(MediaItem, f).ilike(f"%{v}%"))
+        elif fts_usable(query_text):
+            fts_terms.append(fts_phrase(query_text))
+            exact_id = query_text
         else: query = query.where((MediaItem.name.ilike(f"%{query_text}%")) | (MediaItem.path.ilike(f"%{query_text}%")) | (MediaItem.id == query_text))
+        if fts_terms:
+            fts = fts_matches(" AND ".join(fts_terms), exact_id)
+            query = query.join(fts, ROWID == fts.c.rowid)
     
     if parent_id: query = query.where(MediaItem.parent_id == parent_id)
     elif not query_text:
         if item_type: query = query.where(MediaItem.item_type == item_type)
         else: query = query.where(MediaItem.item_type.in_(["Movie", "Series"]))
-        
-    result = await db.execute(query.order_by(MediaItem.name))
-    return result.scalars().all()
+    
+    if limit is None and not cursor:
+        result = await db.execute(query.order_by(fts.c.rank, MediaItem.name) if fts is not None else query.order_by(MediaItem.name))
+        return [dict(r._mapping) for r in result.all()] if columns else result.scalars().all()
+    
+    total = None
+    if with_total:
+        total = await cached_count(db, active_server_id, (query_text, item_type, parent_id), query)
+    
+    page_query = query
+    if cursor:
+        try:
+            page_query = page_query.where(keyset_after(cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    page_size = limit or 100
+    # 分页键 (name, id) 必须在结果中，投影模式下额外查询后再剔除
+    extra = [c for c in (MediaItem.name, MediaItem.id) if columns and c.key not in field_names]
+    if extra: page_query = page_query.add_columns(*extra)
+    result = await db.execute(page_query.order_by(*keyset_order()).limit(page_size + 1))
+    
+    if columns:
+        rows = [dict(r._mapping) for r in result.all()]
+        keys = [(r["name"], r["id"]) for r in rows]
+        for r in rows:
+            for c in extra: r.pop(c.key, None)
+    else:
+        rows = result.scalars().all()
+        keys = [(r.name, r.id) for r in rows]
+    
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*keys[page_size - 1])
+    return {"items": rows, "next_cursor": next_cursor, "total": total}
 
 @router.get("/duplicates")
-async def list_duplicates(db: AsyncSession = Depends(get_db)):
-    """获取所有重复项目 (基于当前服务器隔离)"""
+async def list_duplicates(include_raw: bool = False, db: AsyncSession = Depends(get_db)):
+    """获取所有重复项目 (基于当前服务器隔离)，默认不返回完整 raw_data，include_raw=true 时附带"""
     active_server_id = get_config().get("active_server_id")
-    
-    body_sub = select(MediaItem.tmdb_id).where(MediaItem.server_id == active_server_id, MediaItem.item_type.in_(["Movie", "Series"]), MediaItem.tmdb_id.isnot(None)).group_by(MediaItem.tmdb_id).having(func.count(MediaItem.id) > 1).subquery()
-    bodies = await db.execute(select(MediaItem).where(MediaItem.server_id == active_server_id, MediaItem.tmdb_id.in_(select(body_sub)), MediaItem.item_type.in_(["Movie", "Series"])))
-    
-    ep_sub = select(MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num).where(MediaItem.server_id == active_server_id, MediaItem.item_type == "Episode", MediaItem.tmdb_id.isnot(None)).group_by(MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num).having(func.count(MediaItem.id) > 1).subquery()
-    eps = await db.execute(select(MediaItem).where(MediaItem.server_id == active_server_id).join(ep_sub, (MediaItem.tmdb_id == ep_sub.c.tmdb_id) & (MediaItem.season_num == ep_sub.c.season_num) & (MediaItem.episode_num == ep_sub.c.episode_num)))
+    columns = LEAN_COLUMNS + [MediaItem.raw_data] if include_raw else LEAN_COLUMNS
+    rows = await DuplicateGroupService.load_items(db, active_server_id, columns)
     
     res = []
-    for item in list(bodies.scalars().all()) + list(eps.scalars().all()):
-        res.append({"id": item.id, "name": item.name, "item_type": item.item_type, "path": item.path, "display_title": item.display_title, "video_codec": item.video_codec, "video_range": item.video_range, "tmdb_id": item.tmdb_id, "raw_data": item.raw_data, "is_duplicate": True})
+    for item in rows:
+        data = {"id": item.id, "name": item.name, "item_type": item.item_type, "path": item.path, "year": item.year, "parent_id": item.parent_id, "display_title": item.display_title, "video_codec": item.video_codec, "video_range": item.video_range, "audio_codec": item.audio_codec, "tmdb_id": item.tmdb_id, "season_num": item.season_num, "episode_num": item.episode_num, "group_key": item.group_key, "is_duplicate": True}
+        # 精简模式下仅保留前端展示季/集编号所需的字段
+        data["raw_data"] = item.raw_data if include_raw else {"ParentIndexNumber": item.season_num, "IndexNumber": item.episode_num}
+        res.append(data)
     return res
 
 @router.post("/smart-select")
-async def smart_select_v4(db: AsyncSession = Depends(get_db)):
-    """智能分析评分引擎 (V4): 深度日志跟踪与服务器隔离"""
-    start_time = time.time()
-    active_server_id = get_config().get("active_server_id")
-    config = get_config()
-    rule_data = config.get("dedupe_rules")
-    exclude_paths = config.get("exclude_paths", [])
-    scorer = Scorer(rule_data)
-    
-    logger.info(f"🧪 [智能分析] 评分引擎启动 (Server: {active_server_id})...")
-    
-    all_items_res = await db.execute(select(MediaItem).where(MediaItem.server_id == active_server_id, MediaItem.item_type.in_(["Movie", "Series", "Episode"])))
-    all_items = all_items_res.scalars().all()
-    
-    logger.info(f"┣ 📊 库内共有 {len(all_items)} 个节点参与评分")
-    
-    groups = defaultdict(list)
-    for i in all_items:
-        if not i.tmdb_id: continue
-        if i.item_type == "Movie": key = f"Movie-{i.tmdb_id}"
-        elif i.item_type == "Series": key = f"Series-{i.tmdb_id}"
-        elif i.item_type == "Episode": key = f"TV-{i.tmdb_id}-S{str(i.season_num or 0).zfill(2)}E{str(i.episode_num or 0).zfill(2)}"
-        else: continue
-        groups[key].append(i)
-        
-    to_delete_ids = []
-    duplicate_group_count = 0
-    
-    for key, g_items in groups.items():
-        if len(g_items) > 1:
-            duplicate_group_count += 1
-            scored_data = [{"id": i.id, "emby_id": i.id, "path": i.path, "display_title": i.display_title, "video_codec": i.video_codec, "video_range": i.video_range} for i in g_items]
-            suggested = scorer.select_best(scored_data)
-            
-            logger.info(f"┃  ┣ 📦 重复组 [{key}] 有 {len(g_items)} 个副本")
-            for i in g_items:
-                status = "🗑️ 建议删除" if i.id in suggested else "✅ 建议保留"
-                # 改为包含匹配 (只要路径包含关键词即排除)，且忽略大小写
-                if i.id in suggested and any(ex.lower() in i.path.lower() for ex in exclude_paths if ex.strip()):
-                    status = "🛡️ 白名单保护"
-                    suggested.remove(i.id)
-                logger.info(f"┃  ┃  ┗ {status}: [{i.display_title} | {i.video_codec}] {i.path}")
-            
-            to_delete_ids.extend(suggested)
-    
-    process_time = (time.time() - start_time) * 1000
-    logger.info(f"✅ [智能分析] 任务结束: 扫描全库发现 {duplicate_group_count} 组重复，建议删除 {len(to_delete_ids)} 个节点。")
-    
-    audit_log("智能分析引擎执行完毕", process_time, [
-        f"分析总数: {len(all_items)}",
-        f"发现重复组: {duplicate_group_count}",
-        f"建议清理数: {len(to_delete_ids)}"
-    ])
-    
-    if not to_delete_ids: return []
-    final_res = await db.execute(select(MediaItem).where(MediaItem.server_id == active_server_id, MediaItem.id.in_(to_delete_ids)))
-    return final_res.scalars().all()
+async def smart_select_v4(refresh: bool = False):
+    """智能分析评分引擎 (V4): 深度日志跟踪与服务器隔离；结果缓存至下次同步/删除/规则变更，refresh=true 强制重算"""
+    return await SmartSelectService.get(get_config().get("active_server_id"), refresh=refresh)
 
 @router.delete("/items")
 async def delete_items_optimized(request: BulkDeleteRequest, db: AsyncSession = Depends(get_db)):
-    """优化版隔离删除：支持冗余折叠与审计"""
+    """优化版隔离删除：支持冗余折叠 (含孙级)、并发执行、逐项结果与审计"""
     start_time = time.time()
-    active_server_id = get_config().get("active_server_id")
+    config = get_config()
+    active_server_id = config.get("active_server_id")
     service = get_emby_service()
     if not service: raise HTTPException(status_code=400, detail="未配置服务器")
     
-    res = await db.execute(select(MediaItem).where(MediaItem.server_id == active_server_id, MediaItem.id.in_(request.item_ids)))
-    delete_map = {item.id: item for item in res.scalars().all()}
-    
-    final_ids_to_call = []
-    skipped_count = 0
-    for eid in request.item_ids:
-        item = delete_map.get(eid)
-        if not item: continue
-        
-        # 折叠逻辑：如果其 parent_id 也在本次删除名单中，则跳过该子项的 API 调用
-        if item.parent_id in request.item_ids:
-            logger.info(f"⚡ [优化] 跳过子项 API 调用 (父级已在清理列表): {item.path}")
-            skipped_count += 1
-        else:
-            final_ids_to_call.append(eid)
-
-    success = 0
-    for eid in final_ids_to_call:
-        item = delete_map.get(eid)
-        logger.warning(f"🔥 [清理] 执行 Emby 物理删除: {item.path if item else eid}")
-        if await service.delete_item(eid):
-            success += 1
-    
-    await db.execute(delete(MediaItem).where(MediaItem.server_id == active_server_id, MediaItem.id.in_(request.item_ids)))
-    await db.commit()
+    result = await bulk_delete_items(
+        db, service, active_server_id, request.item_ids,
+        concurrency=config.get("dedupe_delete_concurrency", DEFAULT_DELETE_CONCURRENCY)
+    )
+    invalidate_item_counts(active_server_id)
+    SmartSelectService.invalidate(active_server_id)
     
     process_time = (time.time() - start_time) * 1000
     audit_log("媒体清理隔离任务完成", process_time, [
-        f"API物理删除: {success}",
-        f"逻辑折叠跳过: {skipped_count}",
-        f"本地库清理: {len(request.item_ids)}"
+        f"API物理删除: {result['success']}",
+        f"逻辑折叠跳过: {result['skipped']}",
+        f"删除失败: {result['failed']}",
+        f"本地库清理: {result['local_removed']}"
     ])
-    return {"success": success, "skipped": skipped_count}
+    return result
 
 @router.get("/config")
 async def get_dedupe_config():
@@ -285,4 +225,5 @@ async def save_dedupe_config(data: Dict[str, Any]):
     if "rules" in data: config["dedupe_rules"] = data["rules"]
     if "exclude_paths" in data: config["exclude_paths"] = data["exclude_paths"]
     save_config(config)
+    SmartSelectService.invalidate()
     return {"message": "ok"}
\ No newline at end of file
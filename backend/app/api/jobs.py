@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_, and_
+from typing import Optional
+from app.db.session import get_db
+from app.models.job import JobHistory
+from app.services.job_manager import JobManager
+from app.services.media_query import encode_cursor, decode_cursor
+
+router = APIRouter()
+
+def _history_row(row: JobHistory):
+    return {
+        "id": row.id,
+        "type": row.job_type,
+        "key": row.key,
+        "title": row.title,
+        "status": row.status,
+        "params": row.params,
+        "progress": row.progress,
+        "result": row.result,
+        "error": row.error,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "started_at": row.started_at.isoformat() if row.started_at else None,
+        "finished_at": row.finished_at.isoformat() if row.finished_at else None,
+        "duration_ms": row.duration_ms
+    }
+
+@router.get("", summary="当前进程内的任务 (执行中 + 最近完成)")
+async def list_jobs(job_type: Optional[str] = Query(None, alias="type"), active: bool = False):
+    jobs = JobManager.active(job_type) if active else [j for j in JobManager.recent() if job_type is None or j.type == job_type]
+    return [j.snapshot() for j in jobs]
+
+@router.get("/history", summary="已结束任务的持久化历史 (游标分页)")
+async def list_job_history(
+    job_type: Optional[str] = Query(None, alias="type"),
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    stmt = select(JobHistory)
+    if job_type: stmt = stmt.where(JobHistory.job_type == job_type)
+    if status: stmt = stmt.where(JobHistory.status == status)
+    if cursor:
+        try:
+            finished_at, last_id = decode_cursor(cursor)
+            finished_at = datetime.fromisoformat(finished_at)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        stmt = stmt.where(or_(
+            JobHistory.finished_at < finished_at,
+            and_(JobHistory.finished_at == finished_at, JobHistory.id < last_id)
+        ))
+    rows = (await db.execute(stmt.order_by(JobHistory.finished_at.desc(), JobHistory.id.desc()).limit(limit + 1))).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].finished_at.isoformat(), rows[-1].id)
+    return {"items": [_history_row(r) for r in rows], "next_cursor": next_cursor}
+
+@router.get("/{job_id}", summary="任务详情与进度 (含 ETA)")
+async def get_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = JobManager.get(job_id)
+    if job:
+        return job.snapshot()
+    row = await db.get(JobHistory, job_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return _history_row(row)
+
+@router.post("/{job_id}/cancel", summary="取消任务")
+async def cancel_job(job_id: str, force: bool = False):
+    """执行中的任务会在下一个检查点退出；force=true 时直接中断协程"""
+    job = JobManager.cancel(job_id, force=force)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在或已结束")
+    return job.snapshot()
+
+@router.websocket("/ws")
+async def jobs_websocket(websocket: WebSocket):
+    """连接后推送一次全量快照，之后推送任务状态事件，执行中任务每秒推送一次进度"""
+    await websocket.accept()
+    queue = JobManager.subscribe()
+    try:
+        await websocket.send_json({"event": "jobs.snapshot", "jobs": [j.snapshot() for j in JobManager.recent()]})
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                running = [j.snapshot() for j in JobManager.active()]
+                if not running:
+                    continue
+                message = {"event": "jobs.progress", "jobs": running}
+            await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        pass
+    finally:
+        JobManager.unsubscribe(queue)
@@ -3,10 +3,13 @@ from typing import Optional, Dict, Any, List
 import httpx
 import uuid
 import time
+import asyncio
 from app.core.config_manager import get_config, save_config
 from app.services.emby import EmbyService, get_emby_service
 from app.utils.logger import logger
 from app.utils.http_client import get_async_client
+from app.utils.concurrency import get_limiter_stats, get_limiter_config
+from app.services.library_cache import LibraryCache
 
 router = APIRouter()
 
@@ -29,6 +32,8 @@ async def activate_server(server_id: str):
     
     config["active_server_id"] = server_id
     save_config(config)
+    # 预加载媒体库列表，工具箱等按名称解析媒体库时直接命中内存
+    asyncio.create_task(LibraryCache.preload(server_id))
     return {"message": "切换成功", "active_id": server_id}
 
 @router.delete("/{server_id}")
@@ -47,6 +52,7 @@ async def delete_server(server_id: str):
         config["active_server_id"] = new_servers[0].get("id") if new_servers else ""
         
     save_config(config)
+    LibraryCache.invalidate(server_id)
     return {"message": "删除成功"}
 
 @router.post("/test")
@@ -63,7 +69,7 @@ async def save_server_config(config: Dict[str, Any]):
     full_config = get_config()
     
     # 提取 Emby 服务器相关的字段
-    emby_fields = ["id", "name", "url", "api_key", "user_id", "username", "password", "session_token", "emby_id"]
+    emby_fields = ["id", "name", "url", "api_key", "user_id", "username", "password", "session_token", "emby_id", "concurrency"]
     server_data = {k: v for k, v in config.items() if k in emby_fields}
     
     # 逻辑修正：只有当明确提供了服务器 ID，或者提供了核心连接信息（URL + API Key）时，才处理服务器列表
@@ -183,16 +189,24 @@ async def emby_login(server_id: Optional[str] = Body(None, embed=True)):
         logger.error(f"Emby 登录失败: {e}")
         raise HTTPException(status_code=500, detail=f"登录失败: {str(e)}")
 
+@router.get("/concurrency")
+async def get_concurrency_stats():
+    """查看各 Emby 服务器自适应并发限制器的当前并发上限与延迟分位数"""
+    config = get_config()
+    return {
+        "config": get_limiter_config(config.get("active_server_id")),
+        "limiters": get_limiter_stats()
+    }
+
 @router.get("/libraries")
-async def get_emby_libraries():
+async def get_emby_libraries(refresh: bool = False):
     service = get_emby_service()
     if not service:
         return []
     
     try:
-        resp = await service._request("GET", "/Library/VirtualFolders")
-        if resp and resp.status_code == 200:
-            folders = resp.json()
+        folders = await LibraryCache.get_folders(service, force=refresh)
+        if folders is not None:
             return [{"label": f["Name"], "value": f["Name"]} for f in folders]
         return []
     except Exception as e:
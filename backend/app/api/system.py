@@ -7,7 +7,8 @@ from app.models.config import SystemConfig
 from app.schemas.system import BatchConfigUpdate, AuditLogListResponse, AuditLogResponse
 from app.services.config_service import ConfigService
 from app.utils.logger import get_log_dates, get_log_content, LOG_DIR, logger
-from app.utils.http_client import get_async_client
+from app.utils.http_client import get_async_client, get_pool_stats
+from app.services.tmdb_client import tmdb_client
 from app.services.docker_service import DockerService
 from app.core.config_manager import get_config
 from datetime import datetime
@@ -68,6 +69,22 @@ async def check_version():
         "docker_hub": f"https://hub.docker.com/r/{DOCKER_IMAGE}"
     }
 
+@router.get("/http-pool", summary="共享 HTTP 连接池状态")
+async def get_http_pool_stats():
+    """查看各 Emby 服务器共享连接池的请求数与连接占用，用于调整 http_pool 配置"""
+    return {"pools": get_pool_stats()}
+
+@router.get("/tmdb-cache", summary="TMDB 缓存统计")
+async def get_tmdb_cache_stats():
+    """命中率、合并请求数、限速等待时长及各类型缓存条目数"""
+    return await tmdb_client.stats()
+
+@router.delete("/tmdb-cache", summary="清理 TMDB 缓存")
+async def purge_tmdb_cache(expired_only: bool = Query(True, description="仅清理已过期条目")):
+    removed = await tmdb_client.purge(expired_only)
+    logger.info(f"🧹 [TMDB 缓存] 已清理 {removed} 条缓存")
+    return {"removed": removed}
+
 @router.post("/upgrade")
 async def upgrade_system(host_id: str = Query(None)):
     """一键系统升级：执行在被标记为 is_local 的宿主机上"""
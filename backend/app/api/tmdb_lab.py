@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Dict, Any, Optional
 from app.core.config_manager import get_config
-from app.utils.http_client import get_async_client
+from app.services.tmdb_client import tmdb_client
 from app.utils.logger import logger, audit_log
 import time
+import asyncio
 
 router = APIRouter()
 
@@ -25,11 +26,8 @@ async def search_tmdb(
     start_time = time.time()
     tmdb_key = await get_tmdb_config()
     
-    url = f"https://api.themoviedb.org/3/search/{media_type}"
     params = {
-        "api_key": tmdb_key,
         "query": query,
-        "language": language,
         "page": page,
         "include_adult": "true"
     }
@@ -37,20 +35,18 @@ async def search_tmdb(
     logger.info(f"🔍 [TMDB Lab] 正在搜索 {media_type}: {query} (语言: {language})")
     
     try:
-        async with get_async_client(use_proxy=True) as client:
-            response = await client.get(url, params=params)
-            if response.status_code != 200:
-                logger.error(f"❌ TMDB 搜索失败: {response.text}")
-                raise HTTPException(status_code=502, detail=f"TMDB API 返回错误: {response.text}")
-            
-            data = response.json()
-            audit_log("TMDB 搜索完成", (time.time() - start_time) * 1000, [
-                f"查询: {query}",
-                f"类型: {media_type}",
-                f"语言: {language}",
-                f"结果数: {len(data.get('results', []))}"
-            ])
-            return data
+        status_code, data = await tmdb_client.request(f"/search/{media_type}", params, language=language, api_key=tmdb_key)
+        if status_code != 200:
+            logger.error(f"❌ TMDB 搜索失败: {data}")
+            raise HTTPException(status_code=502, detail=f"TMDB API 返回错误: {data}")
+        
+        audit_log("TMDB 搜索完成", (time.time() - start_time) * 1000, [
+            f"查询: {query}",
+            f"类型: {media_type}",
+            f"语言: {language}",
+            f"结果数: {len(data.get('results', []))}"
+        ])
+        return data
     except Exception as e:
         logger.error(f"❌ TMDB 搜索异常: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -73,56 +69,37 @@ async def fetch_tmdb_details(
     
     append_to_response = ",".join(append_items)
     
-    base_url = f"https://api.themoviedb.org/3/{media_type}/{tmdb_id}"
-    params = {
-        "api_key": tmdb_key,
-        "append_to_response": append_to_response
-    }
-    if language:
-        params["language"] = language
+    params = {"append_to_response": append_to_response}
 
     logger.info(f"🚀 [TMDB Lab] 抓取任务 ID: {tmdb_id} (全语言翻译: {include_translations}, 递归: {recursive})")
     
     try:
-        async with get_async_client(use_proxy=True) as client:
-            response = await client.get(base_url, params=params)
-            if response.status_code != 200:
-                logger.error(f"❌ TMDB 抓取失败: {response.text}")
-                raise HTTPException(status_code=502, detail=f"TMDB API 返回错误: {response.text}")
-            
-            data = response.json()
+        status_code, data = await tmdb_client.request(f"/{media_type}/{tmdb_id}", params, language=language, api_key=tmdb_key)
+        if status_code != 200:
+            logger.error(f"❌ TMDB 抓取失败: {data}")
+            raise HTTPException(status_code=502, detail=f"TMDB API 返回错误: {data}")
 
-            if media_type == "tv" and recursive and "seasons" in data:
-                logger.info(f"┣ 📂 执行季/集深度递归抓取...")
-                full_seasons = []
-                for s_summary in data["seasons"]:
-                    season_num = s_summary.get("season_number")
-                    s_url = f"https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_num}"
-                    
-                    s_append = ["credits", "images"]
-                    if include_translations:
-                        s_append.append("translations")
-                        
-                    s_params = {"api_key": tmdb_key, "append_to_response": ",".join(s_append)}
-                    if language:
-                        s_params["language"] = language
-                    
-                    s_resp = await client.get(s_url, params=s_params)
-                    if s_resp.status_code == 200:
-                        full_seasons.append(s_resp.json())
-                    else:
-                        full_seasons.append(s_summary)
-                
-                data["full_seasons_data"] = full_seasons
+        if media_type == "tv" and recursive and "seasons" in data:
+            logger.info(f"┣ 📂 执行季/集深度递归抓取...")
+            s_append = ["credits", "images"]
+            if include_translations:
+                s_append.append("translations")
+            s_params = {"append_to_response": ",".join(s_append)}
 
-            return data
+            # 各季并发抓取，整体速率由共享客户端的令牌桶控制
+            async def fetch_season(s_summary):
+                season_num = s_summary.get("season_number")
+                s_status, s_data = await tmdb_client.request(f"/tv/{tmdb_id}/season/{season_num}", s_params, language=language, api_key=tmdb_key)
+                return s_data if s_status == 200 else s_summary
 
-            audit_log("TMDB 详情抓取完成", (time.time() - start_time) * 1000, [
-                f"ID: {tmdb_id}",
-                f"类型: {media_type}",
-                f"递归: {recursive}"
-            ])
-            return data
+            data = {**data, "full_seasons_data": await asyncio.gather(*[fetch_season(s) for s in data["seasons"]])}
+
+        audit_log("TMDB 详情抓取完成", (time.time() - start_time) * 1000, [
+            f"ID: {tmdb_id}",
+            f"类型: {media_type}",
+            f"递归: {recursive}"
+        ])
+        return data
     except Exception as e:
         logger.error(f"❌ TMDB 抓取异常: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -136,13 +113,10 @@ async def fetch_season_details(
 ):
     tmdb_key = await get_tmdb_config()
     append_items = ["credits", "images", "translations"] if include_translations else ["credits", "images"]
-    url = f"https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_number}"
-    params = {"api_key": tmdb_key, "append_to_response": ",".join(append_items)}
-    if language: params["language"] = language
+    params = {"append_to_response": ",".join(append_items)}
     try:
-        async with get_async_client(use_proxy=True) as client:
-            response = await client.get(url, params=params)
-            return response.json()
+        _, data = await tmdb_client.request(f"/tv/{tmdb_id}/season/{season_number}", params, language=language, api_key=tmdb_key)
+        return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -160,17 +134,10 @@ async def fetch_episode_details(
     if include_translations:
         append_items.append("translations")
         
-    url = f"https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_number}/episode/{episode_number}"
-    params = {
-        "api_key": tmdb_key,
-        "append_to_response": ",".join(append_items)
-    }
-    if language:
-        params["language"] = language
+    params = {"append_to_response": ",".join(append_items)}
 
     try:
-        async with get_async_client(use_proxy=True) as client:
-            response = await client.get(url, params=params)
-            return response.json()
+        _, data = await tmdb_client.request(f"/tv/{tmdb_id}/season/{season_number}/episode/{episode_number}", params, language=language, api_key=tmdb_key)
+        return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
 from app.core.config_manager import get_config
 from app.services.emby import EmbyService, get_emby_service
+from app.services.media_index import LocalMediaIndex
 from app.utils.logger import logger, audit_log
 import time
 
@@ -15,17 +16,8 @@ async def get_active_emby():
         raise HTTPException(status_code=400, detail="未配置服务器")
     return service
 
-@router.get("/reverse-tmdb", summary="根据单集 ID 反查剧集 TMDB")
-async def reverse_lookup_tmdb(
-    episode_id: str = Query(..., description="Emby 单集 ID"),
-    db: AsyncSession = Depends(get_db)
-):
-    """
-    深度日志集成
-    """
-    start_time = time.time()
-    logger.info(f"🚀 启动 [剧集 TMDB 反查] 任务 (单集 ID: {episode_id})")
-
+async def _live_lookup(episode_id: str):
+    """实时溯源：逐级请求 Emby (本地索引未命中或已过期时使用)"""
     # 使用统一辅助函数
     service = await get_active_emby()
     
@@ -55,6 +47,28 @@ async def reverse_lookup_tmdb(
     if not tmdb_id:
         logger.warning(f"┗ ⚠️ 溯源失败: 剧集 '{series_name}' 未绑定 TMDB ID")
         raise HTTPException(status_code=404, detail=f"未找到 TMDB 绑定")
+    return series_id, series_name, tmdb_id, series_data.get("Type")
+
+@router.get("/reverse-tmdb", summary="根据单集 ID 反查剧集 TMDB")
+async def reverse_lookup_tmdb(
+    episode_id: str = Query(..., description="Emby 单集 ID"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    深度日志集成
+    """
+    start_time = time.time()
+    logger.info(f"🚀 启动 [剧集 TMDB 反查] 任务 (单集 ID: {episode_id})")
+
+    # 本地索引优先：沿 parent_id 追溯到剧集，直接读取已同步的 TMDB ID
+    server_id = get_config().get("active_server_id")
+    fresh, _ = await LocalMediaIndex.freshness(db, server_id)
+    series_row = await LocalMediaIndex.series_of(db, server_id, episode_id) if fresh else None
+    if series_row and series_row.tmdb_id and series_row.id != episode_id:
+        logger.info(f"┣ ⚡ 本地索引命中: {series_row.name} (Series ID: {series_row.id})")
+        series_id, series_name, tmdb_id, item_type = series_row.id, series_row.name, series_row.tmdb_id, series_row.item_type
+    else:
+        series_id, series_name, tmdb_id, item_type = await _live_lookup(episode_id)
 
     audit_log("TMDB 反向溯源成功", (time.time() - start_time) * 1000, [
         f"单集 ID: {episode_id}",
@@ -66,5 +80,5 @@ async def reverse_lookup_tmdb(
         "series_name": series_name,
         "tmdb_id": tmdb_id,
         "series_id": series_id,
-        "item_type": series_data.get("Type")
+        "item_type": item_type
     }
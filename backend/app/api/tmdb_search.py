@@ -6,6 +6,8 @@ from typing import List, Dict, Any, Optional
 from app.db.session import get_db
 from app.core.config_manager import get_config
 from app.services.emby import EmbyService, get_emby_service
+from app.services.media_index import LocalMediaIndex
+from app.services.series_tree import SeriesTreeLoader
 from app.utils.logger import logger, audit_log
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
@@ -19,6 +21,7 @@ class TmdbSearchRequest(BaseModel):
     search_movies: bool = True
     search_series: bool = True
     show_raw_json: bool = False
+    force_live: bool = False # 跳过本地索引，直接实时扫描 Emby
 
 class TmdbSearchResponse(BaseModel):
     results: List[Dict[str, Any]]
@@ -33,26 +36,6 @@ async def get_active_emby():
         raise HTTPException(status_code=400, detail="未配置服务器")
     return service
 
-async def _fetch_series_structure(service: EmbyService, series_item: Dict[str, Any]) -> Dict[str, Any]:
-    series_details = series_item.copy()
-    series_details["Seasons"] = []
-    logger.info(f"┃  ┣ 📂 正在解析剧集层级: {series_item.get('Name')}")
-    
-    params = {"Fields": FULL_FIELDS, "IncludeItemTypes": "Season", "Recursive": "false", "ParentId": series_item["Id"]}
-    resp = await service._request("GET", "/Items", params=params)
-    seasons = resp.json().get("Items", []) if resp else []
-
-    for s_item in seasons:
-        season_details = s_item.copy()
-        logger.info(f"┃  ┃  ┣ 📅 正在拉取: {s_item.get('Name')}...")
-        ep_params = {"Fields": FULL_FIELDS, "IncludeItemTypes": "Episode", "Recursive": "false", "ParentId": s_item["Id"]}
-        ep_resp = await service._request("GET", "/Items", params=ep_params)
-        eps = ep_resp.json().get("Items", []) if ep_resp else []
-        logger.info(f"┃  ┃  ┃  ┗ 找到 {len(eps)} 集数据")
-        season_details["Episodes"] = eps
-        series_details["Seasons"].append(season_details)
-    return series_details
-
 @router.post("/search-by-id", response_model=TmdbSearchResponse)
 async def search_by_tmdb_id(request: TmdbSearchRequest, db: AsyncSession = Depends(get_db)):
     start_time = time.time()
@@ -65,20 +48,45 @@ async def search_by_tmdb_id(request: TmdbSearchRequest, db: AsyncSession = Depen
     if request.search_movies: include_types.append("Movie")
     if request.search_series: include_types.append("Series")
     
-    final_results = []
-    logger.info(f"┣ 🔍 正在执行全库扫描 (Types: {include_types})...")
-
-    params = {"Fields": FULL_FIELDS, "Recursive": "true", "IncludeItemTypes": ",".join(include_types)}
-    resp = await service._request("GET", "/Items", params=params)
-    all_items = resp.json().get("Items", []) if resp else []
+    tmdb_id = request.tmdb_id.strip()
+    server_id = get_config().get("active_server_id")
+    matched = None
+    
+    # 优先走本地 tmdb_id 索引，只向 Emby 请求命中的条目
+    fresh, last_sync = await LocalMediaIndex.freshness(db, server_id)
+    if fresh and not request.force_live:
+        local_ids = await LocalMediaIndex.ids_by_tmdb(db, server_id, tmdb_id, include_types)
+        if local_ids:
+            logger.info(f"┣ ⚡ 本地索引命中 {len(local_ids)} 项 (同步于 {last_sync:%Y-%m-%d %H:%M})")
+            items = await service.get_items_by_ids(local_ids, FULL_FIELDS)
+            # 命中项在 Emby 侧已删除或改绑时，说明索引已过时，回退实时扫描
+            if items is not None and len(items) == len(local_ids) and all(str(it.get('ProviderIds', {}).get('Tmdb')) == tmdb_id for it in items):
+                matched = items
+            else:
+                logger.warning("┣ ⚠️ 本地索引与 Emby 不一致，回退全库扫描")
+        else:
+            # 未命中不能说明不存在 (可能是上次同步后新入库的)，按 ProviderId 向 Emby 定向查询
+            logger.info(f"┣ 🔎 本地索引未命中，按 ProviderId 定向查询 Emby...")
+            params = {"Fields": FULL_FIELDS, "Recursive": "true", "IncludeItemTypes": ",".join(include_types), "AnyProviderIdEquals": f"tmdb.{tmdb_id}"}
+            resp = await service._request("GET", "/Items", params=params)
+            if resp and resp.status_code == 200:
+                matched = [it for it in resp.json().get("Items", []) if str(it.get('ProviderIds', {}).get('Tmdb')) == tmdb_id]
+            else:
+                logger.warning("┣ ⚠️ 定向查询失败，回退全库扫描")
+    
+    if matched is None:
+        logger.info(f"┣ 🔍 正在执行全库扫描 (Types: {include_types})...")
+        params = {"Fields": FULL_FIELDS, "Recursive": "true", "IncludeItemTypes": ",".join(include_types)}
+        resp = await service._request("GET", "/Items", params=params)
+        all_items = resp.json().get("Items", []) if resp else []
+        matched = [it for it in all_items if str(it.get('ProviderIds', {}).get('Tmdb')) == tmdb_id]
     
-    for it in all_items:
-        p_ids = it.get('ProviderIds', {})
-        if str(p_ids.get('Tmdb')) == request.tmdb_id.strip():
-            logger.info(f"┃  ┣ ✅ 匹配成功: {it.get('Name')}")
-            if it["Type"] == "Series":
-                it = await _fetch_series_structure(service, it)
-            final_results.append(it)
+    for it in matched:
+        logger.info(f"┃  ┣ ✅ 匹配成功: {it.get('Name')}")
+    # 多个匹配剧集的层级并发加载，每个剧集一次递归查询
+    series = [it for it in matched if it["Type"] == "Series"]
+    trees = {t["Id"]: t for t in await SeriesTreeLoader(service, FULL_FIELDS).load_trees(series)} if series else {}
+    final_results = [trees.get(it["Id"], it) if it["Type"] == "Series" else it for it in matched]
 
     audit_log("深度搜索任务完成", (time.time()-start_time)*1000, [
         f"TMDB ID: {request.tmdb_id}",
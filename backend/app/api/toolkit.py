@@ -26,6 +26,8 @@ class GenreMapping(BaseModel):
 class BaseMetadataRequest(BaseModel):
     lib_names: List[str]
     dry_run: bool = True
+    # 是否等待任务完成后再返回；不传时沿用各工具原有行为 (mapper 立即返回，其余等待)
+    wait: Optional[bool] = None
 
 class GenreMapperRequest(BaseMetadataRequest):
     genre_mappings: List[GenreMapping]
@@ -51,8 +53,12 @@ class MetadataManagerResponse(BaseModel):
     message: str
     processed_count: int
     dry_run_active: bool
+    task_id: Optional[str] = None
 
 from app.core.config_manager import get_config
+from app.services.toolkit_engine import (
+    Transform, ToolkitTask, start_toolkit_task, get_toolkit_task, toolkit_tasks
+)
 import time
 
 async def get_emby_context(db: AsyncSession):
@@ -68,24 +74,6 @@ async def get_emby_context(db: AsyncSession):
     
     return service, user_id
 
-async def _get_library_id(service: EmbyService, lib_name: str) -> Optional[str]:
-    resp = await service._request("GET", "/Library/VirtualFolders")
-    if resp and resp.status_code == 200:
-        for f in resp.json():
-            if f.get("Name") == lib_name: return f.get("ItemId")
-    return None
-
-async def _get_lib_items(service: EmbyService, parent_id: str, item_types: List[str]) -> List[Dict]:
-    params = {'ParentId': parent_id, 'Fields': 'Genres,GenreItems,LockedFields,LockData,People', 'IncludeItemTypes': ",".join(item_types), 'Recursive': 'true'}
-    resp = await service._request("GET", "/Items", params=params)
-    return resp.json().get('Items', []) if resp and resp.status_code == 200 else []
-
-async def _get_full_item(service: EmbyService, user_id: str, item_id: str) -> Optional[Dict]:
-    params = {"Fields": "Genres,GenreItems,People,LockedFields,LockData,ChannelMappingInfo"}
-    endpoint = f"/Users/{user_id}/Items/{item_id}" if user_id else f"/Items/{item_id}"
-    resp = await service._request("GET", endpoint, params=params)
-    return resp.json() if resp and resp.status_code == 200 else None
-
 # --- 工具箱实装 ---
 
 from app.utils.http_client import get_async_client
@@ -116,175 +104,119 @@ async def get_hd_icons():
     
     return {"icons": []}
 
-from fastapi import APIRouter, Depends, HTTPException, Body, status, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from app.services.notification_service import NotificationService
 
-# ... (GenreMapping and Request models remain same)
+# --- 纯变换函数：输入完整条目，返回需要修改的字段，无需修改时返回 None ---
+
+def _genre_item(name: str, genre_id: Optional[int]) -> Dict[str, Any]:
+    obj = {"Name": name}
+    if genre_id is not None: obj["Id"] = genre_id
+    return obj
+
+def genre_mapper_transform(request: GenreMapperRequest) -> Transform:
+    mapping_dict = {
+        m.old: {"Name": m.new_name, "Id": int(m.new_id) if (m.new_id and m.new_id.isdigit()) else None}
+        for m in request.genre_mappings
+    }
+    def transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        genres = item.get("Genres", [])
+        if not any(g in mapping_dict for g in genres): return None
+        return {
+            "Genres": list(dict.fromkeys(mapping_dict[g]["Name"] if g in mapping_dict else g for g in genres)),
+            "GenreItems": [
+                _genre_item(mapping_dict[gi.get("Name")]["Name"], mapping_dict[gi.get("Name")]["Id"]) if gi.get("Name") in mapping_dict else gi
+                for gi in item.get("GenreItems", [])
+            ]
+        }
+    return transform
 
-async def run_genre_mapper_task(request: GenreMapperRequest, user_id: str):
-    service = get_emby_service()
-    processed = 0
-    start_time = time.time()
-    
-    mapping_dict = {}
-    for m in request.genre_mappings:
-        mapping_dict[m.old] = {
-            "Name": m.new_name, 
-            "Id": int(m.new_id) if (m.new_id and m.new_id.isdigit()) else None
+def genre_adder_transform(request: GenreAdderRequest) -> Transform:
+    # 严格逻辑：如果不填 ID 就是 None
+    new_id = int(request.genre_to_add_id) if (request.genre_to_add_id and request.genre_to_add_id.isdigit()) else None
+    name = request.genre_to_add_name
+    def transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        genres = item.get("Genres", [])
+        if name in genres: return None
+        return {"Genres": genres + [name], "GenreItems": item.get("GenreItems", []) + [_genre_item(name, new_id)]}
+    return transform
+
+def genre_remover_transform(request: GenreRemoverRequest) -> Transform:
+    to_remove = request.genres_to_remove
+    def transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        original_genres = item.get("Genres", [])
+        should_modify = (not to_remove and original_genres) or (to_remove and any(g in to_remove for g in original_genres))
+        if not should_modify: return None
+        return {
+            "Genres": [g for g in original_genres if g not in to_remove] if to_remove else [],
+            "GenreItems": [gi for gi in item.get("GenreItems", []) if gi.get("Name") not in to_remove] if to_remove else []
         }
+    return transform
 
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, ["Movie", "Series"])
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if not full_item: continue
-            
-            genres = full_item.get("Genres", [])
-            if any(g in mapping_dict for g in genres):
-                processed += 1
-                if not request.dry_run:
-                    full_item["Genres"] = list(set([mapping_dict[g]["Name"] if g in mapping_dict else g for g in genres]))
-                    new_gi = []
-                    for gi in full_item.get("GenreItems", []):
-                        gn = gi.get("Name")
-                        if gn in mapping_dict:
-                            m = mapping_dict[gn]
-                            item_obj = {"Name": m["Name"]}
-                            if m["Id"] is not None: item_obj["Id"] = m["Id"]
-                            new_gi.append(item_obj)
-                        else: new_gi.append(gi)
-                    full_item["GenreItems"] = new_gi
-                    await service.update_item(full_item["Id"], full_item)
-    
-    duration = time.time() - start_time
-    await NotificationService.emit(
-        "toolkit.genre_mapper", 
-        "类型映射任务完成", 
-        f"处理项目: {processed}\n耗时: {duration:.1f}s\n模式: {'预览' if request.dry_run else '执行'}"
+def people_remover_transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return {"People": []} if item.get("People") else None
+
+def field_unlocker_transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not (item.get("LockedFields") or item.get("LockData")): return None
+    return {"LockedFields": [], "LockData": False}
+
+def item_locker_transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return None if item.get("LockData") else {"LockData": True}
+
+def episode_genre_clear_transform(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not (item.get("Genres") or item.get("GenreItems")): return None
+    return {"Genres": [], "GenreItems": []}
+
+# --- 任务调度 ---
+
+async def _run_tool(tool: str, title: str, request: BaseMetadataRequest, item_types: List[str],
+                    transform: Transform, db: AsyncSession, wait_default: bool = True) -> MetadataManagerResponse:
+    service, user_id = await get_emby_context(db)
+
+    async def notify(task: ToolkitTask):
+        snap = task.snapshot()
+        await NotificationService.emit(
+            f"toolkit.{tool}",
+            f"{title}任务完成",
+            f"处理项目: {snap['changed']}\n耗时: {snap['elapsed_seconds']:.1f}s\n模式: {'预览' if request.dry_run else '执行'}"
+        )
+
+    task = start_toolkit_task(
+        tool, service, user_id, request.lib_names, item_types, transform, request.dry_run,
+        concurrency=get_config().get("toolkit_concurrency"), on_done=notify
     )
+    wait = wait_default if request.wait is None else request.wait
+    if not wait:
+        return MetadataManagerResponse(message="任务已在后台启动，完成后将通过通知告知", processed_count=0, dry_run_active=request.dry_run, task_id=task.id)
+    # 客户端断开不会中断任务，任务仍在后台执行完毕
+    await task.wait()
+    if task.status == "failed":
+        raise HTTPException(status_code=500, detail=task.error or f"{title}任务失败")
+    return MetadataManagerResponse(message="操作完成", processed_count=task.changed, dry_run_active=request.dry_run, task_id=task.id)
 
 @router.post("/mapper", response_model=MetadataManagerResponse)
-async def genre_mapper(request: GenreMapperRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
-    _, user_id = await get_emby_context(db)
-    if request.dry_run:
-        # 预览模式依然同步返回，因为通常预览数量较少或用户需要即时反馈
-        # 但如果是执行模式，必须后台运行
-        pass 
-
-    background_tasks.add_task(run_genre_mapper_task, request, user_id)
-    return MetadataManagerResponse(message="任务已在后台启动，完成后将通过通知告知", processed_count=0, dry_run_active=request.dry_run)
+async def genre_mapper(request: GenreMapperRequest, db: AsyncSession = Depends(get_db)):
+    return await _run_tool("genre_mapper", "类型映射", request, ["Movie", "Series"], genre_mapper_transform(request), db, wait_default=False)
 
 @router.post("/genre_adder", response_model=MetadataManagerResponse)
 async def genre_adder(request: GenreAdderRequest, db: AsyncSession = Depends(get_db)):
-    service, user_id = await get_emby_context(db)
-    processed = 0
-    start_time = time.time()
-    logger.info(f"🚀 开始 [类型新增] 任务: {request.genre_to_add_name}")
-    
-    # 严格逻辑：如果不填 ID 就是 None
-    new_id = int(request.genre_to_add_id) if (request.genre_to_add_id and request.genre_to_add_id.isdigit()) else None
+    return await _run_tool("genre_adder", "类型新增", request, ["Movie", "Series"], genre_adder_transform(request), db)
 
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, ["Movie", "Series"])
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if not full_item: continue
-            
-            genres = full_item.get("Genres", [])
-            if request.genre_to_add_name not in genres:
-                processed += 1
-                if not request.dry_run:
-                    full_item["Genres"] = genres + [request.genre_to_add_name]
-                    gi_list = full_item.get("GenreItems", [])
-                    new_gi_obj = {"Name": request.genre_to_add_name}
-                    if new_id is not None: new_gi_obj["Id"] = new_id
-                    gi_list.append(new_gi_obj)
-                    full_item["GenreItems"] = gi_list
-                    await service.update_item(full_item["Id"], full_item)
-                logger.info(f"┃  ┣ 🎯 新增到项目: {full_item.get('Name')}")
-    return MetadataManagerResponse(message="添加完成", processed_count=processed, dry_run_active=request.dry_run)
-
-# ... 其余 Remover, Locker 等逻辑 ...
 @router.post("/remover", response_model=MetadataManagerResponse)
 async def genre_remover(request: GenreRemoverRequest, db: AsyncSession = Depends(get_db)):
-    service, user_id = await get_emby_context(db)
-    processed = 0
-    start_time = time.time()
-    to_remove = request.genres_to_remove
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, ["Movie", "Series"])
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if not full_item: continue
-            original_genres = full_item.get("Genres", [])
-            should_modify = (not to_remove and original_genres) or (to_remove and any(g in to_remove for g in original_genres))
-            if should_modify:
-                processed += 1
-                if not request.dry_run:
-                    full_item["Genres"] = [g for g in original_genres if g not in to_remove] if to_remove else []
-                    full_item["GenreItems"] = [gi for gi in full_item.get("GenreItems", []) if gi.get("Name") not in to_remove] if to_remove else []
-                    await service.update_item(full_item["Id"], full_item)
-                logger.info(f"┃  ┣ 🎯 修改项目: {full_item.get('Name')}")
-    return MetadataManagerResponse(message="移除成功", processed_count=processed, dry_run_active=request.dry_run)
+    return await _run_tool("genre_remover", "类型移除", request, ["Movie", "Series"], genre_remover_transform(request), db)
 
 @router.post("/people_remover", response_model=MetadataManagerResponse)
 async def people_remover(request: PeopleRemoverRequest, db: AsyncSession = Depends(get_db)):
-    service, user_id = await get_emby_context(db)
-    processed = 0
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, request.item_types)
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if full_item and full_item.get("People"):
-                processed += 1
-                if not request.dry_run:
-                    full_item["People"] = []
-                    await service.update_item(it_list["Id"], full_item)
-    return MetadataManagerResponse(message="操作完成", processed_count=processed, dry_run_active=request.dry_run)
+    return await _run_tool("people_remover", "演职员清理", request, request.item_types, people_remover_transform, db)
 
 @router.post("/metadata_field_unlocker", response_model=MetadataManagerResponse)
 async def metadata_field_unlocker(request: MetadataUnlockerRequest, db: AsyncSession = Depends(get_db)):
-    service, user_id = await get_emby_context(db)
-    processed = 0
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, request.item_types)
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if not full_item: continue
-            if full_item.get("LockedFields") or full_item.get("LockData"):
-                processed += 1
-                if not request.dry_run:
-                    full_item["LockedFields"] = []; full_item["LockData"] = False
-                    await service.update_item(full_item["Id"], full_item)
-    return MetadataManagerResponse(message="操作完成", processed_count=processed, dry_run_active=request.dry_run)
+    return await _run_tool("metadata_field_unlocker", "字段解锁", request, request.item_types, field_unlocker_transform, db)
 
 @router.post("/item_locker", response_model=MetadataManagerResponse)
 async def item_locker(request: MetadataUnlockerRequest, db: AsyncSession = Depends(get_db)):
-    service, user_id = await get_emby_context(db)
-    processed = 0
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, request.item_types)
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if not full_item: continue
-            if not full_item.get("LockData"):
-                processed += 1
-                if not request.dry_run:
-                    full_item["LockData"] = True
-                    await service.update_item(full_item["Id"], full_item)
-    return MetadataManagerResponse(message="操作完成", processed_count=processed, dry_run_active=request.dry_run)
+    return await _run_tool("item_locker", "项目锁定", request, request.item_types, item_locker_transform, db)
 
 @router.post("/item_unlocker", response_model=MetadataManagerResponse)
 async def item_unlocker(request: MetadataUnlockerRequest, db: AsyncSession = Depends(get_db)):
@@ -292,17 +224,29 @@ async def item_unlocker(request: MetadataUnlockerRequest, db: AsyncSession = Dep
 
 @router.post("/episode_deleter", response_model=MetadataManagerResponse)
 async def episode_deleter(request: BaseMetadataRequest, db: AsyncSession = Depends(get_db)):
-    service, user_id = await get_emby_context(db)
-    processed = 0
-    for lib_name in request.lib_names:
-        parent_id = await _get_library_id(service, lib_name)
-        if not parent_id: continue
-        items = await _get_lib_items(service, parent_id, ["Episode"])
-        for it_list in items:
-            full_item = await _get_full_item(service, user_id, it_list["Id"])
-            if full_item and (full_item.get("Genres") or full_item.get("GenreItems")):
-                processed += 1
-                if not request.dry_run:
-                    full_item["Genres"] = []; full_item["GenreItems"] = []
-                    await service.update_item(full_item["Id"], full_item)
-    return MetadataManagerResponse(message="操作完成", processed_count=processed, dry_run_active=request.dry_run)
+    return await _run_tool("episode_deleter", "剧集类型清理", request, ["Episode"], episode_genre_clear_transform, db)
+
+# --- 任务进度与差异 ---
+
+@router.get("/tasks", summary="工具箱批处理任务列表")
+async def list_toolkit_tasks():
+    return [t.snapshot() for t in reversed(list(toolkit_tasks.values()))]
+
+@router.get("/tasks/{task_id}", summary="工具箱批处理任务进度 (含 ETA)")
+async def get_toolkit_task_status(task_id: str):
+    task = get_toolkit_task(task_id)
+    if not task: raise HTTPException(status_code=404, detail="任务不存在")
+    return task.snapshot()
+
+@router.get("/tasks/{task_id}/diff", summary="流式输出任务变更差异 (NDJSON)")
+async def stream_toolkit_task_diff(task_id: str):
+    """每行一个 JSON：逐条目的字段 before/after，任务结束后最后一行为 {"summary": ...}"""
+    task = get_toolkit_task(task_id)
+    if not task: raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def generate():
+        async for entry in task.iter_diffs():
+            yield json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        yield json.dumps({"summary": task.snapshot()}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
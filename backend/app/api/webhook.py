@@ -1,18 +1,24 @@
-from fastapi import APIRouter, Depends, Request, Body
+from fastapi import APIRouter, Depends, Request, Body, Query, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, delete
+from sqlalchemy import select, desc, delete, or_, and_
 from app.db.session import get_db
 from app.models.webhook import WebhookLog
+from app.services.webhook_log import WebhookLogBuffer
+from app.services.library_cache import LibraryCache
+from app.services.media_query import encode_cursor, decode_cursor
 from app.utils.logger import logger, audit_log
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import datetime
 import json
 import time
 
+MAX_LOG_PAGE_SIZE = 500
+
 router = APIRouter()
 
 @router.post("/receive/{full_path:path}", summary="接收 Emby Webhook (支持后缀)")
 @router.post("/receive", summary="接收 Emby Webhook")
-async def receive_webhook(request: Request, full_path: str = "", db: AsyncSession = Depends(get_db)):
+async def receive_webhook(request: Request, full_path: str = ""):
     """
     接收来自 Emby 的 Webhook，并物理持久化原始 JSON
     """
@@ -43,17 +49,12 @@ async def receive_webhook(request: Request, full_path: str = "", db: AsyncSessio
     event_type = payload.get("Event", "unknown")
     item_name = payload.get('Item', {}).get('Name', 'N/A')
     user_name = payload.get('User', {}).get('Name', 'N/A')
+    LibraryCache.invalidate_for_event(event_type, (payload.get("Server") or {}).get("Id"))
 
-    # 3. 物理持久化
+    # 3. 物理持久化 (进入缓冲区，按批次写入 SQLite)
     try:
-        new_log = WebhookLog(
-            event_type=event_type,
-            source_ip=source_ip,
-            payload=payload
-        )
-        db.add(new_log)
-        await db.commit()
-        logger.info(f"┣ 💾 原始载荷已物理持久化至 SQLite (Event: {event_type})")
+        await WebhookLogBuffer.add(event_type, source_ip, payload)
+        logger.info(f"┣ 💾 原始载荷已进入持久化缓冲 (Event: {event_type})")
     except Exception as e:
         logger.error(f"┣ ❌ 数据库写入异常: {e}")
 
@@ -69,35 +70,73 @@ async def receive_webhook(request: Request, full_path: str = "", db: AsyncSessio
     return {"status": "ok"}
 
 @router.get("/list", summary="查询 Webhook 历史日志")
-async def get_webhook_logs(limit: int = 50, db: AsyncSession = Depends(get_db)):
+async def get_webhook_logs(
+    limit: int = Query(50, ge=1, le=MAX_LOG_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    paged: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    按 (created_at, id) 倒序列出日志。默认返回数组 (兼容旧前端)；
+    传入 paged=true 或 cursor 时返回 {items, next_cursor}，用 next_cursor 继续翻页。
+    """
     start_time = time.time()
+    # 先落盘缓冲中的新记录，保证列表可见
+    await WebhookLogBuffer.flush()
     
+    query = select(WebhookLog)
+    if cursor:
+        try:
+            created_raw, last_id = decode_cursor(cursor)
+            created_at, last_id = datetime.fromisoformat(created_raw), int(last_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e) or "无效的分页游标")
+        query = query.where(or_(
+            WebhookLog.created_at < created_at,
+            and_(WebhookLog.created_at == created_at, WebhookLog.id < last_id)
+        ))
     result = await db.execute(
-        select(WebhookLog).order_by(desc(WebhookLog.created_at)).limit(limit)
+        query.order_by(desc(WebhookLog.created_at), desc(WebhookLog.id)).limit(limit + 1)
     )
     logs = result.scalars().all()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
     
     audit_log("加载 Webhook 日志库", (time.time() - start_time) * 1000, [
         f"请求限额: {limit}",
         f"检索记录数: {len(logs)}"
     ])
     
-    return logs
+    if not paged and not cursor:
+        return logs
+    next_cursor = encode_cursor(logs[-1].created_at.isoformat(), logs[-1].id) if has_more and logs else None
+    return {"items": logs, "next_cursor": next_cursor}
 
 @router.delete("/clear", summary="清空 Webhook 历史记录")
 async def clear_webhook_logs(db: AsyncSession = Depends(get_db)):
     """物理清空 Webhook 日志表"""
     start_time = time.time()
     
-    # 获取清空前的计数用于审计
-    count_res = await db.execute(select(WebhookLog))
-    before_count = len(count_res.scalars().all())
-    
-    await db.execute(delete(WebhookLog))
+    # 获取清空前的计数用于审计 (含尚未落盘的缓冲)
+    pending_count = WebhookLogBuffer.discard_pending()
+    result = await db.execute(delete(WebhookLog))
     await db.commit()
+    before_count = (result.rowcount or 0) + pending_count
     
     audit_log("Webhook 数据库重置", (time.time() - start_time) * 1000, [
         f"操作类型: 全库清空",
         f"清理记录数: {before_count}"
     ])
-    return {"success": True, "cleared_count": before_count}
\ No newline at end of file
+    return {"success": True, "cleared_count": before_count}
+
+@router.post("/prune", summary="按保留策略清理 Webhook 日志")
+async def prune_webhook_logs():
+    start_time = time.time()
+    await WebhookLogBuffer.flush()
+    deleted = await WebhookLogBuffer.prune()
+    remaining = await WebhookLogBuffer.count()
+    audit_log("Webhook 日志保留清理", (time.time() - start_time) * 1000, [
+        f"清理记录数: {deleted}",
+        f"剩余记录数: {remaining}"
+    ])
+    return {"deleted": deleted, "remaining": remaining, "policy": WebhookLogBuffer.settings()}
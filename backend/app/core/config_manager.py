@@ -27,19 +27,74 @@ DEFAULT_CONFIG = {
         "tie_breaker": "small_id"
     },
     "exclude_paths": [],
+    # 批量删除时同时在途的 Emby 删除请求上限
+    "dedupe_delete_concurrency": 8,
+    "sync_strategy": "flat",
+    # Emby 媒体库列表 (VirtualFolders) 的内存缓存时长 (秒)
+    "library_cache_ttl_seconds": 300,
+    # 本地媒体索引 (media_items) 的可信时长，超过后 TMDB 检索回退为实时扫描 Emby
+    "local_index_max_age_hours": 24,
     "autotag_rules": [],
+    # 自动标签流水线各阶段并发: TMDB 详情获取 / Emby 写回 (Emby 侧仍受自适应限制器约束)
+    "autotag_concurrency": {
+        "tmdb": 8,
+        "emby_write": 4
+    },
+    # 自动标签指纹有效期 (小时)，超过后重新请求 TMDB 以发现元数据变化
+    "autotag_fingerprint_max_age_hours": 168,
     "webhook": {
         "enabled": True,
         "secret_token": "lens_default_token",
         "automation_enabled": True,
         "delay_seconds": 10,
-        "write_mode": "merge"
+        "write_mode": "merge",
+        # 持久化任务队列：并发 worker 数、最大尝试次数与重试退避基数 (秒，指数增长)
+        "workers": 3,
+        "max_attempts": 5,
+        "retry_base_seconds": 30,
+        # 事件合并窗口：同一剧集/电影的后续事件会把处理时间顺延 coalesce_window_seconds，
+        # 但自首个事件起最多等待 coalesce_max_wait_seconds，避免持续扫描时一直不处理
+        "coalesce_window_seconds": 30,
+        "coalesce_max_wait_seconds": 300
+    },
+    # Webhook 原始日志：批量写入与保留策略 (条数上限 / 保留天数，0 表示不限制)
+    "webhook_log": {
+        "batch_size": 50,
+        "flush_interval_seconds": 2,
+        "max_rows": 10000,
+        "max_age_days": 30,
+        "prune_interval_minutes": 60
     },
     "proxy": {
         "enabled": False,
         "url": "",
         "exclude_emby": True
     },
+    "emby_concurrency": {
+        "initial": 4,
+        "min": 1,
+        "max": 32,
+        "latency_target_ms": 0
+    },
+    "tmdb_cache": {
+        "enabled": True,
+        # 各类型缓存时长 (小时)，not_found 为 404 负缓存
+        "ttl_hours": {"movie": 168, "tv": 24, "season": 24, "episode": 72, "person": 168, "search": 6, "other": 24, "not_found": 6},
+        # TMDB 官方限制约 50 次/秒，默认留出余量
+        "rate_per_second": 35,
+        "burst": 35
+    },
+    # 工具箱批处理引擎并发: 完整条目获取 / Emby 写回
+    "toolkit_concurrency": {
+        "fetch": 8,
+        "write": 4
+    },
+    "http_pool": {
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "keepalive_expiry": 30,
+        "http2": False
+    },
     "docker_hosts": [],
     "docker_container_settings": {},
     "docker_auto_update_settings": {
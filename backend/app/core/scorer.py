@@ -1,6 +1,75 @@
-from typing import List, Dict, Any, Tuple
+import re
+from typing import List, Dict, Any, Tuple, Sequence, Hashable, Optional
 from app.utils.logger import logger
 
+MISS_SCORE = 999
+
+def _id_weight_value(emby_id: Any) -> int:
+    try:
+        return int(emby_id)
+    except:
+        return 0
+
+class _CompiledCriterion:
+    """
+    单个评分维度的预编译结果。
+    - 包含匹配 (display_title)：所有关键词合并为一个前瞻交替正则，一次扫描取到最靠前的关键词序号
+    - 精确匹配：关键词 -> 序号 的字典
+    每个不同取值只计算一次，结果记入 memo；全库中规格/编码的取值种类很少，绝大多数是命中缓存。
+    """
+    def __init__(self, crit: str, priority_list: List[str]):
+        self.memo: Dict[Any, int] = {}
+        self.substring = crit == "display_title"
+        self.pattern: Optional[re.Pattern] = None
+        self.exact: Dict[str, int] = {}
+        self.empty_index = MISS_SCORE
+
+        if self.substring:
+            self.keyword_index: Dict[str, int] = {}
+            for i, keyword in enumerate(priority_list):
+                kw = str(keyword).lower()
+                if not kw:
+                    # 空关键词是任意字符串的子串
+                    self.empty_index = min(self.empty_index, i)
+                    continue
+                self.keyword_index.setdefault(kw, i)
+            if self.keyword_index:
+                # 按优先级顺序排列交替分支：同一位置上正则优先命中序号更小的关键词，
+                # 前瞻保证每个位置都被检查，重叠的关键词也不会漏掉
+                alternation = "|".join(re.escape(kw) for kw in sorted(self.keyword_index, key=self.keyword_index.get))
+                self.pattern = re.compile(f"(?=({alternation}))")
+        else:
+            for i, keyword in enumerate(priority_list):
+                self.exact.setdefault(keyword, i)
+
+    def _compute(self, value: Any) -> int:
+        if not value:
+            return MISS_SCORE
+        val_lower = str(value).lower()
+        if not self.substring:
+            return self.exact.get(val_lower, MISS_SCORE)
+        best = self.empty_index
+        if self.pattern is not None:
+            for kw in self.pattern.findall(val_lower):
+                idx = self.keyword_index[kw]
+                if idx < best:
+                    best = idx
+        return best
+
+    def score(self, value: Any) -> int:
+        try:
+            return self.memo[value]
+        except KeyError:
+            result = self.memo[value] = self._compute(value)
+            return result
+        except TypeError:
+            # 不可哈希的取值不进缓存
+            return self._compute(value)
+
+    def score_column(self, values: Sequence[Any]) -> List[int]:
+        memo = self.memo
+        return [memo[v] if v in memo else self.score(v) for v in values]
+
 class Scorer:
     def __init__(self, rule: Dict[str, Any]):
         """
@@ -18,26 +87,17 @@ class Scorer:
         self.priority_order = rule.get("priority_order", [])
         self.values_weight = rule.get("values_weight", {})
         self.tie_breaker = rule.get("tie_breaker", "small_id")
+        self._compiled: Dict[str, _CompiledCriterion] = {}
+
+    def _criterion(self, crit: str) -> _CompiledCriterion:
+        compiled = self._compiled.get(crit)
+        if compiled is None:
+            compiled = self._compiled[crit] = _CompiledCriterion(crit, self.values_weight.get(crit, []))
+        return compiled
 
     def get_value_score(self, crit: str, value: str) -> int:
-        if not value:
-            return 999
-        
-        priority_list = self.values_weight.get(crit, [])
-        val_lower = str(value).lower()
-        
-        # 对于 display_title (媒体规格)，通常包含关键词匹配
-        if crit == "display_title":
-            for i, keyword in enumerate(priority_list):
-                if keyword.lower() in val_lower:
-                    return i
-            return 999
-            
-        # 对于编码等精确匹配
-        try:
-            return priority_list.index(val_lower)
-        except ValueError:
-            return 999
+        # 对于 display_title (媒体规格) 为包含关键词匹配，编码等为精确匹配
+        return self._criterion(crit).score(value)
 
     def score_item(self, item: Dict[str, Any]) -> Tuple[Tuple[int, ...], int]:
         """
@@ -49,12 +109,8 @@ class Scorer:
             val = item.get(crit)
             scores.append(self.get_value_score(crit, val))
         
-        emby_id = item.get("emby_id", "0")
         # 处理 ID 排序逻辑
-        try:
-            id_val = int(emby_id)
-        except:
-            id_val = 0
+        id_val = _id_weight_value(item.get("emby_id", "0"))
             
         if self.tie_breaker == "large_id":
             id_weight = -id_val
@@ -84,3 +140,54 @@ class Scorer:
         
         # 排除第一个（最好的），剩下的都是建议删除的
         return [item["id"] for item in scored_items[1:]]
+
+    def decide_groups(self, ids: Sequence[str], group_keys: Sequence[Hashable],
+                      columns: Dict[str, Sequence[Any]]) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        批量评分：按列一次性给全部候选打分，返回每组的保留/删除决策。
+        ids / group_keys / columns[crit] 为等长的列，同一 group_key 的行视为一组重复项。
+        返回 {group_key: {"keep": id, "delete": [id, ...]}}，仅包含副本数大于 1 的组；
+        决策与逐组调用 select_best 完全一致 (包括同分时保留先出现的一项)。
+        """
+        n = len(ids)
+        sign = -1 if self.tie_breaker == "large_id" else 1
+        id_weights = [sign * _id_weight_value(i) for i in ids]
+
+        # 把 (分数元组, ID权重) 打包成单个整数：各维分数按位拼接，ID 权重加偏移后放在最低位。
+        # 整数比较与元组比较的顺序完全一致，且整数不受 GC 跟踪，20 万行也不会触发大量回收
+        id_bits = max([abs(w) for w in id_weights] or [0]).bit_length() + 1
+        id_offset = 1 << (id_bits - 1)
+        composite = [0] * n
+        for crit in self.priority_order:
+            col = columns.get(crit)
+            scores = self._criterion(crit).score_column(col if col is not None else [None] * n)
+            base = max(scores or [0]) + 1
+            composite = [c * base + sc for c, sc in zip(composite, scores)]
+        packed = [(c << id_bits) + w + id_offset for c, w in zip(composite, id_weights)]
+
+        # 组键映射为连续整数下标，之后的计数与择优全部走列表，避免重复哈希
+        index: Dict[Hashable, int] = {}
+        group_idx = [index.setdefault(key, len(index)) for key in group_keys]
+        n_groups = len(index)
+        counts = [0] * n_groups
+        best_key: List[Optional[int]] = [None] * n_groups
+        keep_row = [-1] * n_groups
+        for row, (g, sort_key) in enumerate(zip(group_idx, packed)):
+            counts[g] += 1
+            current = best_key[g]
+            # 严格小于才替换：并列时保留先出现的行，与 select_best 的稳定排序一致
+            if current is None or sort_key < current:
+                best_key[g] = sort_key
+                keep_row[g] = row
+
+        deletes: List[Optional[List[str]]] = [[] if c > 1 else None for c in counts]
+        for row, g in enumerate(group_idx):
+            bucket = deletes[g]
+            if bucket is not None and keep_row[g] != row:
+                bucket.append(ids[row])
+
+        decisions = {}
+        for key, g in index.items():
+            if counts[g] > 1:
+                decisions[key] = {"keep": ids[keep_row[g]], "delete": deletes[g]}
+        return decisions
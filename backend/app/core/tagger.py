@@ -1,12 +1,104 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, FrozenSet, Tuple
 import re
+import time
+import random
 import logging
 
 logger = logging.getLogger(__name__)
 
+_ANY_TYPE = object()
+_TYPE_MAP = {"movie": "Movie", "series": "Series"}
+
+class _CompiledRule:
+    """规则预编译结果：条件转为 frozenset，年份区间展开为集合，匹配时仅做 O(1) 查找"""
+    __slots__ = ("tag", "item_type", "countries", "genres", "years", "has_years", "match_all", "is_negative")
+
+    def __init__(self, rule: Dict[str, Any], years: List[int]):
+        conditions = rule.get("conditions", {}) or {}
+        limit = rule.get("item_type", "all")
+        self.tag = rule["tag"]
+        self.item_type = _ANY_TYPE if limit == "all" else _TYPE_MAP.get(str(limit).lower())
+        self.countries: FrozenSet = frozenset(conditions.get("countries") or ())
+        self.genres: FrozenSet = frozenset(conditions.get("genres") or ())
+        # years_text 非空但解析为空时，该条件恒不命中 (与旧逻辑一致)
+        self.has_years = bool(conditions.get("years_text"))
+        self.years: FrozenSet[int] = frozenset(years)
+        self.match_all = rule.get("match_all_conditions", False)
+        self.is_negative = rule.get("is_negative_match", False)
+
+    def matches(self, item_type: Any, countries: FrozenSet, genres: FrozenSet, year: Any) -> bool:
+        if self.item_type is not _ANY_TYPE and self.item_type != item_type:
+            return False
+
+        results = []
+        if self.countries:
+            results.append(not self.countries.isdisjoint(countries))
+        if self.genres:
+            results.append(not self.genres.isdisjoint(genres))
+        if self.has_years:
+            results.append(year in self.years)
+
+        if not results:
+            final_match = False
+        elif self.match_all:
+            final_match = all(results)
+        else:
+            final_match = any(results)
+        return not final_match if self.is_negative else final_match
+
+def _reference_match_rule(tagger: "Tagger", item_props: Dict[str, Any], rule: Dict[str, Any]) -> bool:
+    """
+    预编译前的逐条匹配算法原样保留，仅作为基准测试的对照与一致性校验，不要在业务路径中使用。
+    """
+    conditions = rule.get("conditions", {})
+    item_type_limit = rule.get("item_type", "all")
+
+    if item_type_limit != "all":
+        it_map = {"movie": "Movie", "series": "Series"}
+        if it_map.get(item_type_limit.lower()) != item_props.get("type"):
+            return False
+
+    match_all = rule.get("match_all_conditions", False)
+    is_negative = rule.get("is_negative_match", False)
+
+    results = []
+    if conditions.get("countries"):
+        results.append(any(c in item_props.get("countries", []) for c in conditions["countries"]))
+    if conditions.get("genres"):
+        results.append(any(g in item_props.get("genre_names", []) for g in conditions["genres"]))
+    if conditions.get("years_text"):
+        allowed = tagger._parse_years(conditions["years_text"])
+        results.append(item_props.get("year") in allowed if allowed else False)
+
+    if not results:
+        final_match = False
+    elif match_all:
+        final_match = all(results)
+    else:
+        final_match = any(results)
+    return not final_match if is_negative else final_match
+
 class Tagger:
     def __init__(self, rules: List[Dict[str, Any]]):
         self.rules = rules
+        self._compile()
+
+    def _compile(self):
+        """
+        一次性编译全部规则并建立倒排索引 (国家/流派/年份 -> 候选规则)。
+        正向规则至少命中一个条件才可能匹配，因此只需评估索引命中的候选；
+        负向规则在条件全不命中时也会匹配，始终参与评估。
+        """
+        self._compiled: List[_CompiledRule] = [_CompiledRule(r, self._parse_years(r.get("conditions", {}).get("years_text"))) for r in self.rules]
+        self._by_country: Dict[Any, List[int]] = {}
+        self._by_genre: Dict[Any, List[int]] = {}
+        self._by_year: Dict[int, List[int]] = {}
+        self._always: Tuple[int, ...] = tuple(i for i, c in enumerate(self._compiled) if c.is_negative)
+        for i, c in enumerate(self._compiled):
+            if c.is_negative: continue
+            for key in c.countries: self._by_country.setdefault(key, []).append(i)
+            for key in c.genres: self._by_genre.setdefault(key, []).append(i)
+            for key in c.years: self._by_year.setdefault(key, []).append(i)
 
     def _parse_years(self, year_input: Any) -> List[int]:
         """年份范围解析逻辑"""
@@ -27,56 +119,71 @@ class Tagger:
 
     def match_rule(self, item_props: Dict[str, Any], rule: Dict[str, Any]) -> bool:
         """
-        匹配算法逻辑。
+        匹配算法逻辑 (单条规则，按需编译；批量打标请使用 generate_tags)。
         """
-        conditions = rule.get("conditions", {})
-        item_type_limit = rule.get("item_type", "all")
-        
-        # 1. 检查类型 (Movie/Series)
-        if item_type_limit != "all":
-            it_map = {"movie": "Movie", "series": "Series"}
-            if it_map.get(item_type_limit.lower()) != item_props.get("type"):
-                return False
-            
-        match_all = rule.get("match_all_conditions", False)
-        is_negative = rule.get("is_negative_match", False)
-        
-        # --- 核心算法：分项判定 ---
-        
-        results = []
-        
-        # 判定国家 (满足任一所选国家)
-        if conditions.get("countries"):
-            # 兼容：原项目可能匹配 ISO 代码也可能匹配中文名
-            # 我们在 props 里准备了映射后的名称
-            matched = any(c in item_props.get("countries", []) for c in conditions["countries"])
-            results.append(matched)
-            
-        # 判定流派 (满足任一所选流派)
-        if conditions.get("genres"):
-            matched = any(g in item_props.get("genre_names", []) for g in conditions["genres"])
-            results.append(matched)
-            
-        # 判定年份
-        if conditions.get("years_text"):
-            allowed = self._parse_years(conditions["years_text"])
-            matched = item_props.get("year") in allowed if allowed else False
-            results.append(matched)
-
-        # --- 1:1 结果计算逻辑 ---
-        if not results:
-            final_match = False # 无条件不匹配
-        elif match_all:
-            final_match = all(results) # 必须全部命中定义的分类
-        else:
-            final_match = any(results) # 命中任一定义的分类即可
-
-        # 负向匹配逻辑翻转
-        return not final_match if is_negative else final_match
+        compiled = _CompiledRule(rule, self._parse_years(rule.get("conditions", {}).get("years_text")))
+        return compiled.matches(
+            item_props.get("type"),
+            frozenset(item_props.get("countries", ())),
+            frozenset(item_props.get("genre_names", ())),
+            item_props.get("year")
+        )
 
     def generate_tags(self, item_props: Dict[str, Any]) -> List[str]:
-        tags = []
-        for rule in self.rules:
-            if self.match_rule(item_props, rule):
-                tags.append(rule["tag"])
-        return list(set(tags))
\ No newline at end of file
+        countries = frozenset(item_props.get("countries", ()))
+        genres = frozenset(item_props.get("genre_names", ()))
+        year = item_props.get("year")
+        item_type = item_props.get("type")
+
+        candidates = set(self._always)
+        for c in countries: candidates.update(self._by_country.get(c, ()))
+        for g in genres: candidates.update(self._by_genre.get(g, ()))
+        candidates.update(self._by_year.get(year, ()))
+
+        tags = set()
+        compiled = self._compiled
+        for i in candidates:
+            rule = compiled[i]
+            if rule.tag not in tags and rule.matches(item_type, countries, genres, year):
+                tags.add(rule.tag)
+        return list(tags)
+
+    def benchmark(self, samples: int = 20000, seed: int = 0) -> Dict[str, Any]:
+        """
+        规则匹配微基准：以规则中出现过的国家/流派/年份随机合成条目属性，
+        分别测量预编译索引与预编译前的逐条匹配算法的吞吐，并校验两者结果一致。
+        没有规则时两种实现都不做实际匹配，测得的比值没有意义，直接跳过。
+        """
+        if not self.rules:
+            return {"rules": 0, "samples": 0, "skipped": True, "reason": "未配置规则"}
+        rng = random.Random(seed)
+        countries = sorted({c for r in self._compiled for c in r.countries}, key=str) or ["US"]
+        genres = sorted({g for r in self._compiled for g in r.genres}, key=str) or ["18"]
+        years = sorted({y for r in self._compiled for y in r.years}) or [2000]
+        items = [{
+            "countries": rng.sample(countries, min(len(countries), rng.randint(1, 2))),
+            "genre_names": rng.sample(genres, min(len(genres), rng.randint(1, 3))),
+            "year": rng.choice(years) + rng.choice((0, 0, 1, -30)),
+            "type": rng.choice(("Movie", "Series"))
+        } for _ in range(samples)]
+
+        start = time.perf_counter()
+        compiled_tags = [sorted(self.generate_tags(p)) for p in items]
+        compiled_s = time.perf_counter() - start
+
+        naive_samples = min(samples, 2000)
+        start = time.perf_counter()
+        naive_tags = [sorted({r["tag"] for r in self.rules if _reference_match_rule(self, p, r)}) for p in items[:naive_samples]]
+        naive_s = time.perf_counter() - start
+
+        compiled_rate = samples / compiled_s if compiled_s else 0.0
+        naive_rate = naive_samples / naive_s if naive_s else 0.0
+        return {
+            "rules": len(self.rules),
+            "samples": samples,
+            "skipped": False,
+            "compiled_items_per_sec": round(compiled_rate, 1),
+            "per_rule_items_per_sec": round(naive_rate, 1),
+            "speedup": round(compiled_rate / naive_rate, 1) if naive_rate else None,
+            "consistent": compiled_tags[:naive_samples] == naive_tags
+        }
@@ -126,6 +126,14 @@ async def startup_event():
     from app.services.telegram_bot_worker import TelegramBotWorker
     asyncio.create_task(TelegramBotWorker.start_all())
     
+    # 启动 Webhook 日志批量写入与保留清理
+    from app.services.webhook_log import WebhookLogBuffer
+    WebhookLogBuffer.start()
+    
+    # 启动 Webhook 自动标签任务队列
+    from app.api.autotags import start_webhook_workers
+    await start_webhook_workers()
+    
     # 初始化默认管理员
     from app.db.session import AsyncSessionLocal
     async with AsyncSessionLocal() as db:
@@ -191,6 +199,10 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("正在关闭服务...")
+    from app.services.webhook_log import WebhookLogBuffer
+    await WebhookLogBuffer.stop()
+    from app.utils.http_client import close_shared_clients
+    await close_shared_clients()
     logger.info("[系统] 服务已安全关闭。")
 
 # WebSocket 实时日志
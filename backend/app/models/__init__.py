@@ -1,9 +1,12 @@
 from app.db.session import Base
-from .media import MediaItem, DedupeRule
-from .webhook import WebhookLog
+from .media import MediaItem, DedupeRule, MediaSyncState, MediaDuplicateGroup
+from .webhook import WebhookLog, WebhookJob
 from .user import User
 from .config import SystemConfig
 from .backup import BackupHistory
+from .tmdb import TmdbCache
+from .autotag import AutotagFingerprint
+from .job import JobHistory
 from app.modules.image_builder.models import BuildTaskLog
 
-__all__ = ["Base", "MediaItem", "DedupeRule", "WebhookLog", "User", "SystemConfig", "BackupHistory", "BuildTaskLog"]
+__all__ = ["Base", "MediaItem", "DedupeRule", "MediaSyncState", "MediaDuplicateGroup", "WebhookLog", "WebhookJob", "User", "SystemConfig", "BackupHistory", "TmdbCache", "AutotagFingerprint", "JobHistory", "BuildTaskLog"]
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, JSON, DateTime
+from app.db.session import Base
+from datetime import datetime
+
+class AutotagFingerprint(Base):
+    """自动标签指纹：记录上次计算时的 TMDB ID、规则摘要与规则产出，二者未变且未超龄的项目无需重新请求 TMDB"""
+    __tablename__ = "autotag_fingerprints"
+    server_id = Column(String, primary_key=True)
+    item_id = Column(String, primary_key=True)
+    tmdb_id = Column(String, nullable=True)
+    rules_hash = Column(String) # 规则集 (或自定义标签) 摘要
+    applied_tags = Column(JSON, default=list) # 规则产出的目标标签
+    checked_at = Column(DateTime, default=datetime.now, index=True)
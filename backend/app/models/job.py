@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Text, Index
+from app.db.session import Base
+from datetime import datetime
+
+class JobHistory(Base):
+    """后台任务 (同步 / 自动标签 / 工具箱 / 备份 / 镜像构建等) 的结束记录"""
+    __tablename__ = "job_history"
+    id = Column(String, primary_key=True) # 任务 ID (与内存中的任务一致)
+    job_type = Column(String, index=True)
+    key = Column(String, nullable=True) # 并发策略的分组键 (如服务器 ID、备份任务 ID)
+    title = Column(String, nullable=True)
+    status = Column(String) # succeeded / failed / cancelled
+    params = Column(JSON, nullable=True)
+    progress = Column(JSON, nullable=True) # 结束时的进度计数快照
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, default=datetime.now)
+    duration_ms = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_job_history_finished", "finished_at", "id"),
+    )
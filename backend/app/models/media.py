@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, Boolean, Float
+from sqlalchemy import Column, Integer, String, JSON, Boolean, Float, DateTime, Index
 from app.db.session import Base
 
 class MediaItem(Base):
@@ -23,6 +23,32 @@ class MediaItem(Base):
     audio_codec = Column(String, nullable=True)
     
     raw_data = Column(JSON) # 完整的 Emby 响应 JSON
+    sync_token = Column(String, nullable=True) # 最近一次确认该条目仍存在的同步批次，用于清理过期条目
+
+    __table_args__ = (
+        # 查重分组 (电影/剧集按 tmdb_id，单集按 tmdb_id + 季 + 集) 直接走索引，不再全表扫描
+        Index("ix_media_items_dupe_key", "server_id", "item_type", "tmdb_id", "season_num", "episode_num"),
+        # 媒体浏览的 (name, id) 游标分页
+        Index("ix_media_items_server_name", "server_id", "name", "id"),
+    )
+
+class MediaSyncState(Base):
+    """每个服务器的增量同步水位线"""
+    __tablename__ = "media_sync_state"
+    server_id = Column(String, primary_key=True)
+    high_water_mark = Column(String, nullable=True) # Emby 侧最大的 DateLastSaved，作为下次 MinDateLastSaved
+    last_mode = Column(String, nullable=True) # full / incremental
+    last_sync_at = Column(DateTime, nullable=True)
+    last_full_sync_at = Column(DateTime, nullable=True)
+    item_count = Column(Integer, default=0)
+    dupes_refreshed_at = Column(DateTime, nullable=True) # 重复组表最近一次刷新时间
+
+class MediaDuplicateGroup(Base):
+    """持久化的重复组成员 (每个副本一行)，同步完成后整体刷新"""
+    __tablename__ = "media_duplicate_groups"
+    server_id = Column(String, primary_key=True)
+    group_key = Column(String, primary_key=True) # Movie-{tmdb} / Series-{tmdb} / TV-{tmdb}-S01E02
+    item_id = Column(String, primary_key=True)
 
 class DedupeRule(Base):
     __tablename__ = "dedupe_rules"
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, JSON, DateTime
+from app.db.session import Base
+from datetime import datetime
+
+class TmdbCache(Base):
+    """TMDB 响应缓存，键为 (路径, 参数, 语言) 的摘要 (不含 api_key)"""
+    __tablename__ = "tmdb_cache"
+    cache_key = Column(String, primary_key=True)
+    path = Column(String, index=True)
+    language = Column(String, nullable=True)
+    kind = Column(String) # movie / tv / season / episode / person / search / other
+    status_code = Column(Integer, default=200) # 200 正常缓存，404 为短期负缓存
+    payload = Column(JSON, nullable=True)
+    fetched_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Index
 from app.db.session import Base
 from datetime import datetime
 
@@ -9,3 +9,30 @@ class WebhookLog(Base):
     source_ip = Column(String)
     payload = Column(JSON) # 存储完整的原始 JSON
     created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # 列表按 (created_at, id) 倒序做游标分页
+        Index("ix_webhook_logs_created", "created_at", "id"),
+    )
+
+class WebhookJob(Base):
+    """持久化的 Webhook 自动化任务队列 (替代进程内 asyncio.Queue，重启不丢失)"""
+    __tablename__ = "webhook_jobs"
+    id = Column(Integer, primary_key=True)
+    emby_server_id = Column(String, nullable=True) # Emby 侧 ServerId
+    entity_id = Column(String) # 去重键：剧集使用 SeriesId，电影使用自身 Id
+    entity_name = Column(String, nullable=True)
+    event_type = Column(String, nullable=True)
+    payload = Column(JSON)
+    status = Column(String, default="pending") # pending / running / failed
+    event_count = Column(Integer, default=1) # 合并窗口内归并到该任务的事件数
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    not_before = Column(DateTime, default=datetime.now) # 到期前不会被领取 (替代 delay_seconds 的 sleep)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_webhook_jobs_due", "status", "not_before"),
+        Index("ix_webhook_jobs_entity", "emby_server_id", "entity_id", "status"),
+    )
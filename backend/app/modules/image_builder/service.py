@@ -485,15 +485,15 @@ class ImageBuilderService:
         }
         cred_dict = {"username": credential["username"], "encrypted_password": credential["encrypted_password"], "registry_url": registry["url"]} if credential else None
         proxy_dict = {"url": proxy["url"], "username": proxy.get("username"), "password": proxy.get("password")} if proxy else None
-        def task_wrapper():
+        async def runner(job):
             from app.db.session import AsyncSessionLocal
-            import asyncio
-            status = ImageBuilderService.run_docker_task_sync(task_id, project_dict, tag, cred_dict, proxy_dict, host_config)
-            async def update_db():
-                async with AsyncSessionLocal() as new_db: await ImageBuilderService.update_task_status(new_db, task_id, status)
+            status = await asyncio.to_thread(ImageBuilderService.run_docker_task_sync, task_id, project_dict, tag, cred_dict, proxy_dict, host_config)
             try:
-                loop = asyncio.new_event_loop()
-                loop.run_until_complete(update_db())
+                async with AsyncSessionLocal() as new_db: await ImageBuilderService.update_task_status(new_db, task_id, status)
             except: pass
-        asyncio.create_task(asyncio.to_thread(task_wrapper))
+            if status != "SUCCESS": raise RuntimeError(f"构建失败 (日志 #{task_id})")
+            return {"task_id": task_id, "status": status}
+        # 同一项目的构建经任务框架排队执行，避免并发构建互相覆盖镜像与临时 builder
+        from app.services.job_manager import JobManager
+        JobManager.submit("image_build", runner, key=project_id, title=f"镜像构建: {project['name']}:{tag}", params={"project_id": project_id, "tag": tag, "task_id": task_id})
         return task_id
\ No newline at end of file
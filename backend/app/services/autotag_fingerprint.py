@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import select
+from app.db.session import AsyncSessionLocal
+from app.models.autotag import AutotagFingerprint
+from app.services.media_store import build_upsert_stmt
+from app.utils.logger import logger
+
+FLUSH_SIZE = 500
+
+class AutotagFingerprintStore:
+    """
+    单次自动标签任务内的指纹读写：
+    启动时一次性载入该服务器的全部指纹，运行中缓冲新指纹并按批 upsert。
+    指纹仅在规则摘要、TMDB ID 均一致且未超过 max_age_hours 时视为有效；
+    有效期内 TMDB 侧的元数据变化不会被发现，超龄后重新请求 TMDB (通常命中 TMDB 缓存) 才会重新计算。
+    """
+    def __init__(self, server_id: str, rules_hash: str, max_age_hours: float = 168):
+        self.server_id = server_id
+        self.rules_hash = rules_hash
+        self.max_age = timedelta(hours=max_age_hours) if max_age_hours and max_age_hours > 0 else None
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.buffer: List[Dict[str, Any]] = []
+        self.written = 0
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(AutotagFingerprint.item_id, AutotagFingerprint.tmdb_id, AutotagFingerprint.rules_hash,
+                       AutotagFingerprint.applied_tags, AutotagFingerprint.checked_at)
+                .where(AutotagFingerprint.server_id == self.server_id)
+            )
+            self.rows = {r.item_id: r._asdict() for r in result}
+        return len(self.rows)
+
+    def lookup(self, item_id: str, tmdb_id: str) -> Optional[List[str]]:
+        """返回仍然有效的指纹所记录的目标标签，无效时返回 None"""
+        row = self.rows.get(item_id)
+        if not row or row["rules_hash"] != self.rules_hash or row["tmdb_id"] != str(tmdb_id):
+            return None
+        if self.max_age and (not row["checked_at"] or datetime.now() - row["checked_at"] > self.max_age):
+            return None
+        return list(row["applied_tags"] or [])
+
+    async def record(self, item_id: str, tmdb_id: str, tags: List[str]):
+        self.buffer.append({
+            "server_id": self.server_id,
+            "item_id": item_id,
+            "tmdb_id": str(tmdb_id),
+            "rules_hash": self.rules_hash,
+            "applied_tags": sorted(set(tags)),
+            "checked_at": datetime.now()
+        })
+        if len(self.buffer) >= FLUSH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self.buffer: return
+            rows, self.buffer = self.buffer, []
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(build_upsert_stmt(db.bind.dialect.name, AutotagFingerprint.__table__), rows)
+                    await db.commit()
+                self.written += len(rows)
+            except Exception as e:
+                # 指纹仅用于加速，写入失败不影响本次打标结果
+                logger.warning(f"┃  ⚠️ [自动标签] 指纹写入失败: {e}")
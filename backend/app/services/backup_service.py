@@ -75,7 +75,7 @@ class BackupService:
                     continue
 
                 scheduler.add_job(
-                    cls.run_backup_task,
+                    cls._scheduled_backup,
                     trigger=trigger,
                     args=[task_id],
                     id=f"backup_{task_id}",
@@ -293,6 +293,45 @@ class BackupService:
             await NotificationService.emit(event, title, msg)
         except Exception as e:
             logger.warning(f"⚠️ [Backup] 发送通知失败: {e}")
+        return {"success": success, "message": message, "history_id": history_id, "size_mb": round(total_size, 2)}
+
+    @classmethod
+    def enqueue_backup(cls, task_id: str):
+        """经任务框架提交备份：同一备份任务排队依次执行，避免手动触发与定时触发重叠"""
+        from app.services.job_manager import JobManager
+        task = next((t for t in get_config().get("backup_tasks", []) if t.get("id") == task_id), {})
+
+        async def runner(job):
+            result = await cls.run_backup_task(task_id)
+            if not result:
+                raise RuntimeError(f"找不到任务 ID: {task_id}")
+            if not result["success"]:
+                raise RuntimeError(result["message"])
+            return result
+
+        job, _ = JobManager.submit("backup", runner, key=task_id, title=f"备份: {task.get('name', task_id)}", params={"task_id": task_id})
+        return job
+
+    @classmethod
+    async def _scheduled_backup(cls, task_id: str):
+        cls.enqueue_backup(task_id)
+
+    @classmethod
+    def enqueue_restore(cls, history_id: int, clear_dst: bool = False):
+        """经任务框架提交还原，同一历史记录的还原排队执行"""
+        from app.services.job_manager import JobManager
+
+        async def runner(job):
+            success, message = await cls.run_restore_task(history_id, clear_dst)
+            if not success:
+                raise RuntimeError(message)
+            return {"success": success, "message": message}
+
+        job, _ = JobManager.submit(
+            "backup_restore", runner, key=str(history_id), title=f"还原备份 #{history_id}",
+            params={"history_id": history_id, "clear_dst": clear_dst}
+        )
+        return job
 
     @classmethod
     async def run_restore_task(cls, history_id: int, clear_dst: bool = False):
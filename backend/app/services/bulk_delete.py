@@ -0,0 +1,121 @@
+import asyncio
+from typing import List, Dict, Any, Optional, Set
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.media import MediaItem
+from app.services.emby import EmbyService
+from app.utils.logger import logger
+
+DEFAULT_DELETE_CONCURRENCY = 8
+MAX_ANCESTOR_DEPTH = 8
+
+async def fold_delete_targets(db: AsyncSession, server_id: str, item_ids: List[str]) -> Dict[str, Any]:
+    """
+    集合化折叠：任一祖先 (父、祖父...) 也在删除名单中的条目无需单独调用 Emby，
+    删除祖先时 Emby 会连带删除。返回 {items, roots, covered_by, missing}。
+    """
+    requested = list(dict.fromkeys(item_ids))
+    res = await db.execute(
+        select(MediaItem.id, MediaItem.parent_id, MediaItem.path)
+        .where(MediaItem.server_id == server_id, MediaItem.id.in_(requested))
+    )
+    items = {r.id: r for r in res}
+    parents: Dict[str, Optional[str]] = {i: r.parent_id for i, r in items.items()}
+
+    # 逐层补齐不在名单中的祖先 (剧集 -> 季 -> 剧)，每层一次查询
+    frontier = {p for p in parents.values() if p and p not in parents}
+    depth = 0
+    while frontier and depth < MAX_ANCESTOR_DEPTH:
+        res = await db.execute(
+            select(MediaItem.id, MediaItem.parent_id)
+            .where(MediaItem.server_id == server_id, MediaItem.id.in_(frontier))
+        )
+        found = {r.id: r.parent_id for r in res}
+        for pid in frontier:
+            parents[pid] = found.get(pid)
+        frontier = {p for p in found.values() if p and p not in parents}
+        depth += 1
+
+    roots: List[str] = []
+    covered_by: Dict[str, str] = {}
+    for eid in requested:
+        if eid not in items:
+            continue
+        ancestor, seen = parents.get(eid), {eid}
+        while ancestor and ancestor not in seen:
+            if ancestor in items:
+                covered_by[eid] = ancestor
+            seen.add(ancestor)
+            ancestor = parents.get(ancestor)
+        if eid not in covered_by:
+            roots.append(eid)
+    # covered_by 指向最外层的在册祖先，便于按根结果判定
+    return {
+        "items": items,
+        "roots": roots,
+        "covered_by": covered_by,
+        "missing": [eid for eid in requested if eid not in items]
+    }
+
+class BulkDeleteExecutor:
+    """有界并发的 Emby 删除执行器 (实际并发同时受服务器自适应限制器约束)"""
+    def __init__(self, service: EmbyService, concurrency: int = DEFAULT_DELETE_CONCURRENCY):
+        self.service = service
+        self.concurrency = max(1, int(concurrency or 1))
+
+    async def run(self, ids: List[str], labels: Dict[str, str] = None) -> Dict[str, bool]:
+        labels = labels or {}
+        results: Dict[str, bool] = {}
+        pending = iter(ids)
+
+        async def worker():
+            for eid in pending:
+                logger.warning(f"🔥 [清理] 执行 Emby 物理删除: {labels.get(eid) or eid}")
+                try:
+                    results[eid] = await self.service.delete_item(eid)
+                except Exception as e:
+                    logger.error(f"┃  ❌ 删除失败 [{eid}]: {e}")
+                    results[eid] = False
+
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, len(ids)))])
+        return results
+
+async def bulk_delete_items(db: AsyncSession, service: EmbyService, server_id: str, item_ids: List[str],
+                            concurrency: int = DEFAULT_DELETE_CONCURRENCY) -> Dict[str, Any]:
+    """
+    折叠 -> 并发删除 -> 仅清理 Emby 确认删除的本地记录。
+    失败条目保留在本地库并通过 retry_ids 返回，可原样再次提交续删。
+    """
+    plan = await fold_delete_targets(db, server_id, item_ids)
+    items, roots, covered_by = plan["items"], plan["roots"], plan["covered_by"]
+    confirmed = await BulkDeleteExecutor(service, concurrency).run(roots, {i: items[i].path for i in roots})
+
+    results = []
+    deleted_ids: Set[str] = set()
+    for eid in dict.fromkeys(item_ids):
+        if eid not in items:
+            results.append({"id": eid, "status": "not_found"})
+        elif eid in covered_by:
+            root = covered_by[eid]
+            ok = confirmed.get(root, False)
+            if ok: deleted_ids.add(eid)
+            results.append({"id": eid, "status": "folded" if ok else "failed", "covered_by": root})
+        else:
+            ok = confirmed.get(eid, False)
+            if ok: deleted_ids.add(eid)
+            results.append({"id": eid, "status": "deleted" if ok else "failed"})
+
+    if deleted_ids:
+        await db.execute(delete(MediaItem).where(MediaItem.server_id == server_id, MediaItem.id.in_(deleted_ids)))
+        await db.commit()
+
+    failed_roots = [eid for eid in roots if not confirmed.get(eid)]
+    return {
+        "success": len(roots) - len(failed_roots),
+        "skipped": len(covered_by),
+        "failed": len(failed_roots),
+        "local_removed": len(deleted_ids),
+        "results": results,
+        # 被折叠的子项随其根一起重试即可，无需重复提交
+        "retry_ids": failed_roots
+    }
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import List, Dict, Any
+from sqlalchemy import select, delete, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.media import MediaItem, MediaSyncState, MediaDuplicateGroup
+from app.utils.logger import logger
+
+# 查重列表的精简投影：不加载 raw_data 大字段
+LEAN_COLUMNS = [
+    MediaItem.id, MediaItem.name, MediaItem.item_type, MediaItem.path, MediaItem.year, MediaItem.parent_id,
+    MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num,
+    MediaItem.display_title, MediaItem.video_codec, MediaItem.video_range, MediaItem.audio_codec
+]
+
+def duplicate_group_key(item_type: str, tmdb_id: str, season_num: int = None, episode_num: int = None) -> str:
+    if item_type == "Episode":
+        return f"TV-{tmdb_id}-S{str(season_num or 0).zfill(2)}E{str(episode_num or 0).zfill(2)}"
+    return f"{item_type}-{tmdb_id}"
+
+class DuplicateGroupService:
+    """
+    SQL 侧重复分组。
+    分组查询命中 (server_id, item_type, tmdb_id, season_num, episode_num) 复合索引，
+    结果写入 media_duplicate_groups，查重列表与智能分析直接读取，无需每次重新分组。
+    """
+
+    @staticmethod
+    async def _query_members(db: AsyncSession, server_id: str) -> List[Any]:
+        body_sub = (
+            select(MediaItem.item_type, MediaItem.tmdb_id)
+            .where(MediaItem.server_id == server_id, MediaItem.item_type.in_(["Movie", "Series"]), MediaItem.tmdb_id.isnot(None))
+            .group_by(MediaItem.item_type, MediaItem.tmdb_id)
+            .having(func.count(MediaItem.id) > 1)
+            .subquery()
+        )
+        bodies = await db.execute(
+            select(MediaItem.id, MediaItem.item_type, MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num)
+            .join(body_sub, and_(MediaItem.item_type == body_sub.c.item_type, MediaItem.tmdb_id == body_sub.c.tmdb_id))
+            .where(MediaItem.server_id == server_id)
+        )
+
+        ep_sub = (
+            select(MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num)
+            .where(MediaItem.server_id == server_id, MediaItem.item_type == "Episode", MediaItem.tmdb_id.isnot(None))
+            .group_by(MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num)
+            .having(func.count(MediaItem.id) > 1)
+            .subquery()
+        )
+        eps = await db.execute(
+            select(MediaItem.id, MediaItem.item_type, MediaItem.tmdb_id, MediaItem.season_num, MediaItem.episode_num)
+            .join(ep_sub, and_(
+                MediaItem.tmdb_id == ep_sub.c.tmdb_id,
+                MediaItem.season_num.is_not_distinct_from(ep_sub.c.season_num),
+                MediaItem.episode_num.is_not_distinct_from(ep_sub.c.episode_num)
+            ))
+            .where(MediaItem.server_id == server_id, MediaItem.item_type == "Episode")
+        )
+        return list(bodies.all()) + list(eps.all())
+
+    @classmethod
+    async def refresh(cls, db: AsyncSession, server_id: str) -> int:
+        """重新计算并持久化指定服务器的重复组，返回重复组数量"""
+        members = await cls._query_members(db, server_id)
+        rows = [
+            {"server_id": server_id, "group_key": duplicate_group_key(m.item_type, m.tmdb_id, m.season_num, m.episode_num), "item_id": m.id}
+            for m in members
+        ]
+        await db.execute(delete(MediaDuplicateGroup).where(MediaDuplicateGroup.server_id == server_id))
+        if rows:
+            await db.execute(MediaDuplicateGroup.__table__.insert(), rows)
+
+        state = (await db.execute(select(MediaSyncState).where(MediaSyncState.server_id == server_id))).scalars().first()
+        if not state:
+            state = MediaSyncState(server_id=server_id)
+            db.add(state)
+        state.dupes_refreshed_at = datetime.now()
+        await db.commit()
+
+        group_count = len({r["group_key"] for r in rows})
+        logger.info(f"┣ 🧮 重复组已刷新: {group_count} 组 / {len(rows)} 个副本")
+        return group_count
+
+    @classmethod
+    async def ensure_fresh(cls, db: AsyncSession, server_id: str):
+        """从未刷新过 (如升级后首次使用) 时先计算一次"""
+        res = await db.execute(select(MediaSyncState.dupes_refreshed_at).where(MediaSyncState.server_id == server_id))
+        if res.scalar() is None:
+            await cls.refresh(db, server_id)
+
+    @classmethod
+    async def load_items(cls, db: AsyncSession, server_id: str, columns: List[Any]) -> List[Any]:
+        """
+        读取重复组成员的指定列，附带 group_key。
+        已被删除的条目会因 JOIN 自动剔除，剩余副本不足两个的组一并过滤。
+        """
+        await cls.ensure_fresh(db, server_id)
+        res = await db.execute(
+            select(MediaDuplicateGroup.group_key, *columns)
+            .join(MediaItem, and_(MediaItem.server_id == MediaDuplicateGroup.server_id, MediaItem.id == MediaDuplicateGroup.item_id))
+            .where(MediaDuplicateGroup.server_id == server_id)
+            .order_by(MediaDuplicateGroup.group_key)
+        )
+        rows = res.all()
+        sizes: Dict[str, int] = {}
+        for r in rows:
+            sizes[r.group_key] = sizes.get(r.group_key, 0) + 1
+        return [r for r in rows if sizes[r.group_key] > 1]
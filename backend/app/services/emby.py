@@ -2,11 +2,12 @@ import httpx
 import json
 from typing import List, Dict, Any, Optional
 from app.utils.logger import logger
-from app.utils.http_client import get_async_client
+from app.utils.http_client import get_shared_client
+from app.utils.concurrency import get_emby_limiter
 from app.core.config_manager import get_config
 
 class EmbyService:
-    def __init__(self, url: str, api_key: str, user_id: str = None, tmdb_key: str = None):
+    def __init__(self, url: str, api_key: str, user_id: str = None, tmdb_key: str = None, server_id: str = None):
         self.url = url.strip().rstrip('/')
         # 兼容性处理：如果用户填写的 URL 已经包含了 /emby，则不再重复添加
         if self.url.endswith('/emby'):
@@ -18,6 +19,8 @@ class EmbyService:
         self.api_key = api_key.strip() if api_key else ""
         self.user_id = user_id.strip() if user_id else None
         self.tmdb_key = tmdb_key.strip() if tmdb_key else None
+        # 连接池按服务器复用；未保存的临时服务器 (如连接测试) 以地址区分
+        self.server_id = server_id or self.url
         self.headers = {
             "X-Emby-Token": self.api_key,
             "Content-Type": "application/json",
@@ -28,7 +31,7 @@ class EmbyService:
         config = get_config()
         proxy_cfg = config.get("proxy", {})
         use_proxy = not proxy_cfg.get("exclude_emby", True)
-        return get_async_client(timeout=30.0, headers=self.headers, use_proxy=use_proxy)
+        return get_shared_client(f"emby:{self.server_id}", use_proxy=use_proxy, timeout=30.0)
 
     async def _request(self, method: str, endpoint: str, params: Dict = None, json_data: Dict = None):
         """遵循 Emby 底层请求逻辑"""
@@ -47,11 +50,12 @@ class EmbyService:
             logger.info(f"┃  ┃  📦 Payload: {payload_peek}")
 
         try:
-            async with self._get_client() as client:
-                response = await client.request(method, url, params=full_params, json=json_data)
-                res_text = response.text if response.text else "(No Content)"
-                logger.info(f"┃  ┃  📥 [Emby 响应] Status: {response.status_code} | Body: {res_text[:200]}")
-                return response
+            async with get_emby_limiter(self.server_id).slot() as slot:
+                response = await self._get_client().request(method, url, params=full_params, json=json_data, headers=self.headers)
+                slot.observe(response.status_code)
+            res_text = response.text if response.text else "(No Content)"
+            logger.info(f"┃  ┃  📥 [Emby 响应] Status: {response.status_code} | Body: {res_text[:200]}")
+            return response
         except Exception as e:
             logger.error(f"┃  ┃  ❌ 指令发送异常 ({type(e).__name__}): {str(e)}")
             return None
@@ -74,15 +78,28 @@ class EmbyService:
         resp = await self._request("GET", "/Items", params=params)
         return resp.json().get("Items", []) if resp and resp.status_code == 200 else []
 
+    async def get_items_by_ids(self, item_ids: List[str], fields: str = None) -> Optional[List[Dict[str, Any]]]:
+        """按 ID 批量获取项目 (单次请求)，请求失败返回 None 以便调用方区分“失败”与“不存在”"""
+        if not item_ids:
+            return []
+        params = {"Ids": ",".join(item_ids), "Recursive": "true"}
+        if fields:
+            params["Fields"] = fields
+        resp = await self._request("GET", "/Items", params=params)
+        if not resp or resp.status_code != 200:
+            return None
+        return resp.json().get("Items", [])
+
     async def get_item(self, item_id: str) -> Optional[Dict[str, Any]]:
         """获取单个项目的完整元数据 (强制全字段模式)"""
         full_fields = "ProviderIds,Name,Type,Id,Path,Overview,Genres,GenreItems,People,LockedFields,LockData,ChannelMappingInfo,MediaSources,MediaStreams"
         params = {"Fields": full_fields}
         try:
-            async with self._get_client() as client:
-                url = f"{self.url}/emby/Users/{self.user_id}/Items/{item_id}" if self.user_id else f"{self.url}/emby/Items/{item_id}"
-                response = await client.get(url, params={**params, "api_key": self.api_key})
-                return response.json() if response.status_code == 200 else None
+            url = f"{self.url}/emby/Users/{self.user_id}/Items/{item_id}" if self.user_id else f"{self.url}/emby/Items/{item_id}"
+            async with get_emby_limiter(self.server_id).slot() as slot:
+                response = await self._get_client().get(url, params={**params, "api_key": self.api_key}, headers=self.headers)
+                slot.observe(response.status_code)
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"┃  ┃  ❌ 获取项目详情异常 ({type(e).__name__}): {str(e)}")
             return None
@@ -125,5 +142,6 @@ def get_emby_service(server_id: str = None, emby_id: str = None) -> Optional[Emb
         url=target_server.get("url", ""),
         api_key=token,
         user_id=target_server.get("user_id"),
-        tmdb_key=config.get("tmdb_api_key")
+        tmdb_key=config.get("tmdb_api_key"),
+        server_id=target_server.get("id")
     )
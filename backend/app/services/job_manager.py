@@ -0,0 +1,276 @@
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple, Set, List
+from app.db.session import AsyncSessionLocal
+from app.models.job import JobHistory
+from app.utils.logger import logger
+
+# 各任务类型的并发策略 (按 (类型, key) 分组生效):
+# - single_flight: 已有同组任务排队/执行中时不再新建，直接返回该任务
+# - queue: 同组任务依次执行
+# - parallel: 不限制
+JOB_POLICIES = {
+    "media_sync": "single_flight",
+    "autotag": "single_flight",
+    "autotag_clear": "single_flight",
+    "toolkit": "parallel",
+    "backup": "queue",
+    "backup_restore": "queue",
+    "image_build": "queue",
+}
+DEFAULT_POLICY = "parallel"
+MAX_RECENT_JOBS = 100
+
+class JobCancelled(Exception):
+    """任务在检查点响应取消请求时抛出"""
+
+def _json_safe(data: Any) -> Any:
+    try:
+        return json.loads(json.dumps(data, ensure_ascii=False, default=str))
+    except Exception:
+        return str(data)
+
+class Job:
+    """
+    后台任务句柄：进度计数、ETA 与取消令牌。
+    执行函数可通过 update()/advance() 上报进度，或 bind_progress() 绑定已有的进度快照；
+    长循环中调用 check_cancelled() 以协作方式响应取消。
+    """
+    def __init__(self, job_type: str, key: Optional[str], title: Optional[str], params: Optional[Dict[str, Any]],
+                 job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.key = key
+        self.title = title or job_type
+        self.params = params or {}
+        self.status = "queued" # queued / running / succeeded / failed / cancelled
+        self.total = 0
+        self.done = 0
+        self.phase: Optional[str] = None
+        self.counters: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.cancel_event = asyncio.Event()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._progress_source: Optional[Callable[[], Dict[str, Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._entered = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def update(self, done: Optional[int] = None, total: Optional[int] = None, phase: Optional[str] = None, **counters):
+        if done is not None: self.done = done
+        if total is not None: self.total = total
+        if phase is not None: self.phase = phase
+        self.counters.update(counters)
+
+    def advance(self, n: int = 1):
+        self.done += n
+
+    def bind_progress(self, source: Callable[[], Dict[str, Any]]):
+        """绑定进度来源，返回的 dict 中 total / done / phase 会覆盖自身计数"""
+        self._progress_source = source
+
+    def progress(self) -> Dict[str, Any]:
+        data = {"total": self.total, "done": self.done, "phase": self.phase, **self.counters}
+        if self._progress_source:
+            try:
+                data.update(self._progress_source() or {})
+            except Exception:
+                pass
+        return data
+
+    def snapshot(self) -> Dict[str, Any]:
+        progress = self.progress()
+        total, done = progress.get("total") or 0, progress.get("done") or 0
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        return {
+            "id": self.id,
+            "type": self.type,
+            "key": self.key,
+            "title": self.title,
+            "status": self.status,
+            "cancel_requested": self.cancel_requested,
+            "params": self.params,
+            "progress": progress,
+            "percent": round(done / total * 100, 1) if total else (100.0 if self.status == "succeeded" else 0.0),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(max(total - done, 0) / rate, 1) if self.status == "running" and total and rate > 0 else None,
+            "error": self.error,
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+            "finished_at": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None
+        }
+
+class JobManager:
+    """进程内任务注册表：按类型策略调度、跟踪进度、支持取消，结束后写入 job_history 并推送给订阅者"""
+    _jobs: "OrderedDict[str, Job]" = OrderedDict()
+    _locks: Dict[Tuple[str, Optional[str]], asyncio.Lock] = {}
+    _subscribers: Set[asyncio.Queue] = set()
+
+    @classmethod
+    def submit(cls, job_type: str, runner: Callable[[Job], Awaitable[Any]], key: Optional[str] = None,
+               title: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+               policy: Optional[str] = None, job_id: Optional[str] = None) -> Tuple[Job, bool]:
+        """
+        提交任务，返回 (任务, 是否新建)；single_flight 命中已有任务时返回该任务与 False。
+        job_id 可由调用方预先生成，便于在执行函数启动前建立关联对象。
+        """
+        policy = policy or JOB_POLICIES.get(job_type, DEFAULT_POLICY)
+        if policy == "single_flight":
+            existing = next((j for j in cls._jobs.values() if j.type == job_type and j.key == key and not j.finished), None)
+            if existing:
+                logger.info(f"┣ 🔁 [任务] {existing.title} 已在执行中 (#{existing.id})，复用该任务")
+                return existing, False
+        job = Job(job_type, key, title, params, job_id)
+        cls._jobs[job.id] = job
+        job._task = asyncio.create_task(cls._execute(job, runner, policy))
+        cls._publish("job.created", job)
+        return job, True
+
+    @classmethod
+    async def _execute(cls, job: Job, runner: Callable[[Job], Awaitable[Any]], policy: str):
+        job._entered = True
+        try:
+            if job.cancel_requested:
+                # 尚未开始调度即被取消
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            elif policy == "queue":
+                lock = cls._locks.setdefault((job.type, job.key), asyncio.Lock())
+                async with lock:
+                    await cls._run(job, runner)
+            else:
+                await cls._run(job, runner)
+        except asyncio.CancelledError:
+            # 排队中被取消或强制取消
+            if not job.finished:
+                job.status = "cancelled"
+                job.finished_at = time.time()
+        finally:
+            await cls._persist(job)
+            cls._publish("job.finished", job)
+            cls._trim()
+
+    @classmethod
+    async def _run(cls, job: Job, runner: Callable[[Job], Awaitable[Any]]):
+        if job.cancel_requested:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        cls._publish("job.started", job)
+        try:
+            job.result = await runner(job)
+            job.status = "cancelled" if job.cancel_requested else "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e) or type(e).__name__
+            logger.error(f"❌ [任务] {job.title} (#{job.id}) 执行失败: {job.error}")
+        finally:
+            job.finished_at = time.time()
+
+    @classmethod
+    async def wait(cls, job: Job) -> Job:
+        """等待任务结束 (调用方断开不会中断任务)"""
+        if job._task and not job._task.done():
+            try:
+                await asyncio.shield(job._task)
+            except asyncio.CancelledError:
+                if not job._task.done(): raise
+        return job
+
+    @classmethod
+    def cancel(cls, job_id: str, force: bool = False) -> Optional[Job]:
+        """请求取消：执行中的任务在下一个检查点退出；排队中或 force 时直接取消协程"""
+        job = cls._jobs.get(job_id)
+        if not job or job.finished:
+            return job
+        job.cancel_event.set()
+        # 协程尚未开始执行时不能直接 cancel (否则收尾逻辑不会运行)，由 _execute 入口检查令牌
+        if job._entered and (job.status == "queued" or force) and job._task:
+            job._task.cancel()
+        cls._publish("job.cancel_requested", job)
+        return job
+
+    @classmethod
+    def get(cls, job_id: str) -> Optional[Job]:
+        return cls._jobs.get(job_id)
+
+    @classmethod
+    def active(cls, job_type: Optional[str] = None) -> List[Job]:
+        return [j for j in cls._jobs.values() if not j.finished and (job_type is None or j.type == job_type)]
+
+    @classmethod
+    def recent(cls) -> List[Job]:
+        return list(reversed(cls._jobs.values()))
+
+    @classmethod
+    def _trim(cls):
+        finished = [jid for jid, j in cls._jobs.items() if j.finished]
+        for jid in finished[:max(len(finished) - MAX_RECENT_JOBS, 0)]:
+            cls._jobs.pop(jid, None)
+
+    @classmethod
+    async def _persist(cls, job: Job):
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add(JobHistory(
+                    id=job.id,
+                    job_type=job.type,
+                    key=job.key,
+                    title=job.title,
+                    status=job.status,
+                    params=_json_safe(job.params),
+                    progress=_json_safe(job.progress()),
+                    result=_json_safe(job.result),
+                    error=job.error,
+                    created_at=datetime.fromtimestamp(job.created_at),
+                    started_at=datetime.fromtimestamp(job.started_at) if job.started_at else None,
+                    finished_at=datetime.fromtimestamp(job.finished_at or time.time()),
+                    duration_ms=int(((job.finished_at or time.time()) - (job.started_at or job.created_at)) * 1000)
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"┣ ⚠️ [任务] 历史记录写入失败 (#{job.id}): {e}")
+
+    @classmethod
+    def subscribe(cls) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=200)
+        cls._subscribers.add(queue)
+        return queue
+
+    @classmethod
+    def unsubscribe(cls, queue: asyncio.Queue):
+        cls._subscribers.discard(queue)
+
+    @classmethod
+    def _publish(cls, event: str, job: Job):
+        message = {"event": event, "job": job.snapshot()}
+        for queue in list(cls._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                pass
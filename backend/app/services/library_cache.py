@@ -0,0 +1,90 @@
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config_manager import get_config
+from app.services.emby import EmbyService, get_emby_service
+from app.utils.logger import logger
+
+DEFAULT_TTL_SECONDS = 300
+# 媒体库结构变化 (新建/删除/修改媒体库) 的 Webhook 事件；条目增删不影响媒体库列表，不触发失效
+LIBRARY_CHANGE_EVENTS = {"library.new", "library.deleted", "library.changed", "LibraryChanged"}
+
+class LibraryCache:
+    """
+    按服务器缓存 /Library/VirtualFolders (媒体库列表)，短 TTL 过期。
+    同一服务器的并发请求合并为一次调用；媒体库相关 Webhook 触发失效，切换服务器时预加载。
+    """
+    _entries: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+    _inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _ttl() -> float:
+        return float(get_config().get("library_cache_ttl_seconds", DEFAULT_TTL_SECONDS) or 0)
+
+    @classmethod
+    async def _fetch(cls, service: EmbyService) -> Optional[List[Dict[str, Any]]]:
+        resp = await service._request("GET", "/Library/VirtualFolders")
+        if resp is None or resp.status_code != 200:
+            return None
+        return resp.json()
+
+    @classmethod
+    async def get_folders(cls, service: EmbyService, force: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """返回媒体库列表，请求失败时返回 None (失败结果不缓存)"""
+        key = service.server_id
+        entry = cls._entries.get(key)
+        if entry and not force and entry[0] > time.time():
+            return entry[1]
+
+        future = cls._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        cls._inflight[key] = future
+        try:
+            folders = await cls._fetch(service)
+            if folders is not None:
+                cls._entries[key] = (time.time() + cls._ttl(), folders)
+            future.set_result(folders)
+            return folders
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            cls._inflight.pop(key, None)
+            # 没有其他等待者时避免 "Future exception was never retrieved" 警告
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                future.exception()
+
+    @classmethod
+    async def get_library_id(cls, service: EmbyService, lib_name: str) -> Optional[str]:
+        for f in await cls.get_folders(service) or []:
+            if f.get("Name") == lib_name: return f.get("ItemId")
+        return None
+
+    @classmethod
+    def invalidate(cls, server_id: Optional[str] = None):
+        if server_id is None:
+            cls._entries.clear()
+        else:
+            cls._entries.pop(server_id, None)
+
+    @classmethod
+    def invalidate_for_event(cls, event: Optional[str], emby_server_id: Optional[str] = None):
+        """Webhook 事件触发的失效；Emby 侧 ServerId 无法对应本地服务器时全部失效"""
+        if event not in LIBRARY_CHANGE_EVENTS:
+            return
+        server = next((s for s in get_config().get("emby_servers", []) if emby_server_id and s.get("emby_id") == emby_server_id), None)
+        cls.invalidate(server.get("id") if server else None)
+
+    @classmethod
+    async def preload(cls, server_id: str):
+        service = get_emby_service(server_id)
+        if not service:
+            return
+        try:
+            folders = await cls.get_folders(service, force=True)
+            logger.info(f"┣ 📚 媒体库列表已预加载: {len(folders) if folders is not None else '失败'}")
+        except Exception as e:
+            logger.warning(f"┣ ⚠️ 媒体库列表预加载失败: {e}")
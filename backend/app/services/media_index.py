@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import select, Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config_manager import get_config
+from app.models.media import MediaItem, MediaSyncState
+
+class LocalMediaIndex:
+    """
+    基于 media_items 的本地索引查询。
+    同步足够新时直接用 tmdb_id / parent_id 索引定位条目，只向 Emby 请求命中的少量 ID，
+    避免每次检索都下载整个媒体库。
+    """
+
+    @staticmethod
+    async def freshness(db: AsyncSession, server_id: str) -> Tuple[bool, Optional[datetime]]:
+        """返回 (是否可信, 最近同步时间)"""
+        res = await db.execute(select(MediaSyncState.last_sync_at).where(MediaSyncState.server_id == server_id))
+        last_sync = res.scalar()
+        if not last_sync:
+            return False, None
+        max_age = float(get_config().get("local_index_max_age_hours", 24) or 0)
+        if max_age <= 0:
+            return True, last_sync
+        return datetime.now() - last_sync <= timedelta(hours=max_age), last_sync
+
+    @staticmethod
+    async def ids_by_tmdb(db: AsyncSession, server_id: str, tmdb_id: str, item_types: List[str]) -> List[str]:
+        res = await db.execute(
+            select(MediaItem.id).where(
+                MediaItem.server_id == server_id,
+                MediaItem.item_type.in_(item_types),
+                MediaItem.tmdb_id == tmdb_id
+            )
+        )
+        return [r[0] for r in res.all()]
+
+    @staticmethod
+    async def series_of(db: AsyncSession, server_id: str, item_id: str) -> Optional[Row]:
+        """沿 parent_id 向上追溯 (单集 -> 季 -> 剧集)，返回所属剧集的 (id, name, item_type, tmdb_id, parent_id)"""
+        current = item_id
+        for _ in range(3):
+            res = await db.execute(
+                select(MediaItem.id, MediaItem.name, MediaItem.item_type, MediaItem.tmdb_id, MediaItem.parent_id)
+                .where(MediaItem.server_id == server_id, MediaItem.id == current)
+            )
+            row = res.first()
+            if not row:
+                return None
+            if row.item_type == "Series":
+                return row
+            if not row.parent_id:
+                return None
+            current = row.parent_id
+        return None
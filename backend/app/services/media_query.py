@@ -0,0 +1,99 @@
+import json
+import base64
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import select, func, and_, or_, text, literal_column, Integer, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.media import MediaItem, MediaSyncState
+from app.utils.db_repair import is_fts_ready
+
+# 单页上限，防止一次性拉取全库
+MAX_PAGE_SIZE = 1000
+ITEM_FIELDS = {c.name for c in MediaItem.__table__.columns}
+
+def encode_cursor(name: Optional[str], item_id: str) -> str:
+    raw = json.dumps([name, item_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], str]:
+    try:
+        name, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return name, str(item_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """解析 fields=name,path,... 投影参数，id 始终返回"""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in ITEM_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    return ["id"] + [f for f in names if f != "id"]
+
+# --- 全文检索 ---
+# trigram 分词器至少需要 3 个字符才能命中，更短的词回退到 ILIKE
+FTS_MIN_LENGTH = 3
+FTS_COLUMNS = ("name", "path")
+ROWID = literal_column("media_items.rowid")
+
+def fts_enabled() -> bool:
+    return is_fts_ready("media_items")
+
+def fts_usable(value: str) -> bool:
+    return fts_enabled() and len(value) >= FTS_MIN_LENGTH
+
+def fts_phrase(value: str, column: str = None) -> str:
+    phrase = '"' + value.replace('"', '""') + '"'
+    return f"{column}:{phrase}" if column else phrase
+
+def fts_matches(match: str, exact_id: str = None):
+    """
+    FTS 命中的 (rowid, rank) 子查询，rank 越小相关度越高。
+    exact_id 用于兼容按 Emby ID 精确搜索：主键命中的行以最高相关度并入结果。
+    """
+    sql = "SELECT rowid, rank FROM media_items_fts WHERE media_items_fts MATCH :fts_query"
+    params = {"fts_query": match}
+    if exact_id:
+        sql = (
+            f"SELECT rowid, min(rank) AS rank FROM ({sql} "
+            "UNION ALL SELECT rowid, -1e9 AS rank FROM media_items WHERE id = :fts_exact_id) GROUP BY rowid"
+        )
+        params["fts_exact_id"] = exact_id
+    return text(sql).bindparams(**params).columns(rowid=Integer, rank=Float).subquery("fts")
+
+def keyset_after(cursor: str):
+    """
+    (name, id) 游标之后的行。排序为 name NULLS FIRST, id，
+    与 (server_id, name, id) 索引顺序一致，任意页都是一次索引定位，翻页成本与页码无关。
+    """
+    name, item_id = decode_cursor(cursor)
+    if name is None:
+        return or_(and_(MediaItem.name.is_(None), MediaItem.id > item_id), MediaItem.name.isnot(None))
+    return or_(MediaItem.name > name, and_(MediaItem.name == name, MediaItem.id > item_id))
+
+def keyset_order():
+    return [MediaItem.name.asc().nulls_first(), MediaItem.id.asc()]
+
+# --- 总数缓存 ---
+# 键为 (服务器, 过滤条件)，值附带同步版本；同步或删除后自动失效，避免每次翻页都 COUNT(*)
+_count_cache: Dict[Tuple, Tuple[Any, int]] = {}
+
+async def _sync_version(db: AsyncSession, server_id: str) -> Any:
+    res = await db.execute(select(MediaSyncState.last_sync_at).where(MediaSyncState.server_id == server_id))
+    return res.scalar()
+
+async def cached_count(db: AsyncSession, server_id: str, filter_key: Tuple, query) -> int:
+    version = await _sync_version(db, server_id)
+    key = (server_id, filter_key)
+    hit = _count_cache.get(key)
+    if hit and hit[0] == version:
+        return hit[1]
+    res = await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))
+    total = res.scalar() or 0
+    _count_cache[key] = (version, total)
+    return total
+
+def invalidate_item_counts(server_id: str = None):
+    for key in [k for k in _count_cache if server_id is None or k[0] == server_id]:
+        _count_cache.pop(key, None)
@@ -0,0 +1,76 @@
+import time
+from typing import List, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.media import MediaItem
+from app.utils.logger import logger
+
+BATCH_SIZE = 500
+
+def build_upsert_stmt(dialect_name: str, table=MediaItem.__table__):
+    """构造 insert ... on conflict do update 语句 (SQLite / PostgreSQL 通用)"""
+    insert_fn = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert_fn(table)
+    pk_cols = [c.name for c in table.primary_key.columns]
+    update_cols = {c.name: stmt.excluded[c.name] for c in table.columns if c.name not in pk_cols}
+    return stmt.on_conflict_do_update(index_elements=pk_cols, set_=update_cols)
+
+class MediaItemWriter:
+    """
+    media_items 批量写入器。
+    行数据以 dict 形式缓冲，攒满 batch_size 后通过 core 层 executemany 一次性 upsert，
+    不经过 ORM 对象与 identity map，写入后立即释放缓冲，内存占用与库大小无关。
+    """
+    def __init__(self, db: AsyncSession, batch_size: int = BATCH_SIZE, commit_each_batch: bool = False):
+        self.db = db
+        self.batch_size = batch_size
+        # 逐批提交可以及时释放 SQLite 写锁，避免长时间阻塞其他写入方
+        self.commit_each_batch = commit_each_batch
+        self.stmt = build_upsert_stmt(db.bind.dialect.name)
+        self.buffer: List[Dict[str, Any]] = []
+        self.rows = 0
+        self.batches = 0
+        self.write_time = 0.0
+        self.start_time = time.time()
+
+    async def add(self, row: Dict[str, Any]):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def add_many(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            await self.add(row)
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        t0 = time.time()
+        await self.db.execute(self.stmt, self.buffer)
+        if self.commit_each_batch:
+            await self.db.commit()
+        self.write_time += time.time() - t0
+        self.rows += len(self.buffer)
+        self.batches += 1
+        self.buffer = []
+
+    @property
+    def rows_per_sec(self) -> float:
+        """纯写库吞吐 (不含上游拉取耗时)"""
+        return self.rows / self.write_time if self.write_time > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "write_seconds": round(self.write_time, 3),
+            "elapsed_seconds": round(time.time() - self.start_time, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1)
+        }
+
+    async def close(self) -> Dict[str, Any]:
+        await self.flush()
+        stats = self.stats()
+        logger.info(f"┣ 💾 批量写入完成: {stats['rows']} 行 / {stats['batches']} 批, 写库耗时 {stats['write_seconds']}s, 吞吐 {stats['rows_per_sec']} 行/秒")
+        return stats
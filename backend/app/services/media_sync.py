@@ -0,0 +1,398 @@
+import time
+import uuid
+import asyncio
+from datetime import datetime
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Awaitable
+from sqlalchemy import select, delete, update, func, or_, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.media import MediaItem, MediaSyncState
+from app.services.emby import EmbyService
+from app.services.media_store import MediaItemWriter
+from app.services.duplicate_groups import DuplicateGroupService
+from app.services.series_tree import SeriesTreeLoader
+from app.utils.concurrency import get_emby_limiter
+from app.services.job_manager import JobCancelled
+from app.utils.logger import logger, audit_log
+
+SYNC_FIELDS = "Path,ProductionYear,ProviderIds,MediaStreams,DisplayTitle,SortName,ParentId,SeriesId,SeasonId,IndexNumber,ParentIndexNumber,DateLastSaved"
+PAGE_SIZE = 300
+ID_PAGE_SIZE = 1000
+# 平铺扫描的单页条数：季/集数据较小，大页可以把请求数压到几十次
+FLAT_PAGE_SIZE = 1000
+SYNC_STRATEGIES = ("flat", "per_series")
+# 阶段间队列容量 (单位: 页)，决定了流水线在内存中最多滞留的数据量
+QUEUE_SIZE = 4
+# 偏移分页必须有稳定排序，否则扫描期间的增删会让条目在页间漂移而被漏掉；
+# 按入库时间排序时，扫描期间新增的条目只会追加到末尾
+PAGE_SORT = {"SortBy": "DateCreated,SortName", "SortOrder": "Ascending"}
+
+def build_media_row(item: Dict[str, Any], server_id: str) -> Dict[str, Any]:
+    """将 Emby 条目转换为 media_items 行数据"""
+    v = next((s for s in item.get("MediaStreams", []) if s.get("Type") == "Video"), {})
+    a = next((s for s in item.get("MediaStreams", []) if s.get("Type") == "Audio"), {})
+
+    s_num = item.get("ParentIndexNumber") if item.get("Type") == "Episode" else item.get("IndexNumber") if item.get("Type") == "Season" else None
+    e_num = item.get("IndexNumber") if item.get("Type") == "Episode" else None
+    p_id = item.get("SeasonId") or item.get("SeriesId") or item.get("ParentId")
+
+    return {
+        "id": item["Id"], "server_id": server_id, "name": item.get("Name"), "item_type": item.get("Type"),
+        "tmdb_id": item.get("ProviderIds", {}).get("Tmdb"), "path": item.get("Path"),
+        "year": item.get("ProductionYear"), "parent_id": p_id,
+        "season_num": s_num, "episode_num": e_num,
+        "display_title": v.get("DisplayTitle", "N/A"), "video_codec": v.get("Codec", "N/A"),
+        "video_range": v.get("VideoRange", "N/A"), "audio_codec": a.get("Codec", "N/A"),
+        "raw_data": item
+    }
+
+def inherit_series_tmdb(child: Dict[str, Any], series_tmdb: Optional[str]):
+    """季/集缺少 TMDB ID 时继承所属剧集的 TMDB ID"""
+    if series_tmdb and not child.get("ProviderIds", {}).get("Tmdb"):
+        if "ProviderIds" not in child: child["ProviderIds"] = {}
+        child["ProviderIds"]["Tmdb"] = series_tmdb
+
+# 生产者签名: 接收 emit(page) 回调，逐页推送原始条目
+Emit = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+class SyncPipeline:
+    """
+    fetch -> transform -> write 三段式流水线。
+    阶段之间以有界队列连接：写库变慢时队列填满，上游拉取自动暂停 (背压)，
+    任意时刻内存中只滞留 QUEUE_SIZE 页左右的数据，与库大小无关。
+    """
+    def __init__(self, db: AsyncSession, server_id: str, sync_token: str, series_tmdb: Dict[str, Optional[str]],
+                 on_item: Callable[[Dict[str, Any]], None] = None, check_cancelled: Callable[[], None] = None):
+        self.db = db
+        self.server_id = server_id
+        self.sync_token = sync_token
+        # 剧集 ID -> TMDB ID，规模与剧集数量成正比 (远小于单集数量)
+        self.series_tmdb = series_tmdb
+        self.on_item = on_item
+        self.check_cancelled = check_cancelled
+        self.pages: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.rows: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.writer = MediaItemWriter(db, commit_each_batch=True)
+
+    async def _transform(self):
+        while True:
+            page = await self.pages.get()
+            if page is None:
+                await self.rows.put(None)
+                return
+            if self.check_cancelled: self.check_cancelled()
+            batch = []
+            for item in page:
+                if self.on_item: self.on_item(item)
+                if item.get("Type") == "Series":
+                    self.series_tmdb[item["Id"]] = item.get("ProviderIds", {}).get("Tmdb")
+                elif item.get("SeriesId"):
+                    inherit_series_tmdb(item, self.series_tmdb.get(item["SeriesId"]))
+                row = build_media_row(item, self.server_id)
+                row["sync_token"] = self.sync_token
+                batch.append(row)
+            await self.rows.put(batch)
+
+    async def _write(self):
+        while True:
+            batch = await self.rows.get()
+            if batch is None:
+                return
+            await self.writer.add_many(batch)
+
+    async def run(self, producer: Callable[[Emit], Awaitable[None]]) -> Dict[str, Any]:
+        async def produce():
+            await producer(self.pages.put)
+            await self.pages.put(None)
+
+        tasks = [asyncio.create_task(c) for c in (produce(), self._transform(), self._write())]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            # 任一阶段失败都需要取消其余阶段，否则会阻塞在已满的队列上
+            for t in tasks: t.cancel()
+            raise
+        return await self.writer.close()
+
+class MediaSyncService:
+    """
+    媒体库同步引擎。
+    - full: 全量拉取并覆盖写入当前服务器的 media_items，结束后清理本轮未出现的条目
+    - incremental: 基于 DateLastSaved 水位线仅拉取变更条目，再以仅含 ID 的扫描标记存活条目并清理其余
+    - auto: 存在水位线时走增量，否则回退全量
+    全量模式下季/集的拉取策略:
+    - flat: 对全库季/集做递归大页扫描 (页间并发)，本地依据 SeriesId 继承 TMDB ID，请求数与剧集数量无关
+    - per_series: 每个剧集单独分页拉取子层级 (N 个剧集即 N+ 次请求)
+    """
+    def __init__(self, service: EmbyService, server_id: str, strategy: str = "flat",
+                 cancel_event: Optional[asyncio.Event] = None):
+        self.service = service
+        self.server_id = server_id
+        self.strategy = strategy if strategy in SYNC_STRATEGIES else "flat"
+        self.requests = 0
+        # 实际并发由服务器共享的 AIMD 限制器动态决定
+        self.limiter = get_emby_limiter(service.server_id)
+        self.sync_token = uuid.uuid4().hex
+        self.high_water_mark: Optional[str] = None
+        # 任一分页请求失败即置位，将跳过过期清理与水位推进，避免误删
+        self.fetch_failed = False
+        # 取消令牌：在分页之间、清理之前与水位推进之前检查，取消后不会清理也不会推进水位
+        self.cancel_event = cancel_event
+
+    def _check_cancelled(self):
+        if self.cancel_event and self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _check_complete(self, types: List[str], expected: Optional[int], received: int):
+        """实际收到的条目少于首页 TotalRecordCount 时视为拉取不完整"""
+        if expected is not None and received < expected:
+            self.fetch_failed = True
+            logger.warning(f"┣ ⚠️ {'/'.join(types)} 扫描不完整: 预期 {expected} 条，实际 {received} 条 (扫描期间可能有增删)")
+
+    def _track_mark(self, item: Dict[str, Any]):
+        saved = item.get("DateLastSaved")
+        if saved and (self.high_water_mark is None or saved > self.high_water_mark):
+            self.high_water_mark = saved
+
+    async def _fetch_page(self, types: List[str], start: int, page_size: int, parent_id: str = None,
+                          min_date: str = None, fields: str = SYNC_FIELDS) -> Optional[Dict[str, Any]]:
+        self._check_cancelled()
+        params = {
+            "IncludeItemTypes": ",".join(types), "Recursive": "true",
+            "Fields": fields, "StartIndex": start, "Limit": page_size, **PAGE_SORT
+        }
+        if parent_id: params["ParentId"] = parent_id
+        if min_date: params["MinDateLastSaved"] = min_date
+        self.requests += 1
+        resp = await self.service._request("GET", "/Items", params=params)
+        if not resp or resp.status_code != 200:
+            self.fetch_failed = True
+            return None
+        return resp.json()
+
+    async def iter_pages(self, types: List[str], parent_id: str = None, min_date: str = None,
+                         fields: str = SYNC_FIELDS, page_size: int = PAGE_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """逐页拉取 /Items，不在内存中累积"""
+        start, expected = 0, None
+        while True:
+            data = await self._fetch_page(types, start, page_size, parent_id, min_date, fields)
+            if data is None: return
+            if expected is None: expected = data.get("TotalRecordCount")
+            batch = data.get("Items", [])
+            if batch: yield batch
+            if len(batch) < page_size:
+                self._check_complete(types, expected, start + len(batch))
+                return
+            start += page_size
+
+    def _page_producer(self, types: List[str], min_date: str = None) -> Callable[[Emit], Awaitable[None]]:
+        async def producer(emit: Emit):
+            async for page in self.iter_pages(types, min_date=min_date):
+                await emit(page)
+        return producer
+
+    def _flat_producer(self, types: List[str], page_size: int = FLAT_PAGE_SIZE) -> Callable[[Emit], Awaitable[None]]:
+        """
+        平铺递归扫描：首页拿到 TotalRecordCount 后，其余页按偏移量并发拉取。
+        worker 数量受限制器上限约束，每个 worker 同时最多持有一页数据。
+        """
+        async def producer(emit: Emit):
+            first = await self._fetch_page(types, 0, page_size)
+            if not first: return
+            total = first.get("TotalRecordCount") or 0
+            received = len(first.get("Items", []))
+            await emit(first.get("Items", []))
+            offsets = iter(range(page_size, total, page_size))
+            n_pages = max(0, (total - 1) // page_size)
+            logger.info(f"┣ 📂 平铺扫描 {'/'.join(types)}: 共 {total} 条, {n_pages + 1} 页")
+
+            async def worker():
+                nonlocal received
+                for start in offsets:
+                    data = await self._fetch_page(types, start, page_size)
+                    if data and data.get("Items"):
+                        received += len(data["Items"])
+                        await emit(data["Items"])
+
+            await asyncio.gather(*[worker() for _ in range(min(self.limiter.max_limit, n_pages))])
+            # 扫描期间有条目被删除时，后续页会整体前移，少收到的部分可能是仍然存在的条目
+            self._check_complete(types, total, received)
+        return producer
+
+    def _children_producer(self, series_ids: List[str]) -> Callable[[Emit], Awaitable[None]]:
+        """
+        按剧集并发拉取季/集，多个剧集的分页共同汇入同一条有界队列。
+        worker 数量取限制器上限，保证滞留内存有界；真正的请求并发由限制器自适应调节。
+        """
+        async def producer(emit: Emit):
+            total_series = len(series_ids)
+            logger.info(f"┣ 📂 准备并发解析 {total_series} 个剧集的子层级 (当前并发上限: {int(self.limiter.limit)})...")
+            loader = SeriesTreeLoader(self.service, SYNC_FIELDS, PAGE_SIZE)
+
+            def progress(done: int, total: int):
+                if done % 20 == 0 or done == total:
+                    logger.info(f"┃  🕒 同步进度: {done}/{total}...")
+
+            try:
+                await loader.for_each_series(series_ids, emit, progress)
+            finally:
+                self.requests += loader.requests
+                if loader.failed: self.fetch_failed = True
+        return producer
+
+    async def _get_state(self, db: AsyncSession) -> Optional[MediaSyncState]:
+        res = await db.execute(select(MediaSyncState).where(MediaSyncState.server_id == self.server_id))
+        return res.scalars().first()
+
+    async def _load_series_tmdb(self, db: AsyncSession) -> Dict[str, Optional[str]]:
+        res = await db.execute(select(MediaItem.id, MediaItem.tmdb_id).where(
+            MediaItem.server_id == self.server_id, MediaItem.item_type == "Series"))
+        return {row.id: row.tmdb_id for row in res}
+
+    def _merge_write_stats(self, *stats: Dict[str, Any]) -> Dict[str, Any]:
+        rows = sum(s["rows"] for s in stats)
+        write_seconds = sum(s["write_seconds"] for s in stats)
+        return {
+            "rows": rows,
+            "batches": sum(s["batches"] for s in stats),
+            "write_seconds": round(write_seconds, 3),
+            "rows_per_sec": round(rows / write_seconds, 1) if write_seconds > 0 else 0.0
+        }
+
+    async def _run_full(self, db: AsyncSession) -> Dict[str, Any]:
+        series_tmdb: Dict[str, Optional[str]] = {}
+        series_ids: List[str] = []
+
+        def collect_series(item):
+            self._track_mark(item)
+            if item.get("Type") == "Series": series_ids.append(item["Id"])
+
+        top_stats = await SyncPipeline(db, self.server_id, self.sync_token, series_tmdb, collect_series, self._check_cancelled).run(
+            self._page_producer(["Movie", "Series"]))
+        children = self._flat_producer(["Season", "Episode"]) if self.strategy == "flat" else self._children_producer(series_ids)
+        child_stats = await SyncPipeline(db, self.server_id, self.sync_token, series_tmdb, self._track_mark, self._check_cancelled).run(children)
+        write_stats = self._merge_write_stats(top_stats, child_stats)
+        return {"upserted": write_stats["rows"], "write": write_stats}
+
+    async def _run_incremental(self, db: AsyncSession, since: str) -> Dict[str, Any]:
+        logger.info(f"┣ 🔁 增量模式: 拉取 DateLastSaved >= {since} 的变更条目...")
+        series_tmdb = await self._load_series_tmdb(db)
+        old_series_tmdb = dict(series_tmdb)
+        retmdb: List[str] = []
+
+        def detect_retmdb(item):
+            self._track_mark(item)
+            # 剧集自身 TMDB ID 变更时，其未变更的子项也需要重新继承
+            if item.get("Type") == "Series" and item["Id"] in old_series_tmdb \
+                    and old_series_tmdb[item["Id"]] != item.get("ProviderIds", {}).get("Tmdb"):
+                retmdb.append(item["Id"])
+
+        stats = [await SyncPipeline(db, self.server_id, self.sync_token, series_tmdb, detect_retmdb, self._check_cancelled).run(
+            self._page_producer(["Movie", "Series"], min_date=since))]
+        stats.append(await SyncPipeline(db, self.server_id, self.sync_token, series_tmdb, self._track_mark, self._check_cancelled).run(
+            self._page_producer(["Season", "Episode"], min_date=since)))
+        if retmdb:
+            logger.info(f"┣ 🔗 {len(retmdb)} 个剧集的 TMDB ID 发生变化，重新拉取其子层级")
+            stats.append(await SyncPipeline(db, self.server_id, self.sync_token, series_tmdb, self._track_mark, self._check_cancelled).run(
+                self._children_producer(retmdb)))
+        write_stats = self._merge_write_stats(*stats)
+
+        # 存活标记：仅拉取 ID，逐页为仍存在于 Emby 的条目打上本轮批次号
+        table = MediaItem.__table__
+        mark_stmt = update(table).where(
+            table.c.server_id == self.server_id, table.c.id == bindparam("b_id")
+        ).values(sync_token=self.sync_token)
+        async for page in self.iter_pages(["Movie", "Series", "Season", "Episode"], fields="DateLastSaved", page_size=ID_PAGE_SIZE):
+            await db.execute(mark_stmt, [{"b_id": i["Id"]} for i in page])
+            await db.commit()
+        return {"upserted": write_stats["rows"], "write": write_stats}
+
+    async def _prune_stale(self, db: AsyncSession) -> int:
+        """删除本轮未被写入或标记的条目，即 Emby 侧已不存在的条目"""
+        res = await db.execute(delete(MediaItem).where(
+            MediaItem.server_id == self.server_id,
+            or_(MediaItem.sync_token.is_(None), MediaItem.sync_token != self.sync_token)
+        ))
+        return res.rowcount or 0
+
+    async def run(self, db: AsyncSession, mode: str = "auto") -> Dict[str, Any]:
+        start_time = time.time()
+        state = await self._get_state(db)
+        since = state.high_water_mark if state else None
+
+        if mode == "auto":
+            mode = "incremental" if since else "full"
+        elif mode == "incremental" and not since:
+            logger.info("┣ 🟡 尚无同步水位线，增量同步回退为全量同步")
+            mode = "full"
+
+        logger.info(f"🚀 [同步] 启动隔离同步引擎 (Server: {self.server_id}, Mode: {mode}, Strategy: {self.strategy}, Concurrency: adaptive {int(self.limiter.limit)}/{self.limiter.max_limit})...")
+        stats = await self._run_full(db) if mode == "full" else await self._run_incremental(db, since)
+
+        # 拉取不完整时既不清理也不推进水位线，避免误删，下一次同步会重新覆盖
+        deleted = 0
+        self._check_cancelled()
+        if self.fetch_failed:
+            logger.warning("┣ ⚠️ 部分分页拉取失败，本次跳过过期条目清理")
+        else:
+            deleted = await self._prune_stale(db)
+            if deleted:
+                logger.info(f"┣ 🗑️ 清理 Emby 侧已删除的条目: {deleted}")
+
+        # 此时清理尚未提交，取消会随会话关闭一并回滚
+        self._check_cancelled()
+        now = datetime.now()
+        state = await self._get_state(db)
+        if not state:
+            state = MediaSyncState(server_id=self.server_id)
+            db.add(state)
+        if not self.fetch_failed:
+            state.high_water_mark = self.high_water_mark or since
+        state.last_mode = mode
+        state.last_sync_at = now
+        if mode == "full": state.last_full_sync_at = now
+        count_res = await db.execute(select(func.count()).select_from(MediaItem).where(MediaItem.server_id == self.server_id))
+        state.item_count = count_res.scalar() or 0
+        await db.commit()
+        dupe_groups = await DuplicateGroupService.refresh(db, self.server_id)
+
+        process_time = (time.time() - start_time) * 1000
+        audit_log("媒体库隔离同步成功", process_time, [
+            f"服务器: {self.server_id}",
+            f"模式: {mode}",
+            f"写入条目数: {stats['upserted']}",
+            f"删除条目数: {deleted}",
+            f"重复组: {dupe_groups}",
+            f"Emby 请求数: {self.requests}",
+            f"写库吞吐: {stats['write']['rows_per_sec']} 行/秒"
+        ])
+        logger.info(f"✅ [同步] 完成，总耗时: {int(process_time/1000)}s")
+        return {"mode": mode, "strategy": self.strategy, **stats, "deleted": deleted, "requests": self.requests, "high_water_mark": state.high_water_mark}
+
+    @classmethod
+    async def benchmark(cls, service: EmbyService, server_id: str) -> List[Dict[str, Any]]:
+        """仅拉取不写库，对比两种全量策略的请求数与耗时"""
+        results = []
+        for strategy in SYNC_STRATEGIES:
+            engine = cls(service, server_id, strategy)
+            series_ids: List[str] = []
+            counted = {"items": 0}
+
+            async def count(page):
+                counted["items"] += len(page)
+                series_ids.extend(i["Id"] for i in page if i.get("Type") == "Series")
+
+            start_time = time.time()
+            await engine._page_producer(["Movie", "Series"])(count)
+            children = engine._flat_producer(["Season", "Episode"]) if strategy == "flat" else engine._children_producer(series_ids)
+            await children(count)
+            duration = time.time() - start_time
+            results.append({
+                "strategy": strategy,
+                "requests": engine.requests,
+                "items": counted["items"],
+                "seconds": round(duration, 2),
+                "items_per_sec": round(counted["items"] / duration, 1) if duration > 0 else 0.0,
+                "failed": engine.fetch_failed
+            })
+            logger.info(f"┣ 🏁 [同步基准] {strategy}: {engine.requests} 次请求, {counted['items']} 条, {duration:.2f}s")
+        return results
@@ -0,0 +1,109 @@
+import asyncio
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Awaitable
+from app.services.emby import EmbyService
+from app.utils.concurrency import get_emby_limiter
+from app.utils.logger import logger
+
+TREE_PAGE_SIZE = 500
+
+def _index_key(item: Dict[str, Any]):
+    idx = item.get("IndexNumber")
+    return (idx is None, idx or 0, item.get("Name") or "")
+
+class SeriesTreeLoader:
+    """
+    剧集层级加载器。
+    每个剧集只发起一次 ParentId + Recursive 查询 (按页)，同时取回全部季与单集，
+    在本地按 SeasonId 组装 Season -> Episode 结构；多个剧集按限制器上限并发加载。
+    同步引擎与 TMDB 检索共用这一实现。
+    """
+    def __init__(self, service: EmbyService, fields: str, page_size: int = TREE_PAGE_SIZE):
+        self.service = service
+        self.fields = fields
+        self.page_size = page_size
+        self.limiter = get_emby_limiter(service.server_id)
+        self.requests = 0
+        self.failed = False
+
+    async def iter_pages(self, series_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        start = 0
+        while True:
+            params = {
+                "ParentId": series_id, "Recursive": "true", "IncludeItemTypes": "Season,Episode",
+                "Fields": self.fields, "StartIndex": start, "Limit": self.page_size,
+                # 稳定排序，避免加载期间的增删使条目在页间漂移
+                "SortBy": "DateCreated,SortName", "SortOrder": "Ascending"
+            }
+            self.requests += 1
+            resp = await self.service._request("GET", "/Items", params=params)
+            if not resp or resp.status_code != 200:
+                self.failed = True
+                return
+            batch = resp.json().get("Items", [])
+            if not batch: return
+            yield batch
+            if len(batch) < self.page_size: return
+            start += self.page_size
+
+    async def fetch_children(self, series_id: str) -> List[Dict[str, Any]]:
+        children = []
+        async for page in self.iter_pages(series_id):
+            children.extend(page)
+        return children
+
+    @staticmethod
+    def build_tree(series_item: Dict[str, Any], children: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """按 SeasonId (缺失时按 ParentId / 季号) 把单集挂到季下，季与单集均按编号排序"""
+        series_details = series_item.copy()
+        seasons = sorted((c for c in children if c.get("Type") == "Season"), key=_index_key)
+        season_map = {s["Id"]: {**s, "Episodes": []} for s in seasons}
+        by_number = {s.get("IndexNumber"): season_map[s["Id"]] for s in seasons if s.get("IndexNumber") is not None}
+
+        for ep in children:
+            if ep.get("Type") != "Episode": continue
+            season = season_map.get(ep.get("SeasonId")) or season_map.get(ep.get("ParentId")) or by_number.get(ep.get("ParentIndexNumber"))
+            if season is not None:
+                season["Episodes"].append(ep)
+        for season in season_map.values():
+            season["Episodes"].sort(key=_index_key)
+
+        series_details["Seasons"] = [season_map[s["Id"]] for s in seasons]
+        return series_details
+
+    async def load_tree(self, series_item: Dict[str, Any]) -> Dict[str, Any]:
+        children = await self.fetch_children(series_item["Id"])
+        tree = self.build_tree(series_item, children)
+        logger.info(f"┃  ┣ 📂 剧集层级: {series_item.get('Name')} ({len(tree['Seasons'])} 季 / {sum(len(s['Episodes']) for s in tree['Seasons'])} 集)")
+        return tree
+
+    async def for_each_series(self, series_ids: List[str], on_page: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+                              on_done: Optional[Callable[[int, int], None]] = None):
+        """
+        并发遍历多个剧集的子层级分页。worker 数取限制器上限，
+        实际请求并发仍由限制器自适应调节；每个 worker 同时最多持有一页数据。
+        """
+        total = len(series_ids)
+        pending = iter(series_ids)
+        done = 0
+
+        async def worker():
+            nonlocal done
+            for series_id in pending:
+                async for page in self.iter_pages(series_id):
+                    await on_page(page)
+                done += 1
+                if on_done: on_done(done, total)
+
+        await asyncio.gather(*[worker() for _ in range(min(self.limiter.max_limit, total))])
+
+    async def load_trees(self, series_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """并发加载多个剧集的完整层级，返回顺序与输入一致"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(series_items)
+        pending = iter(enumerate(series_items))
+
+        async def worker():
+            for i, item in pending:
+                results[i] = await self.load_tree(item)
+
+        await asyncio.gather(*[worker() for _ in range(min(self.limiter.max_limit, len(series_items)))])
+        return results
@@ -0,0 +1,121 @@
+import time
+import asyncio
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import select
+from app.db.session import AsyncSessionLocal
+from app.models.media import MediaItem
+from app.core.scorer import Scorer
+from app.core.config_manager import get_config
+from app.services.duplicate_groups import DuplicateGroupService
+from app.utils.hashing import stable_hash
+from app.utils.logger import logger, audit_log
+
+ITEM_ATTRS = [a.key for a in MediaItem.__mapper__.column_attrs]
+
+def _item_dict(item: MediaItem) -> Dict[str, Any]:
+    return {k: getattr(item, k) for k in ITEM_ATTRS}
+
+class SmartSelectService:
+    """
+    智能分析 (重复项评分) 结果按服务器缓存，直到下一次同步、删除或规则变更。
+    同一服务器的并发请求合并为一次评分，后到者直接共享其结果。
+    """
+    # server_id -> (规则摘要, 结果)
+    _entries: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+    _inflight: Dict[str, Tuple[str, int, asyncio.Task]] = {}
+    # 每次失效递增，防止失效前启动的评分在失效后写回旧结果
+    _generation: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def rules_key(config: Dict[str, Any]) -> str:
+        return stable_hash([config.get("dedupe_rules"), config.get("exclude_paths", [])])
+
+    @classmethod
+    async def compute(cls, db, server_id: str, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """评分全部重复组，返回建议删除的条目 (白名单路径除外)"""
+        start_time = time.time()
+        scorer = Scorer(config.get("dedupe_rules"))
+        logger.info(f"🧪 [智能分析] 评分引擎启动 (Server: {server_id})...")
+
+        # 重复组由 SQL 侧预先分组并持久化，这里只投影评分所需的列，不构造 ORM 对象
+        dup_rows = await DuplicateGroupService.load_items(db, server_id, [
+            MediaItem.id, MediaItem.path, MediaItem.display_title, MediaItem.video_codec, MediaItem.video_range
+        ])
+        logger.info(f"┣ 📊 重复组内共有 {len(dup_rows)} 个节点参与评分")
+
+        groups = defaultdict(list)
+        for i in dup_rows:
+            groups[i.group_key].append(i)
+
+        decisions = scorer.decide_groups(
+            [i.id for i in dup_rows],
+            [i.group_key for i in dup_rows],
+            {crit: [getattr(i, crit, None) for i in dup_rows] for crit in scorer.priority_order}
+        )
+
+        to_delete_ids = []
+        exclude_keywords = [ex.lower() for ex in config.get("exclude_paths", []) if ex.strip()]
+        for key, decision in decisions.items():
+            g_items = groups[key]
+            suggested = set(decision["delete"])
+            logger.info(f"┃  ┣ 📦 重复组 [{key}] 有 {len(g_items)} 个副本")
+            for i in g_items:
+                status = "🗑️ 建议删除" if i.id in suggested else "✅ 建议保留"
+                # 改为包含匹配 (只要路径包含关键词即排除)，且忽略大小写
+                if i.id in suggested and any(ex in (i.path or "").lower() for ex in exclude_keywords):
+                    status = "🛡️ 白名单保护"
+                    suggested.discard(i.id)
+                logger.info(f"┃  ┃  ┗ {status}: [{i.display_title} | {i.video_codec}] {i.path}")
+            to_delete_ids.extend(d for d in decision["delete"] if d in suggested)
+
+        process_time = (time.time() - start_time) * 1000
+        logger.info(f"✅ [智能分析] 任务结束: 扫描全库发现 {len(decisions)} 组重复，建议删除 {len(to_delete_ids)} 个节点。")
+        audit_log("智能分析引擎执行完毕", process_time, [
+            f"分析总数: {len(dup_rows)}",
+            f"发现重复组: {len(decisions)}",
+            f"建议清理数: {len(to_delete_ids)}"
+        ])
+
+        if not to_delete_ids: return []
+        res = await db.execute(select(MediaItem).where(MediaItem.server_id == server_id, MediaItem.id.in_(to_delete_ids)))
+        return [_item_dict(i) for i in res.scalars().all()]
+
+    @classmethod
+    async def get(cls, server_id: str, refresh: bool = False) -> List[Dict[str, Any]]:
+        config = get_config()
+        rules_key = cls.rules_key(config)
+        entry = cls._entries.get(server_id)
+        if entry and not refresh and entry[0] == rules_key:
+            logger.info(f"🧪 [智能分析] 命中缓存 (Server: {server_id})，建议删除 {len(entry[1])} 个节点")
+            return entry[1]
+
+        generation = cls._generation[server_id]
+        inflight = cls._inflight.get(server_id)
+        if inflight is not None and inflight[:2] == (rules_key, generation):
+            logger.info(f"🧪 [智能分析] 已有评分进行中，等待共享结果 (Server: {server_id})")
+            return await asyncio.shield(inflight[2])
+
+        # 评分在独立任务中执行并使用自己的会话，发起者断开不影响共享者
+        task = asyncio.create_task(cls._run(server_id, config, rules_key, generation))
+        cls._inflight[server_id] = (rules_key, generation, task)
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _run(cls, server_id: str, config: Dict[str, Any], rules_key: str, generation: int) -> List[Dict[str, Any]]:
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await cls.compute(db, server_id, config)
+            if cls._generation[server_id] == generation:
+                cls._entries[server_id] = (rules_key, result)
+            return result
+        finally:
+            if cls._inflight.get(server_id, (None, None, None))[2] is asyncio.current_task():
+                cls._inflight.pop(server_id, None)
+
+    @classmethod
+    def invalidate(cls, server_id: Optional[str] = None):
+        """同步、删除或规则变更后调用；server_id 为空时全部失效"""
+        for sid in ([server_id] if server_id else list(cls._entries) + list(cls._inflight)):
+            cls._generation[sid] += 1
+            cls._entries.pop(sid, None)
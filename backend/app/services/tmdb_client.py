@@ -0,0 +1,184 @@
+import json
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy import select, delete, func
+from app.db.session import AsyncSessionLocal
+from app.models.tmdb import TmdbCache
+from app.core.config_manager import get_config, DEFAULT_CONFIG
+from app.services.media_store import build_upsert_stmt
+from app.utils.http_client import get_shared_client
+from app.utils.rate_limit import TokenBucket
+from app.utils.logger import logger
+
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+
+def cache_kind(path: str) -> str:
+    parts = [p for p in path.split("/") if p]
+    if not parts: return "other"
+    if parts[0] == "search": return "search"
+    if parts[0] == "tv" and "episode" in parts: return "episode"
+    if parts[0] == "tv" and "season" in parts: return "season"
+    if parts[0] in ("movie", "tv", "person"): return parts[0]
+    return "other"
+
+def cache_key(path: str, params: Dict[str, Any], language: Optional[str]) -> str:
+    # api_key 不参与缓存键：更换密钥不应使缓存失效
+    clean = {k: str(v) for k, v in (params or {}).items() if k not in ("api_key", "language") and v is not None}
+    raw = json.dumps([path, sorted(clean.items()), language or ""], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class TmdbClient:
+    """
+    共享 TMDB 客户端。
+    - SQLite 持久化缓存，按类型设置 TTL (详情长、搜索短)，404 做短期负缓存
+    - 同一键的并发请求合并为一次网络请求 (in-flight coalescing)
+    - 令牌桶限速，遵守 TMDB 的请求频率限制
+    - 命中 / 未命中 / 合并次数等指标
+    """
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bucket: Optional[TokenBucket] = None
+        self.metrics = {"hits": 0, "misses": 0, "coalesced": 0, "network": 0, "errors": 0, "stored": 0}
+
+    def _settings(self) -> Dict[str, Any]:
+        default = DEFAULT_CONFIG["tmdb_cache"]
+        cfg = {**default, **get_config().get("tmdb_cache", {})}
+        cfg["ttl_hours"] = {**default["ttl_hours"], **(cfg.get("ttl_hours") or {})}
+        return cfg
+
+    def _get_bucket(self, cfg: Dict[str, Any]) -> TokenBucket:
+        rate = float(cfg.get("rate_per_second") or 35)
+        burst = int(cfg.get("burst") or rate)
+        if self._bucket is None:
+            self._bucket = TokenBucket(rate, burst)
+        elif self._bucket.rate != rate or self._bucket.capacity != burst:
+            self._bucket.configure(rate, burst)
+        return self._bucket
+
+    async def _read_cache(self, key: str) -> Optional[TmdbCache]:
+        async with AsyncSessionLocal() as db:
+            res = await db.execute(select(TmdbCache).where(TmdbCache.cache_key == key, TmdbCache.expires_at > datetime.now()))
+            return res.scalars().first()
+
+    async def _write_cache(self, key: str, path: str, language: Optional[str], status_code: int, payload: Any, ttl_hours: float):
+        now = datetime.now()
+        row = {
+            "cache_key": key, "path": path, "language": language, "kind": cache_kind(path),
+            "status_code": status_code, "payload": payload,
+            "fetched_at": now, "expires_at": now + timedelta(hours=ttl_hours)
+        }
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(build_upsert_stmt(db.bind.dialect.name, TmdbCache.__table__), [row])
+                await db.commit()
+            self.metrics["stored"] += 1
+        except Exception as e:
+            # 缓存写入失败不影响本次结果
+            logger.error(f"┃  ┃  ❌ [TMDB 缓存] 写入失败: {e}")
+
+    async def _fetch_network(self, path: str, params: Dict[str, Any], cfg: Dict[str, Any]) -> Tuple[int, Any]:
+        await self._get_bucket(cfg).acquire()
+        self.metrics["network"] += 1
+        url = f"{TMDB_BASE_URL}{path}"
+        logger.info(f"┃  ┃  🌐 [TMDB] 发起请求: {url}")
+        client = get_shared_client("tmdb", use_proxy=True, timeout=20.0)
+        resp = await client.get(url, params=params)
+        if resp.status_code == 429:
+            # 超出频率限制：按 Retry-After 等待后重试一次
+            retry_after = float(resp.headers.get("Retry-After", "1") or 1)
+            logger.warning(f"┃  ┃  ⚠️ TMDB 限流，{retry_after}s 后重试")
+            await asyncio.sleep(retry_after)
+            await self._get_bucket(cfg).acquire()
+            resp = await client.get(url, params=params)
+        try:
+            data = resp.json()
+        except ValueError:
+            data = resp.text
+        return resp.status_code, data
+
+    async def request(self, path: str, params: Dict[str, Any] = None, language: Optional[str] = None,
+                      api_key: Optional[str] = None, use_cache: bool = True) -> Tuple[int, Any]:
+        """
+        请求 TMDB，返回 (状态码, 数据)。网络异常时状态码为 0。
+        language 为空表示不限定语言；api_key 为空时读取配置。
+        """
+        cfg = self._settings()
+        use_cache = use_cache and cfg.get("enabled", True)
+        key = cache_key(path, params or {}, language)
+
+        if use_cache:
+            cached = await self._read_cache(key)
+            if cached is not None:
+                self.metrics["hits"] += 1
+                return cached.status_code, cached.payload
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.metrics["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        self.metrics["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            query = {**(params or {}), "api_key": api_key or get_config().get("tmdb_api_key")}
+            if language: query["language"] = language
+            try:
+                status_code, data = await self._fetch_network(path, query, cfg)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logger.error(f"┃  ┃  ❌ TMDB 请求失败: {str(e)}")
+                status_code, data = 0, str(e)
+
+            if use_cache and status_code in (200, 404):
+                ttl = cfg["ttl_hours"].get("not_found" if status_code == 404 else cache_kind(path), cfg["ttl_hours"].get("other", 24))
+                if ttl and float(ttl) > 0:
+                    await self._write_cache(key, path, language, status_code, data, float(ttl))
+            elif status_code != 200:
+                self.metrics["errors"] += 1
+            future.set_result((status_code, data))
+            return status_code, data
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # 避免无人等待时出现 "exception was never retrieved"
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_json(self, path: str, params: Dict[str, Any] = None, language: Optional[str] = None,
+                       api_key: Optional[str] = None, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """成功时返回 JSON，其余情况返回 None"""
+        status_code, data = await self.request(path, params, language, api_key, use_cache)
+        if status_code == 200:
+            return data
+        if status_code:
+            logger.warning(f"┃  ┃  ⚠️ TMDB API 响应异常: {status_code}")
+        return None
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["misses"] + self.metrics["coalesced"]
+        async with AsyncSessionLocal() as db:
+            res = await db.execute(select(TmdbCache.kind, func.count()).group_by(TmdbCache.kind))
+            entries = {kind: count for kind, count in res.all()}
+        return {
+            **self.metrics,
+            "hit_rate": round((self.metrics["hits"] + self.metrics["coalesced"]) / lookups, 4) if lookups else 0.0,
+            "rate_limit_wait_seconds": round(self._bucket.waited, 2) if self._bucket else 0.0,
+            "entries": entries
+        }
+
+    async def purge(self, expired_only: bool = True) -> int:
+        async with AsyncSessionLocal() as db:
+            stmt = delete(TmdbCache)
+            if expired_only:
+                stmt = stmt.where(TmdbCache.expires_at <= datetime.now())
+            res = await db.execute(stmt)
+            await db.commit()
+            return res.rowcount or 0
+
+# 全局单例
+tmdb_client = TmdbClient()
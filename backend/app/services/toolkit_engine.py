@@ -0,0 +1,330 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator
+from app.services.emby import EmbyService
+from app.services.library_cache import LibraryCache
+from app.services.job_manager import JobManager, Job
+from app.utils.logger import logger
+
+# 纯变换函数：接收完整条目，返回需要修改的字段 {字段: 新值}，无需修改时返回 None
+Transform = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+DEFAULT_TOOLKIT_CONCURRENCY = {"fetch": 8, "write": 4}
+FULL_ITEM_FIELDS = "Genres,GenreItems,People,LockedFields,LockData,ChannelMappingInfo"
+# 列表即携带变换函数需要的全部字段，未变更的条目无需再逐个获取
+LIST_ITEM_FIELDS = "Genres,GenreItems,People,LockedFields,LockData"
+LIST_PAGE_SIZE = 500
+MAX_DIFF_ENTRIES = 50000
+MAX_TASK_HISTORY = 20
+
+async def get_library_id(service: EmbyService, lib_name: str) -> Optional[str]:
+    return await LibraryCache.get_library_id(service, lib_name)
+
+async def iter_lib_item_pages(service: EmbyService, parent_id: str, item_types: List[str],
+                              page_size: int = LIST_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """分页遍历媒体库条目，逐页产出 {"Items", "TotalRecordCount"}"""
+    start = 0
+    while True:
+        params = {
+            'ParentId': parent_id, 'Fields': LIST_ITEM_FIELDS, 'IncludeItemTypes': ",".join(item_types),
+            'Recursive': 'true', 'StartIndex': start, 'Limit': page_size
+        }
+        resp = await service._request("GET", "/Items", params=params)
+        if not resp or resp.status_code != 200:
+            return
+        data = resp.json()
+        items = data.get('Items', [])
+        if not items: return
+        yield {"Items": items, "TotalRecordCount": data.get("TotalRecordCount", len(items))}
+        # 以短页/空页作为结束条件：部分服务端不返回 TotalRecordCount
+        if len(items) < page_size: return
+        start += len(items)
+
+async def get_lib_items(service: EmbyService, parent_id: str, item_types: List[str]) -> List[Dict]:
+    items = []
+    async for page in iter_lib_item_pages(service, parent_id, item_types):
+        items.extend(page["Items"])
+    return items
+
+async def get_full_item(service: EmbyService, user_id: str, item_id: str) -> Optional[Dict]:
+    params = {"Fields": FULL_ITEM_FIELDS}
+    endpoint = f"/Users/{user_id}/Items/{item_id}" if user_id else f"/Items/{item_id}"
+    resp = await service._request("GET", endpoint, params=params)
+    return resp.json() if resp and resp.status_code == 200 else None
+
+class ToolkitTask:
+    """单个工具箱批处理任务的状态、进度与变更记录 (dry-run 时即为预览差异)"""
+    def __init__(self, tool: str, dry_run: bool, task_id: Optional[str] = None):
+        self.id = task_id or uuid.uuid4().hex[:12]
+        self.tool = tool
+        self.dry_run = dry_run
+        self.status = "pending" # pending / running / done / failed / cancelled
+        self.phase = "listing"
+        self.total = 0
+        self.scanned = 0
+        self.fetched = 0
+        self.changed = 0
+        self.written = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.diffs: List[Dict[str, Any]] = []
+        self.diffs_truncated = False
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cond = asyncio.Condition()
+        self._runner: Optional[asyncio.Task] = None
+        # 取消令牌 (由任务框架注入)：置位后停止扫描，已入队的写回照常完成
+        self.cancel_event: Optional[asyncio.Event] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancel_requested(self) -> bool:
+        return bool(self.cancel_event and self.cancel_event.is_set())
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def add_diff(self, entry: Dict[str, Any]):
+        if len(self.diffs) >= MAX_DIFF_ENTRIES:
+            self.diffs_truncated = True
+            return
+        self.diffs.append(entry)
+        await self._notify()
+
+    async def iter_diffs(self):
+        """按产生顺序迭代差异，任务未结束时持续等待新条目 (供流式输出)"""
+        index = 0
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: index < len(self.diffs) or self.finished)
+                batch = self.diffs[index:]
+            for entry in batch:
+                yield entry
+            index += len(batch)
+            if self.finished and index >= len(self.diffs):
+                return
+
+    async def wait(self):
+        if self._runner:
+            await asyncio.shield(self._runner)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        rate = self.scanned / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.scanned, 0)
+        return {
+            "task_id": self.id,
+            "tool": self.tool,
+            "dry_run": self.dry_run,
+            "status": self.status,
+            "phase": self.phase,
+            "total": self.total,
+            "scanned": self.scanned,
+            "fetched": self.fetched,
+            "changed": self.changed,
+            "written": self.written,
+            "failed": self.failed,
+            "error": self.error,
+            "diff_entries": len(self.diffs),
+            "diffs_truncated": self.diffs_truncated,
+            "percent": round(self.scanned / self.total * 100, 1) if self.total else (100.0 if self.finished else 0.0),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(remaining / rate, 1) if not self.finished and rate > 0 else None
+        }
+
+toolkit_tasks: "OrderedDict[str, ToolkitTask]" = OrderedDict()
+
+def get_toolkit_task(task_id: str) -> Optional[ToolkitTask]:
+    return toolkit_tasks.get(task_id)
+
+def _diff(item: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": item.get("Id"),
+        "name": item.get("Name"),
+        "type": item.get("Type"),
+        "changes": {k: {"before": item.get(k), "after": v} for k, v in patch.items()}
+    }
+
+class MetadataBatchEngine:
+    """
+    工具箱元数据批处理引擎：
+    分页列表 (已含变换所需字段) -> 纯变换函数筛出需要修改的条目
+    -> 仅对这些条目有界并发获取完整数据作为写回载荷 (并以完整数据复核变更) -> 并发写回。
+    dry-run 时直接基于列表数据产出差异，不发起任何逐条请求。
+    """
+    def __init__(self, service: EmbyService, user_id: Optional[str], task: ToolkitTask,
+                 concurrency: Optional[Dict[str, int]] = None):
+        self.service = service
+        self.user_id = user_id
+        self.task = task
+        cfg = {**DEFAULT_TOOLKIT_CONCURRENCY, **(concurrency or {})}
+        self.fetch_workers = max(1, int(cfg["fetch"]))
+        self.write_workers = max(1, int(cfg["write"]))
+
+    async def iter_items(self, lib_names: List[str], item_types: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        seen = set()
+        for lib_name in lib_names:
+            parent_id = await get_library_id(self.service, lib_name)
+            if not parent_id:
+                logger.warning(f"┃  ⚠️ 未找到媒体库: {lib_name}")
+                continue
+            first = True
+            async for page in iter_lib_item_pages(self.service, parent_id, item_types):
+                if first:
+                    self.task.total += page["TotalRecordCount"]
+                    first = False
+                for it in page["Items"]:
+                    if not it.get("Id") or it["Id"] in seen:
+                        self.task.total -= 1
+                        continue
+                    seen.add(it["Id"])
+                    yield it
+
+    def _apply(self, item: Dict[str, Any], transform: Transform) -> Optional[Dict[str, Any]]:
+        try:
+            return transform(item)
+        except Exception as e:
+            self.task.failed += 1
+            logger.error(f"┃  ❌ [{self.task.tool}] 处理出错 [{item.get('Name') or item.get('Id')}]: {e}")
+            return None
+
+    async def _prepare_write(self, item_id: str, transform: Transform, write_queue: asyncio.Queue):
+        """获取完整条目作为写回载荷，并以完整数据重新计算变更"""
+        task = self.task
+        try:
+            full_item = await get_full_item(self.service, self.user_id, item_id)
+            task.fetched += 1
+            if not full_item:
+                task.failed += 1
+                return
+            patch = self._apply(full_item, transform)
+            if not patch:
+                return
+            task.changed += 1
+            await task.add_diff(_diff(full_item, patch))
+            await write_queue.put({**full_item, **patch})
+        except Exception as e:
+            task.failed += 1
+            logger.error(f"┃  ❌ [{task.tool}] 获取详情失败 [{item_id}]: {e}")
+
+    async def _write(self, item: Dict[str, Any]):
+        task = self.task
+        try:
+            if await self.service.update_item(item["Id"], item):
+                task.written += 1
+                logger.info(f"┃  ┣ 🎯 [{task.tool}] 已更新: {item.get('Name')}")
+            else:
+                task.failed += 1
+        except Exception as e:
+            task.failed += 1
+            logger.error(f"┃  ❌ [{task.tool}] 写回失败 [{item.get('Name')}]: {e}")
+
+    async def run(self, lib_names: List[str], item_types: List[str], transform: Transform):
+        task = self.task
+        task.status = "running"
+        task.phase = "processing"
+        fetch_queue: asyncio.Queue = asyncio.Queue(maxsize=self.fetch_workers * 4)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.write_workers * 4)
+
+        async def fetcher():
+            while True:
+                item_id = await fetch_queue.get()
+                if item_id is None: return
+                await self._prepare_write(item_id, transform, write_queue)
+
+        async def writer():
+            while True:
+                item = await write_queue.get()
+                if item is None: return
+                await self._write(item)
+
+        fetchers = [] if task.dry_run else [asyncio.create_task(fetcher()) for _ in range(self.fetch_workers)]
+        writers = [] if task.dry_run else [asyncio.create_task(writer()) for _ in range(self.write_workers)]
+        try:
+            async for item in self.iter_items(lib_names, item_types):
+                if task.cancel_requested:
+                    logger.warning(f"┃  ⏹️ [{task.tool}] 收到取消请求，停止扫描")
+                    break
+                task.scanned += 1
+                patch = self._apply(item, transform)
+                if not patch:
+                    continue
+                if task.dry_run:
+                    task.changed += 1
+                    await task.add_diff(_diff(item, patch))
+                else:
+                    await fetch_queue.put(item["Id"])
+            task.phase = "writing"
+            for _ in fetchers:
+                await fetch_queue.put(None)
+            await asyncio.gather(*fetchers)
+            for _ in writers:
+                await write_queue.put(None)
+            await asyncio.gather(*writers)
+        except BaseException:
+            for w in fetchers + writers: w.cancel()
+            raise
+
+def start_toolkit_task(tool: str, service: EmbyService, user_id: Optional[str], lib_names: List[str],
+                       item_types: List[str], transform: Transform, dry_run: bool,
+                       concurrency: Optional[Dict[str, int]] = None,
+                       on_done: Optional[Callable[[ToolkitTask], Awaitable[Any]]] = None) -> ToolkitTask:
+    """登记并通过任务框架在后台启动批处理任务，立即返回任务对象 (任务 ID 与框架 job_id 一致)"""
+    # 先建立任务对象再提交，执行函数无论何时启动都能拿到它
+    task = ToolkitTask(tool, dry_run)
+
+    async def runner(task: ToolkitTask, job: Job):
+        task.cancel_event = job.cancel_event
+        job.bind_progress(lambda: {**task.snapshot(), "done": task.scanned})
+        logger.info(f"🚀 开始 [{tool}] 任务 ({'预览' if dry_run else '执行'}) 媒体库: {lib_names}")
+        try:
+            await MetadataBatchEngine(service, user_id, task, concurrency).run(lib_names, item_types, transform)
+            task.status = "cancelled" if task.cancel_requested else "done"
+        except asyncio.CancelledError:
+            task.status = "cancelled"
+            raise
+        except Exception as e:
+            task.status = "failed"
+            task.error = str(e)
+            logger.error(f"❌ [{tool}] 任务失败: {e}")
+        finally:
+            task.phase = "done"
+            task.finished_at = time.time()
+            await task._notify()
+        snap = task.snapshot()
+        logger.info(f"✅ [{tool}] 任务结束: 扫描 {snap['total']}，变更 {snap['changed']}，写回 {snap['written']}，失败 {snap['failed']} ({snap['elapsed_seconds']}s)")
+        if on_done:
+            try:
+                await on_done(task)
+            except Exception as e:
+                logger.error(f"❌ [{tool}] 完成回调失败: {e}")
+        if task.status == "failed":
+            raise RuntimeError(task.error)
+        return {k: snap[k] for k in ("total", "scanned", "fetched", "changed", "written", "failed")}
+
+    job, _ = JobManager.submit(
+        "toolkit", lambda job: runner(task, job), key=tool, title=f"工具箱: {tool}",
+        params={"tool": tool, "lib_names": lib_names, "item_types": item_types, "dry_run": dry_run},
+        job_id=task.id
+    )
+    task._runner = job._task
+
+    def _on_job_done(_):
+        # 开始前即被强制取消时 runner 不会执行，这里补齐终态以唤醒差异流
+        if not task.finished:
+            task.status = "cancelled"
+            task.finished_at = time.time()
+            asyncio.create_task(task._notify())
+    job._task.add_done_callback(_on_job_done)
+    toolkit_tasks[task.id] = task
+    while len(toolkit_tasks) > MAX_TASK_HISTORY:
+        oldest_id, oldest = next(iter(toolkit_tasks.items()))
+        if not oldest.finished: break
+        toolkit_tasks.pop(oldest_id)
+    return task
@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import select, delete, insert, func
+from app.db.session import AsyncSessionLocal
+from app.models.webhook import WebhookLog
+from app.core.config_manager import get_config
+from app.utils.logger import logger
+
+DEFAULT_LOG_CONFIG = {
+    "batch_size": 50,
+    "flush_interval_seconds": 2,
+    "max_rows": 10000,
+    "max_age_days": 30,
+    "prune_interval_minutes": 60
+}
+
+class WebhookLogBuffer:
+    """
+    Webhook 原始载荷日志的缓冲写入与保留策略。
+    请求处理中只把记录追加到内存缓冲，攒满 batch_size 或每 flush_interval_seconds 秒
+    一次性批量插入；后台定期按条数上限与保留天数清理旧记录。
+    """
+    _buffer: List[Dict[str, Any]] = []
+    _lock: Optional[asyncio.Lock] = None
+    _tasks: List[asyncio.Task] = []
+    written = 0
+    pruned = 0
+
+    @classmethod
+    def settings(cls) -> Dict[str, Any]:
+        return {**DEFAULT_LOG_CONFIG, **get_config().get("webhook_log", {})}
+
+    @classmethod
+    def _get_lock(cls) -> asyncio.Lock:
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        return cls._lock
+
+    @classmethod
+    async def add(cls, event_type: str, source_ip: str, payload: Dict[str, Any]):
+        cls._buffer.append({
+            "event_type": event_type,
+            "source_ip": source_ip,
+            "payload": payload,
+            "created_at": datetime.now()
+        })
+        if len(cls._buffer) >= int(cls.settings()["batch_size"]):
+            await cls.flush()
+
+    @classmethod
+    async def flush(cls) -> int:
+        async with cls._get_lock():
+            if not cls._buffer:
+                return 0
+            rows, cls._buffer = cls._buffer, []
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(WebhookLog.__table__), rows)
+                    await db.commit()
+            except Exception as e:
+                # 写入失败时放回缓冲，等待下次刷新；数据库持续不可用时按条数上限丢弃最旧的记录，避免内存无限增长
+                cls._buffer = rows + cls._buffer
+                logger.error(f"┣ ❌ Webhook 日志批量写入失败: {e}")
+                limit = int(cls.settings().get("max_rows") or 0) or DEFAULT_LOG_CONFIG["max_rows"]
+                overflow = len(cls._buffer) - limit
+                if overflow > 0:
+                    del cls._buffer[:overflow]
+                    logger.warning(f"┣ ⚠️ Webhook 日志缓冲超过上限 {limit} 条，已丢弃最旧的 {overflow} 条")
+                return 0
+            cls.written += len(rows)
+            return len(rows)
+
+    @classmethod
+    def discard_pending(cls) -> int:
+        count, cls._buffer = len(cls._buffer), []
+        return count
+
+    @classmethod
+    async def prune(cls) -> int:
+        """按保留天数与条数上限删除旧日志，返回删除行数"""
+        settings = cls.settings()
+        deleted = 0
+        async with AsyncSessionLocal() as db:
+            max_age_days = float(settings.get("max_age_days") or 0)
+            if max_age_days > 0:
+                result = await db.execute(
+                    delete(WebhookLog).where(WebhookLog.created_at < datetime.now() - timedelta(days=max_age_days))
+                )
+                deleted += result.rowcount or 0
+            max_rows = int(settings.get("max_rows") or 0)
+            if max_rows > 0:
+                # id 随写入顺序递增：找到第 max_rows 条之后最新的一条，删除它及更早的记录
+                cutoff = (await db.execute(
+                    select(WebhookLog.id).order_by(WebhookLog.id.desc()).offset(max_rows).limit(1)
+                )).scalar()
+                if cutoff is not None:
+                    result = await db.execute(delete(WebhookLog).where(WebhookLog.id <= cutoff))
+                    deleted += result.rowcount or 0
+            await db.commit()
+        cls.pruned += deleted
+        return deleted
+
+    @classmethod
+    async def count(cls) -> int:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(func.count()).select_from(WebhookLog))).scalar() or 0
+
+    @classmethod
+    async def _flush_loop(cls):
+        while True:
+            await asyncio.sleep(max(float(cls.settings()["flush_interval_seconds"]), 0.1))
+            await cls.flush()
+
+    @classmethod
+    async def _prune_loop(cls):
+        while True:
+            try:
+                deleted = await cls.prune()
+                if deleted:
+                    logger.info(f"🧹 [Webhook 日志] 保留策略清理 {deleted} 条旧记录")
+            except Exception as e:
+                logger.error(f"❌ [Webhook 日志] 保留策略清理失败: {e}")
+            await asyncio.sleep(max(float(cls.settings()["prune_interval_minutes"]), 1) * 60)
+
+    @classmethod
+    def start(cls):
+        if cls._tasks:
+            return
+        cls._tasks = [asyncio.create_task(cls._flush_loop()), asyncio.create_task(cls._prune_loop())]
+
+    @classmethod
+    async def stop(cls):
+        for task in cls._tasks:
+            task.cancel()
+        cls._tasks = []
+        await cls.flush()
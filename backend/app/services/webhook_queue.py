@@ -0,0 +1,254 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Tuple
+from sqlalchemy import select, update, delete, func
+from app.db.session import AsyncSessionLocal
+from app.models.webhook import WebhookJob
+from app.core.config_manager import get_config
+from app.utils.logger import logger
+
+POLL_SECONDS = 5.0
+MAX_BACKOFF_SECONDS = 3600
+
+def webhook_entity(payload: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Webhook 对应的处理实体：剧集/季归并到所属 Series，其余使用项目自身"""
+    item = payload.get("Item", {}) or {}
+    if item.get("Type") in ["Episode", "Season"] and item.get("SeriesId"):
+        return str(item["SeriesId"]), item.get("SeriesName") or item.get("Name")
+    return (str(item["Id"]) if item.get("Id") else None), item.get("Name")
+
+def webhook_emby_server_id(payload: Dict[str, Any]) -> Optional[str]:
+    return payload.get("ServerId") or (payload.get("Server", {}) or {}).get("Id")
+
+class WebhookJobQueue:
+    """
+    基于 SQLite 的持久化 Webhook 任务队列。
+    - 延迟调度：入队时写入 not_before，到期后才会被领取，worker 不再 sleep 占位
+    - 合并窗口：同一 Emby 服务器下同一实体 (SeriesId / 电影 Id) 只保留一个待处理任务，
+      窗口内的后续事件累加 event_count 并顺延 not_before (不超过首个事件后的最长等待)
+    - 失败重试：指数退避，超过 max_attempts 后标记为 failed 留存排查
+    - 启动时把上次进程遗留的 running 任务恢复为 pending
+    """
+    _handler: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None
+    _workers: List[asyncio.Task] = []
+    _wakeup: Optional[asyncio.Event] = None
+    _claim_lock: Optional[asyncio.Lock] = None
+    processed = 0
+    retried = 0
+    coalesced = 0
+
+    @classmethod
+    def _settings(cls) -> Dict[str, Any]:
+        wh_cfg = get_config().get("webhook", {})
+        return {
+            "delay_seconds": float(wh_cfg.get("delay_seconds", 10) or 0),
+            "workers": max(1, int(wh_cfg.get("workers", 3) or 1)),
+            "max_attempts": max(1, int(wh_cfg.get("max_attempts", 5) or 1)),
+            "retry_base_seconds": float(wh_cfg.get("retry_base_seconds", 30) or 1),
+            "coalesce_window_seconds": float(wh_cfg.get("coalesce_window_seconds", 30) or 0),
+            "coalesce_max_wait_seconds": float(wh_cfg.get("coalesce_max_wait_seconds", 300) or 0)
+        }
+
+    @classmethod
+    def _wake(cls):
+        # 每次唤醒都置位当前事件并换上新事件：事件一旦置位不再清除，
+        # 在认领失败与开始等待之间到达的唤醒也不会被其他 worker 抹掉
+        if cls._wakeup:
+            fired, cls._wakeup = cls._wakeup, asyncio.Event()
+            fired.set()
+
+    @classmethod
+    async def enqueue(cls, payload: Dict[str, Any], event_type: str = None) -> Dict[str, Any]:
+        """入队；同一实体已有待处理任务时合并到该任务，返回 {"job_id", "deduplicated", "event_count"}"""
+        entity_id, entity_name = webhook_entity(payload)
+        emby_server_id = webhook_emby_server_id(payload)
+        settings = cls._settings()
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            if entity_id:
+                existing = (await db.execute(
+                    select(WebhookJob.id, WebhookJob.not_before, WebhookJob.created_at, WebhookJob.event_count).where(
+                        WebhookJob.emby_server_id.is_not_distinct_from(emby_server_id),
+                        WebhookJob.entity_id == entity_id,
+                        WebhookJob.status == "pending",
+                        # 重试中的任务不参与合并，保持其退避时间
+                        WebhookJob.attempts == 0
+                    ).limit(1)
+                )).first()
+                if existing is not None:
+                    not_before = max(existing.not_before, now + timedelta(seconds=settings["coalesce_window_seconds"]))
+                    if settings["coalesce_max_wait_seconds"]:
+                        deadline = existing.created_at + timedelta(seconds=settings["coalesce_max_wait_seconds"])
+                        not_before = max(min(not_before, deadline), existing.not_before)
+                    event_count = (existing.event_count or 1) + 1
+                    await db.execute(
+                        update(WebhookJob).where(WebhookJob.id == existing.id)
+                        .values(event_count=event_count, not_before=not_before, updated_at=now)
+                    )
+                    await db.commit()
+                    return {"job_id": existing.id, "deduplicated": True, "event_count": event_count}
+
+            job = WebhookJob(
+                emby_server_id=emby_server_id,
+                entity_id=entity_id,
+                entity_name=entity_name,
+                event_type=event_type,
+                payload=payload,
+                status="pending",
+                attempts=0,
+                event_count=1,
+                not_before=now + timedelta(seconds=max(settings["delay_seconds"], settings["coalesce_window_seconds"])),
+                created_at=now,
+                updated_at=now
+            )
+            db.add(job)
+            await db.commit()
+            job_id = job.id
+        cls._wake()
+        return {"job_id": job_id, "deduplicated": False, "event_count": 1}
+
+    @classmethod
+    async def claim(cls) -> Optional[Dict[str, Any]]:
+        """领取一个已到期任务 (条件更新保证同一任务只会被一个 worker 领取)"""
+        async with cls._claim_lock:
+            now = datetime.now()
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(
+                    select(WebhookJob.id, WebhookJob.payload, WebhookJob.attempts, WebhookJob.entity_name, WebhookJob.event_count)
+                    .where(WebhookJob.status == "pending", WebhookJob.not_before <= now)
+                    .order_by(WebhookJob.not_before, WebhookJob.id)
+                    .limit(1)
+                )).first()
+                if not row:
+                    return None
+                result = await db.execute(
+                    update(WebhookJob)
+                    .where(WebhookJob.id == row.id, WebhookJob.status == "pending")
+                    .values(status="running", attempts=WebhookJob.attempts + 1, updated_at=now)
+                )
+                await db.commit()
+                if result.rowcount != 1:
+                    return None
+                return {"id": row.id, "payload": row.payload, "attempts": (row.attempts or 0) + 1, "entity_name": row.entity_name, "event_count": row.event_count or 1}
+
+    @classmethod
+    async def complete(cls, job_id: int):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(WebhookJob).where(WebhookJob.id == job_id))
+            await db.commit()
+        cls.processed += 1
+
+    @classmethod
+    async def fail(cls, job: Dict[str, Any], error: str):
+        settings = cls._settings()
+        now = datetime.now()
+        values = {"last_error": error[:1000], "updated_at": now}
+        if job["attempts"] >= settings["max_attempts"]:
+            values["status"] = "failed"
+            logger.error(f"┃  ❌ [Webhook 队列] 任务 #{job['id']} ({job.get('entity_name')}) 已重试 {job['attempts']} 次，放弃: {error}")
+        else:
+            backoff = min(settings["retry_base_seconds"] * 2 ** (job["attempts"] - 1), MAX_BACKOFF_SECONDS)
+            values.update(status="pending", not_before=now + timedelta(seconds=backoff))
+            cls.retried += 1
+            logger.warning(f"┃  ⚠️ [Webhook 队列] 任务 #{job['id']} ({job.get('entity_name')}) 失败，{backoff:.0f}s 后重试 ({job['attempts']}/{settings['max_attempts']}): {error}")
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(WebhookJob).where(WebhookJob.id == job["id"]).values(**values))
+            await db.commit()
+
+    @classmethod
+    async def recover(cls) -> int:
+        """进程重启后，遗留的 running 任务重新排队"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(WebhookJob).where(WebhookJob.status == "running").values(status="pending", updated_at=datetime.now())
+            )
+            await db.commit()
+            return result.rowcount or 0
+
+    @classmethod
+    async def _next_due_in(cls) -> Optional[float]:
+        async with AsyncSessionLocal() as db:
+            next_due = (await db.execute(
+                select(func.min(WebhookJob.not_before)).where(WebhookJob.status == "pending")
+            )).scalar()
+        if next_due is None:
+            return None
+        return max((next_due - datetime.now()).total_seconds(), 0.0)
+
+    @classmethod
+    async def _worker(cls, index: int):
+        while True:
+            try:
+                # 认领前取得当前事件，之后的任何唤醒都会置位它
+                wakeup = cls._wakeup
+                job = await cls.claim()
+                if not job:
+                    wait = await cls._next_due_in()
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=min(wait if wait is not None else POLL_SECONDS, POLL_SECONDS))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if job["event_count"] > 1:
+                    logger.info(f"┣ 🧩 [Webhook 队列] 开始处理 {job.get('entity_name')}，窗口内合并事件 {job['event_count']} 个")
+                try:
+                    await cls._handler(job["payload"])
+                    await cls.complete(job["id"])
+                    cls.coalesced += job["event_count"] - 1
+                except Exception as e:
+                    await cls.fail(job, str(e) or type(e).__name__)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 数据库暂时不可用等异常，稍后重试，避免 worker 退出
+                logger.error(f"❌ [Webhook 队列] worker-{index} 异常: {e}")
+                await asyncio.sleep(POLL_SECONDS)
+
+    @classmethod
+    async def start(cls, handler: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        """启动 worker 池 (应用启动时调用一次)"""
+        if cls._workers:
+            return
+        cls._handler = handler
+        cls._wakeup = asyncio.Event()
+        cls._claim_lock = asyncio.Lock()
+        recovered = await cls.recover()
+        workers = cls._settings()["workers"]
+        cls._workers = [asyncio.create_task(cls._worker(i)) for i in range(workers)]
+        logger.info(f"📡 [Webhook] 自动标签任务队列已启动 (worker: {workers}, 恢复未完成任务: {recovered})")
+
+    @classmethod
+    async def status(cls) -> Dict[str, Any]:
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            counts = dict((await db.execute(
+                select(WebhookJob.status, func.count()).group_by(WebhookJob.status)
+            )).all())
+            oldest_due = (await db.execute(
+                select(func.min(WebhookJob.not_before)).where(WebhookJob.status == "pending", WebhookJob.not_before <= now)
+            )).scalar()
+            due = (await db.execute(
+                select(func.count()).select_from(WebhookJob).where(WebhookJob.status == "pending", WebhookJob.not_before <= now)
+            )).scalar() or 0
+        pending = counts.get("pending", 0)
+        return {
+            "workers": len([w for w in cls._workers if not w.done()]),
+            "depth": pending + counts.get("running", 0),
+            "pending": pending,
+            "due": due,
+            "scheduled": pending - due,
+            "running": counts.get("running", 0),
+            "failed": counts.get("failed", 0),
+            # 积压时延：最早到期但尚未被领取的任务已等待的秒数
+            "lag_seconds": round((now - oldest_due).total_seconds(), 1) if oldest_due else 0.0,
+            "processed": cls.processed,
+            "retried": cls.retried,
+            "coalesced_events": cls.coalesced
+        }
+
+    @classmethod
+    async def clear_failed(cls) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(WebhookJob).where(WebhookJob.status == "failed"))
+            await db.commit()
+            return result.rowcount or 0
@@ -0,0 +1,186 @@
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any, Optional, List
+from app.core.config_manager import get_config
+from app.utils.logger import logger
+
+DEFAULT_LIMITER_CONFIG = {
+    "initial": 4,
+    "min": 1,
+    "max": 32,
+    # 延迟上限 (ms)，0 表示不以延迟作为拥塞信号 (仅 5xx / 超时触发回退)。
+    # 同一服务器上单条查询与 500 条整页请求的耗时相差悬殊，自动阈值会误判，因此需显式开启
+    "latency_target_ms": 0
+}
+
+def _to_int(value: Any, floor: int) -> int:
+    try:
+        return max(int(value), floor)
+    except (TypeError, ValueError):
+        return floor
+
+class _Slot:
+    def __init__(self, limiter: "AdaptiveLimiter"):
+        self.limiter = limiter
+        self.status_code: Optional[int] = None
+        self.start = 0.0
+
+    def observe(self, status_code: int):
+        """记录响应状态码，5xx 视为服务端过载信号"""
+        self.status_code = status_code
+
+    async def __aenter__(self):
+        await self.limiter.acquire()
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency_ms = (time.monotonic() - self.start) * 1000
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            # 任务取消 / 客户端断开与服务器健康无关，只归还名额
+            self.limiter.abandon()
+            return False
+        if exc_type is not None:
+            # 超时、连接失败等异常一律视为拥塞
+            timeout = issubclass(exc_type, asyncio.TimeoutError) or "Timeout" in exc_type.__name__
+            self.limiter.release(latency_ms, ok=False, timeout=timeout)
+        else:
+            self.limiter.release(latency_ms, ok=not (self.status_code and self.status_code >= 500))
+        return False
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制器。
+    - 加性增：请求成功且延迟健康时，每个完整窗口约 +1 并发
+    - 乘性减：遇到 5xx / 超时 / 延迟超标时并发减半，冷却期内只回退一次
+    局域网服务器会很快爬升到上限，远程慢服务器则稳定在较低的并发。
+    """
+    def __init__(self, name: str, cfg: Dict[str, Any], window: int = 500):
+        self.name = name
+        self.limit = 1.0
+        self.configure(cfg)
+        self.limit = float(min(max(_to_int(cfg.get("initial"), 1), self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.backoffs = 0
+        self._last_backoff = 0.0
+        self._waiters = deque()
+
+    def configure(self, cfg: Dict[str, Any]):
+        self.min_limit = _to_int(cfg.get("min"), 1)
+        self.max_limit = _to_int(cfg.get("max"), self.min_limit)
+        self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+        self.latency_target_ms = float(cfg.get("latency_target_ms") or 0)
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+    def slot(self) -> _Slot:
+        """用法: async with limiter.slot() as slot: resp = ...; slot.observe(resp.status_code)"""
+        return _Slot(self)
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                # 被唤醒后又被取消时，把名额让给下一个等待者
+                self._wake()
+                raise
+        self.in_flight += 1
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    def _healthy_latency(self, latency_ms: float) -> bool:
+        return not self.latency_target_ms or latency_ms <= self.latency_target_ms
+
+    def abandon(self):
+        """归还名额但不计入统计，也不调整并发"""
+        self.in_flight -= 1
+        self._wake()
+
+    def release(self, latency_ms: float, ok: bool = True, timeout: bool = False):
+        self.in_flight -= 1
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+            if timeout: self.timeouts += 1
+
+        if ok and self._healthy_latency(latency_ms):
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        else:
+            now = time.monotonic()
+            # 冷却期约为一个典型请求耗时：同一批在途请求的失败只触发一次减半
+            cooldown = (self.percentile(50) or latency_ms) / 1000
+            if now - self._last_backoff > cooldown:
+                old = int(self.limit)
+                self.limit = max(self.min_limit, self.limit * 0.5)
+                self._last_backoff = now
+                self.backoffs += 1
+                reason = "超时" if timeout else "错误" if not ok else f"延迟 {latency_ms:.0f}ms"
+                logger.info(f"┃  🐢 [并发控制] {self.name} 并发回退 {old} -> {int(self.limit)} ({reason})")
+        if ok:
+            self.latencies.append(latency_ms)
+        self._wake()
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        data = sorted(self.latencies)
+        idx = min(len(data) - 1, int(round(p / 100 * (len(data) - 1))))
+        return round(data[idx], 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "limit": int(self.limit),
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "backoffs": self.backoffs,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "latency_ms": {"p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99)}
+        }
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+
+def get_limiter_config(server_id: str = None) -> Dict[str, Any]:
+    """全局 emby_concurrency 配置，叠加服务器自身的 concurrency 覆盖项"""
+    config = get_config()
+    cfg = {**DEFAULT_LIMITER_CONFIG, **config.get("emby_concurrency", {})}
+    if server_id:
+        server = next((s for s in config.get("emby_servers", []) if s.get("id") == server_id), None)
+        if server and isinstance(server.get("concurrency"), dict):
+            cfg.update(server["concurrency"])
+    return cfg
+
+def get_emby_limiter(server_id: str) -> AdaptiveLimiter:
+    """获取 (或创建) 指定 Emby 服务器的自适应限制器，同一服务器的所有调用共享"""
+    cfg = get_limiter_config(server_id)
+    limiter = _limiters.get(server_id)
+    if limiter is None:
+        limiter = AdaptiveLimiter(f"emby:{server_id}", cfg)
+        _limiters[server_id] = limiter
+    else:
+        limiter.configure(cfg)
+    return limiter
+
+def get_limiter_stats() -> List[Dict[str, Any]]:
+    return [l.stats() for l in _limiters.values()]
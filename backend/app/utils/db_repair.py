@@ -5,11 +5,61 @@ from app.db.session import Base
 
 logger = logging.getLogger(__name__)
 
+# 全文索引是否可用 (非 SQLite 或 SQLite 不支持 trigram 分词器时为 False，搜索回退到 ILIKE)
+_fts_ready = {"media_items": False}
+
+MEDIA_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS media_items_fts USING fts5("
+    "name, path, content='media_items', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS media_items_fts_ai AFTER INSERT ON media_items BEGIN "
+    "INSERT INTO media_items_fts(rowid, name, path) VALUES (new.rowid, new.name, new.path); END",
+    "CREATE TRIGGER IF NOT EXISTS media_items_fts_ad AFTER DELETE ON media_items BEGIN "
+    "INSERT INTO media_items_fts(media_items_fts, rowid, name, path) VALUES ('delete', old.rowid, old.name, old.path); END",
+    # 同步时 upsert 会整行更新，名称与路径未变化的行不重建索引
+    "CREATE TRIGGER IF NOT EXISTS media_items_fts_au AFTER UPDATE OF name, path ON media_items "
+    "WHEN old.name IS NOT new.name OR old.path IS NOT new.path BEGIN "
+    "INSERT INTO media_items_fts(media_items_fts, rowid, name, path) VALUES ('delete', old.rowid, old.name, old.path); "
+    "INSERT INTO media_items_fts(rowid, name, path) VALUES (new.rowid, new.name, new.path); END",
+]
+
+def is_fts_ready(table_name: str = "media_items") -> bool:
+    return _fts_ready.get(table_name, False)
+
+async def ensure_media_fts(engine: AsyncEngine) -> bool:
+    """
+    为 media_items 建立 FTS5 (trigram) 外部内容全文索引，由触发器与主表保持同步。
+    索引表或触发器缺失时 (首次升级、media_items 被重建) 执行一次全量 rebuild。
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    async with engine.connect() as conn:
+        try:
+            res = await conn.execute(text(
+                "SELECT count(*) FROM sqlite_master WHERE name IN "
+                "('media_items_fts', 'media_items_fts_ai', 'media_items_fts_ad', 'media_items_fts_au')"
+            ))
+            complete = res.scalar() == 4
+            for ddl in MEDIA_FTS_DDL:
+                await conn.execute(text(ddl))
+            if not complete:
+                logger.warning("🔧 [DB Repair] 正在重建 media_items 全文索引 (trigram)...")
+                await conn.execute(text("INSERT INTO media_items_fts(media_items_fts) VALUES ('rebuild')"))
+                logger.info("✅ [DB Repair] media_items 全文索引已就绪")
+            await conn.commit()
+            _fts_ready["media_items"] = True
+        except Exception as e:
+            # 旧版 SQLite (< 3.34) 不支持 trigram 分词器
+            await conn.rollback()
+            logger.error(f"❌ [DB Repair] 全文索引不可用，搜索将回退为模糊匹配: {e}")
+            _fts_ready["media_items"] = False
+    return _fts_ready["media_items"]
+
 async def repair_database_schema(engine: AsyncEngine):
     """
     自动检测并修复数据库 Schema。
     1. 检测主键冲突：针对 media_items，如果 server_id 不是主键（旧架构），强制重建表。
     2. 补全缺失列：执行 ALTER TABLE ADD COLUMN。
+    3. 补全缺失索引：模型中新增的 (复合) 索引在已有表上不会被 create_all 创建。
     """
     async with engine.connect() as conn:
         def get_inspector(connection):
@@ -37,16 +87,16 @@ async def repair_database_schema(engine: AsyncEngine):
         
         # 遍历 Base 中注册的所有表模型
         for table_name, table in Base.metadata.tables.items():
-            # 1. 检查表是否存在
+            # 检查表是否存在
             if not await conn.run_sync(lambda c: inspector.has_table(table_name)):
                 continue # 表不存在由 create_all 处理，这里只处理“增量列修复”
             
-            # 2. 获取数据库中真实的列名
+            # 获取数据库中真实的列名
             existing_columns = [
                 col["name"] for col in await conn.run_sync(lambda c: inspector.get_columns(table_name))
             ]
             
-            # 3. 对比模型定义的列
+            # 2. 补全缺失列：对比模型定义的列
             for column in table.columns:
                 if column.name not in existing_columns:
                     logger.warning(f"🔧 [DB Repair] 发现表 {table_name} 缺失列: {column.name}，正在尝试修复...")
@@ -76,6 +126,21 @@ async def repair_database_schema(engine: AsyncEngine):
                     except Exception as e:
                         logger.error(f"❌ [DB Repair] 修复表 {table_name} 失败: {e}")
 
+            # 3. 补全缺失索引：对比模型定义的索引
+            existing_indexes = {
+                idx["name"] for idx in await conn.run_sync(lambda c: inspector.get_indexes(table_name))
+            }
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                logger.warning(f"🔧 [DB Repair] 发现表 {table_name} 缺失索引: {index.name}，正在创建...")
+                try:
+                    await conn.run_sync(lambda c: index.create(c, checkfirst=True))
+                    await conn.commit()
+                    logger.info(f"✅ [DB Repair] 表 {table_name} 成功创建索引: {index.name}")
+                except Exception as e:
+                    logger.error(f"❌ [DB Repair] 创建索引 {index.name} 失败: {e}")
+
 async def init_db_with_repair(engine: AsyncEngine):
     """
     带自愈功能的数据库初始化入口
@@ -86,3 +151,6 @@ async def init_db_with_repair(engine: AsyncEngine):
     # 2. 创建所有不存在的表 (包含被 repair 删掉后需要重建的表)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+    # 3. 全文索引 (依赖 media_items 已存在)
+    await ensure_media_fts(engine)
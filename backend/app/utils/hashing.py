@@ -0,0 +1,8 @@
+import json
+import hashlib
+from typing import Any
+
+def stable_hash(data: Any) -> str:
+    """对 JSON 可序列化数据计算与键顺序无关的摘要"""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
@@ -1,5 +1,8 @@
 import httpx
-from typing import Optional, Dict, Any
+import time
+import asyncio
+import importlib.util
+from typing import Optional, Dict, Any, List, Tuple, Set
 from app.core.config_manager import get_config
 from app.utils.logger import logger
 
@@ -27,3 +30,119 @@ def get_async_client(timeout: float = 30.0, headers: Optional[Dict[str, str]] =
         trust_env=False,
         follow_redirects=True
     )
+
+# --- 长连接客户端注册表 ---
+# 按 (业务键, 代理地址, 超时) 复用 AsyncClient，避免每次请求都重新建立 TCP/TLS 连接。
+# 共享客户端由注册表统一管理生命周期，调用方不要使用 async with 关闭它。
+
+_shared_clients: Dict[Tuple[str, Optional[str], float], Dict[str, Any]] = {}
+# 待关闭旧客户端的后台任务，持有引用防止被垃圾回收
+_retire_tasks: Set[asyncio.Task] = set()
+# 连接池参数变更后被替换的旧客户端，给在途请求留出的收尾时间 (秒)
+RETIRE_GRACE_SECONDS = 60
+
+def _h2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+def get_pool_config() -> Dict[str, Any]:
+    cfg = get_config().get("http_pool", {})
+    http2 = bool(cfg.get("http2", False))
+    if http2 and not _h2_available():
+        http2 = False
+    return {
+        "max_connections": int(cfg.get("max_connections", 20)),
+        "max_keepalive_connections": int(cfg.get("max_keepalive_connections", 10)),
+        "keepalive_expiry": float(cfg.get("keepalive_expiry", 30)),
+        "http2": http2
+    }
+
+async def _retire_client(client: httpx.AsyncClient):
+    await asyncio.sleep(RETIRE_GRACE_SECONDS)
+    try:
+        await client.aclose()
+    except Exception:
+        pass
+
+def _schedule_retire(client: httpx.AsyncClient):
+    task = asyncio.create_task(_retire_client(client))
+    _retire_tasks.add(task)
+    task.add_done_callback(_retire_tasks.discard)
+
+def get_shared_client(key: str, use_proxy: bool = True, timeout: float = 30.0) -> httpx.AsyncClient:
+    """
+    获取长连接复用的共享 AsyncClient。
+    key 通常为服务器 ID，同一服务器的所有请求共享一个连接池；
+    代理地址与超时是注册表键的一部分，切换代理时会自动建立新的连接池。
+    """
+    proxy_url = get_http_proxies() if use_proxy else None
+    pool_cfg = get_pool_config()
+    timeout = float(timeout)
+    reg_key = (key, proxy_url, timeout)
+    entry = _shared_clients.get(reg_key)
+
+    if entry and entry["pool_config"] != pool_cfg:
+        logger.info(f"🔁 [连接池] 参数已变更，重建客户端: {key}")
+        _schedule_retire(entry["client"])
+        entry = None
+
+    if entry is None or entry["client"].is_closed:
+        # 同一业务键切换代理后，旧代理的连接池不再使用
+        for old_key in [k for k in _shared_clients if k[0] == key and k[2] == timeout and k != reg_key]:
+            _schedule_retire(_shared_clients.pop(old_key)["client"])
+
+        if proxy_url:
+            logger.info(f"🌐 [网络代理] 共享连接池 {key} 将通过代理转发: {proxy_url}")
+        client = httpx.AsyncClient(
+            timeout=timeout,
+            proxies=proxy_url,
+            trust_env=False,
+            follow_redirects=True,
+            http2=pool_cfg["http2"],
+            limits=httpx.Limits(
+                max_connections=pool_cfg["max_connections"],
+                max_keepalive_connections=pool_cfg["max_keepalive_connections"],
+                keepalive_expiry=pool_cfg["keepalive_expiry"]
+            )
+        )
+        entry = {"client": client, "pool_config": pool_cfg, "created_at": time.time(), "requests": 0}
+        _shared_clients[reg_key] = entry
+
+    entry["requests"] += 1
+    return entry["client"]
+
+async def close_shared_clients():
+    """关闭所有共享客户端 (应用退出时调用)"""
+    count = len(_shared_clients)
+    for entry in list(_shared_clients.values()):
+        try:
+            await entry["client"].aclose()
+        except Exception:
+            pass
+    _shared_clients.clear()
+    if count:
+        logger.info(f"🔌 [连接池] 已关闭 {count} 个共享 HTTP 客户端")
+
+def get_pool_stats() -> List[Dict[str, Any]]:
+    """导出各共享连接池的使用情况，用于调整连接数上限"""
+    stats = []
+    for (key, proxy_url, timeout), entry in _shared_clients.items():
+        client = entry["client"]
+        item = {
+            "key": key,
+            "proxy": proxy_url,
+            "timeout": timeout,
+            "created_at": entry["created_at"],
+            "requests": entry["requests"],
+            "closed": client.is_closed,
+            **entry["pool_config"]
+        }
+        try:
+            # httpcore 连接池内部状态，不同版本字段可能不同，取不到时忽略
+            connections = client._transport._pool.connections
+            item["connections"] = len(connections)
+            item["idle_connections"] = sum(1 for c in connections if c.is_idle())
+            item["active_connections"] = item["connections"] - item["idle_connections"]
+        except Exception:
+            pass
+        stats.append(item)
+    return stats
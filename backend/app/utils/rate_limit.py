@@ -1,4 +1,5 @@
 import time
+import asyncio
 from typing import Dict, Tuple
 
 class LoginRateLimiter:
@@ -34,5 +35,36 @@ class LoginRateLimiter:
         if ip in self.attempts:
             del self.attempts[ip]
 
+class TokenBucket:
+    """异步令牌桶：rate 为每秒补充的令牌数，capacity 为允许的突发量"""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def configure(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, float(capacity))
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.capacity), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # 排队拿令牌：锁保证先到先得，不足时按缺口计算等待时间
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.tokens -= 1
+
 # 全局单例
 login_limiter = LoginRateLimiter()